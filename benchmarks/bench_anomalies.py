@@ -0,0 +1,62 @@
+'''
+Times the anomaly scan over synthetic usage histories of growing size, see
+anomalies.scan_usage.
+
+    python -m benchmarks.bench_anomalies --bills 1000000 5000000
+'''
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from facilities_dataloader.anomalies import scan_usage
+from benchmarks.generators import FIRST_MONTH
+
+
+def usage_history(bills, seed=0, months=36):
+    '''
+    Builds cleaned electricity usage for accounts billed every month for
+    months months, with a few spikes, rebills and shifted service periods.
+
+    Returns
+    -------
+    data: (DataFrame) columns of elec_usage the scan reads, in random order
+    '''
+    rng = np.random.default_rng(seed)
+    accounts = max(bills // months, 1)
+    account = np.arange(bills) % accounts
+    start = FIRST_MONTH + pd.to_timedelta(np.arange(bills) // accounts * 30, unit='D')
+    start = start + pd.to_timedelta(np.where(rng.random(bills) < 0.01, rng.integers(-10, 10, bills), 0), unit='D')
+    kwh = rng.gamma(20.0, 250.0, accounts)[account] * rng.normal(1.0, 0.05, bills)
+    kwh[rng.random(bills) < 0.001] *= 20
+    data = pd.DataFrame({'account_number': pd.Series(account).map('{:010d}'.format),
+                         'bill_month': start.to_period('M').to_timestamp(),
+                         'service_period_start': start,
+                         'service_period_stop': start + pd.Timedelta(days=30),
+                         'billed_khw': kwh.round(1),
+                         'peak_kw': (kwh / 300).round(2),
+                         'rebill': np.where(rng.random(bills) < 0.01, 'Y', 'N')})
+    return data.iloc[rng.permutation(bills)].reset_index(drop=True)
+
+
+def main(sizes, seed=0):
+    results = []
+    for bills in sizes:
+        data = usage_history(bills, seed)
+        start = time.perf_counter()
+        anomalies = scan_usage(data, 'elec_usage')
+        results.append({'bills': bills, 'seconds': time.perf_counter() - start, 'flagged': len(anomalies)})
+
+    print('{:>10} {:>10} {:>10} {:>12}'.format('bills', 'seconds', 'flagged', 'bills/sec'))
+    for result in results:
+        print('{:>10} {:>10.3f} {:>10} {:>12.0f}'.format(result['bills'], result['seconds'], result['flagged'],
+                                                         result['bills'] / result['seconds']))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the anomaly scan.')
+    parser.add_argument('--bills', type=int, nargs='+', default=[1000000],
+                        help='Numbers of bills to generate, one run per number.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    main(args.bills, args.seed)
@@ -0,0 +1,83 @@
+'''
+Compares the row-wise id fixers against the vectorized ones in helper on
+synthetic id columns.
+
+    python -m benchmarks.bench_ids --rows 1000000
+'''
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from facilities_dataloader.helper import restore_leading_zeros, restore_leading_zeros_column, fix_invoice_ids, fix_new_account_nmbrs
+from facilities_dataloader.electricity import fix_invoice_id
+from facilities_dataloader.natural_gas import fix_new_account_nmbr
+
+
+def synthetic_ids(rows, seed=0):
+    '''
+    Builds id columns with dropped leading zeros and some missing values.
+
+    Parameters
+    ----------
+    rows: (int) number of ids in each column
+    seed: (int) random seed
+
+    Returns
+    -------
+    ids: (dict) {account_number, invoice_id, new_account_number} Series of ids
+    '''
+    rng = np.random.default_rng(seed)
+    # Excel stores ids as numbers, so leading zeros are routinely lost.
+    def stripped(high, size, max_lost):
+        return rng.integers(1, high, size) // 10**rng.integers(0, max_lost + 1, size)
+
+    # Each account gets a bill every month, so account numbers repeat.
+    accounts = rng.integers(0, max(rows // 24, 1), rows)
+    # Invoice ids are unique, the primary key of elec_usage.
+    heads = pd.Series(rng.permutation(10**7)[:rows] + 1).astype(str)
+    tails = pd.Series(stripped(10**4, rows, 2)).astype(str)
+    suffixes = pd.Series(rng.choice(['', '', '', 'R', 'C', 'Z'], rows))
+    new_heads = pd.Series(stripped(10**10, rows, 4)).astype(str)[accounts].reset_index(drop=True)
+    new_tails = pd.Series(stripped(10**5, rows, 2)).astype(str)[accounts].reset_index(drop=True)
+    missing = rng.random(rows) < 0.02
+
+    account_number = pd.Series(stripped(10**10, rows, 4)[accounts], dtype=object)
+    invoice_id = (heads + '-' + tails + suffixes).astype(object)
+    new_account_number = (new_heads + '-' + new_tails).astype(object)
+    for ids in [account_number, invoice_id, new_account_number]:
+        ids[missing] = np.nan
+
+    return {'account_number': account_number,
+            'invoice_id': invoice_id,
+            'new_account_number': new_account_number}
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main(rows):
+    ids = synthetic_ids(rows)
+    cases = [('account_number', lambda s: s.apply(lambda x: restore_leading_zeros(x, 10)),
+                                lambda s: restore_leading_zeros_column(s, 10)),
+             ('invoice_id', lambda s: s.apply(fix_invoice_id),
+                            lambda s: fix_invoice_ids(s)[0]),
+             ('new_account_number', lambda s: s.apply(fix_new_account_nmbr),
+                                    lambda s: fix_new_account_nmbrs(s)[0])]
+
+    print('{:<20}{:>12}{:>14}{:>10}'.format('column', 'row-wise s', 'vectorized s', 'speedup'))
+    for name, row_wise, vectorized in cases:
+        expected, row_wise_time = timed(row_wise, ids[name])
+        result, vectorized_time = timed(vectorized, ids[name])
+        pd.testing.assert_series_equal(result, expected)
+        print('{:<20}{:>12.2f}{:>14.2f}{:>9.1f}x'.format(name, row_wise_time, vectorized_time,
+                                                         row_wise_time / vectorized_time))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark vectorized id normalization.')
+    parser.add_argument('--rows', type=int, default=1000000)
+    args = parser.parse_args()
+    main(args.rows)
@@ -0,0 +1,34 @@
+'''
+Reports the memory each table's cleaned rows take with the dtypes cleaning
+leaves them in and with the compact dtypes declared in ddl/, on synthetic
+exports.
+
+    python -m benchmarks.bench_memory --rows 1000000
+'''
+import argparse
+import tempfile
+import warnings
+import pandas as pd
+from facilities_dataloader.helper import read_data, memory_report
+from facilities_dataloader.parallel import DATASETS
+from benchmarks.generators import write_exports
+from benchmarks.bench_pipeline import STEPS
+
+
+def main(rows, seed=0):
+    frames = {}
+    with tempfile.TemporaryDirectory() as directory:
+        files = write_exports(directory, rows, seed)
+        for dataset, (read_as, clean) in STEPS.items():
+            frames[DATASETS[dataset][1]] = clean(read_data(files[dataset], read_as, use_cache=False))
+    return memory_report(frames)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Report the memory of cleaned tables before and after compact dtypes.')
+    parser.add_argument('--rows', type=int, default=1000000, help='Number of usage rows to generate.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    # The cleaning steps assign to slices of the exports.
+    warnings.simplefilter('ignore', pd.errors.SettingWithCopyWarning)
+    main(args.rows, args.seed)
@@ -0,0 +1,107 @@
+'''
+Compares the time and memory of the columnar clean_natural_gas against the
+row-wise implementation it replaced, on a synthetic natural gas export.
+
+    python -m benchmarks.bench_natural_gas --rows 1000000
+'''
+import math
+import time
+import argparse
+import tempfile
+import tracemalloc
+import warnings
+import pandas as pd
+from os.path import join
+from facilities_dataloader.helper import read_data, restore_leading_zeros_column, fix_new_account_nmbrs
+from facilities_dataloader.natural_gas import clean_natural_gas
+from benchmarks.generators import natural_gas_export
+
+
+def current_account_number(data):
+    account_number = data['new_account_number'] if data['new_account_number'] is not math.nan else data['account_number']
+    return account_number
+
+
+def clean_natural_gas_row_wise(data):
+    '''
+    clean_natural_gas as it was before it became columnar: the current account
+    number and the bill month are computed one row at a time.
+    '''
+    col_names = {"ADDRESS": "address",
+                 "Address 2": "address2",
+                 "City": "city",
+                 "Account Number": "account_number",
+                 "New Account Number": "new_account_number",
+                 "Start Date": "service_period_start",
+                 "End Date": "service_period_stop",
+                 "Therms": "therms",
+                 "Utility Amount": "utility_amount",
+                 "Supplier Amount": "supplier_amount"}
+    data = data[list(col_names.keys())]
+    data = data.rename(columns = col_names)
+    data = data.replace(["-", "N/A", "#N/A"], math.nan)
+    data['service_period_start'] = pd.to_datetime(data['service_period_start'])
+    data['service_period_stop'] = pd.to_datetime(data['service_period_stop'])
+    data['bill_month'] = data['service_period_stop'].apply(lambda x: x.replace(day=1))
+    for column in ['therms', 'utility_amount', 'supplier_amount']:
+        data[column] = pd.to_numeric(data[column])
+    data['total_amount'] = data['utility_amount'] + data['supplier_amount']
+    data['account_number'] = restore_leading_zeros_column(data['account_number'], 13)
+    data['new_account_number'], invalid_ids = fix_new_account_nmbrs(data['new_account_number'])
+    data['current_account_number'] = data.apply(current_account_number, axis=1)
+    data = data.drop_duplicates()
+    return data[['account_number', 'new_account_number', 'current_account_number', 'bill_month',
+                 'service_period_start', 'service_period_stop', 'therms', 'utility_amount',
+                 'supplier_amount', 'total_amount', 'address', 'address2', 'city']]
+
+
+def measured(clean, data):
+    '''
+    Runs clean on copies of data, once timed and once with memory tracing,
+    which slows it down.
+
+    Returns
+    -------
+    result: (DataFrame) cleaned data
+    seconds: (float) wall time
+    peak_mb: (float) peak memory allocated while cleaning, in MB
+    '''
+    copy = data.copy()
+    start = time.perf_counter()
+    result = clean(copy)
+    seconds = time.perf_counter() - start
+
+    copy = data.copy()
+    tracemalloc.start()
+    clean(copy)
+    peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return result, seconds, peak_mb
+
+
+def main(rows, seed=0):
+    with tempfile.TemporaryDirectory() as directory:
+        filepath = join(directory, 'ngas.csv')
+        natural_gas_export(rows, seed).to_csv(filepath, index=False)
+        data = read_data(filepath, 'other', use_cache=False)
+
+    expected, row_wise_time, row_wise_peak = measured(clean_natural_gas_row_wise, data)
+    result, columnar_time, columnar_peak = measured(clean_natural_gas, data)
+    pd.testing.assert_frame_equal(result.astype({'address': object, 'city': object}), expected)
+
+    print('{:<12}{:>10}{:>14}{:>14}'.format('', 'seconds', 'peak MB', 'result MB'))
+    for name, seconds, peak, output in [('row-wise', row_wise_time, row_wise_peak, expected),
+                                        ('columnar', columnar_time, columnar_peak, result)]:
+        print('{:<12}{:>10.2f}{:>14.1f}{:>14.1f}'.format(name, seconds, peak,
+                                                          output.memory_usage(deep=True).sum() / 2**20))
+    print('{:.1f}x faster, {:.1f}x less peak memory.'.format(row_wise_time / columnar_time,
+                                                              row_wise_peak / columnar_peak))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark columnar natural gas cleaning.')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    warnings.simplefilter('ignore', pd.errors.SettingWithCopyWarning)
+    main(args.rows, args.seed)
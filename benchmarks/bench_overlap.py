@@ -0,0 +1,125 @@
+'''
+Compares end-to-end load throughput of the sequential path, which cleans a
+file or chunk and then writes it, against the pipelined path, which cleans
+the next one while the previous is written (see streaming.run_pipeline).
+
+    python -m benchmarks.bench_overlap --rows 100000 --parts 8
+    python -m benchmarks.bench_overlap --rows 100000 --mysql bench_creds.yml
+
+The MySQL database named in the credentials file has its tables dropped and
+recreated before every run, so point it at a database used for benchmarks only.
+'''
+import time
+import argparse
+import tempfile
+import warnings
+import sqlalchemy
+import pandas as pd
+from os.path import join
+from facilities_dataloader.helper import create_mysql_engine, LOAD_METHODS
+from facilities_dataloader.parallel import load_dataset, pipeline_load, preprocessed_files, after_load
+from facilities_dataloader.streaming import PIPELINE_DEPTH, stream_data_to_db
+from facilities_dataloader.electricity import clean_electricity
+from benchmarks.generators import write_exports
+from benchmarks.bench_pipeline import reset_tables
+
+
+def split_exports(files, parts):
+    '''
+    Splits the usage exports into parts files each, like monthly exports.
+
+    Returns
+    -------
+    files: (dict) dataset -> list of file paths, see parallel.discover_files
+    '''
+    split = {}
+    for dataset, filepath in files.items():
+        if dataset not in ['elec', 'ngas']:
+            split[dataset] = [filepath]
+            continue
+        data = pd.read_csv(filepath, dtype=str)
+        size = -(-len(data) // parts)
+        split[dataset] = []
+        for part in range(parts):
+            partpath = filepath.replace('.csv', '-{:02d}.csv'.format(part))
+            data.iloc[part * size:(part + 1) * size].to_csv(partpath, index=False)
+            split[dataset].append(partpath)
+    return split
+
+
+def sequential_load(files, engine, method):
+    '''
+    Cleans and writes the files one after another, nothing overlaps, then
+    refreshes what is derived from them as pipeline_load does.
+    '''
+    report = [result for dataset, filepath, future in preprocessed_files(files)
+              for result in load_dataset(dataset, [filepath], {filepath: future}, engine, method, None)]
+    after_load(report, engine)
+    return report
+
+
+def rows_loaded(report):
+    return sum(result['rows'] for result in report)
+
+
+def time_modes(files, engine, method, depth, stream_rows):
+    '''
+    Loads the same files into freshly created tables once per mode.
+
+    Returns
+    -------
+    results: (list of dicts) mode, seconds and rows loaded
+    '''
+    modes = {'files sequential': lambda: rows_loaded(sequential_load(files, engine, method)),
+             'files pipelined': lambda: rows_loaded(pipeline_load(files, engine, method, depth=depth)),
+             'stream sequential': lambda: sum(stream_data_to_db(filepath, 'elec', clean_electricity, 'elec_usage',
+                                                                engine, stream_rows, method)['loaded']
+                                              for filepath in files['elec']),
+             'stream pipelined': lambda: sum(stream_data_to_db(filepath, 'elec', clean_electricity, 'elec_usage',
+                                                               engine, stream_rows, method, depth=depth)['loaded']
+                                             for filepath in files['elec'])}
+    results = []
+    for mode, load in modes.items():
+        reset_tables(engine)
+        start = time.perf_counter()
+        rows = load()
+        results.append({'mode': mode, 'seconds': time.perf_counter() - start, 'rows': rows})
+    return results
+
+
+def main(sizes, parts=4, mysql=None, method='default', depth=PIPELINE_DEPTH, stream_rows=None, seed=0):
+    results = []
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            files = split_exports(write_exports(directory, rows, seed), parts)
+            engines = {'sqlite': sqlalchemy.create_engine('sqlite:///{}'.format(join(directory, 'bench.db')))}
+            if mysql:
+                engines['mysql'] = create_mysql_engine(mysql)
+            for backend, engine in engines.items():
+                for result in time_modes(files, engine, method, depth, stream_rows or max(rows // (4 * parts), 1)):
+                    results.append(dict(result, rows_generated=rows, backend=backend))
+                engine.dispose()
+
+    print('{:>8} {:<8} {:<18} {:>10} {:>10} {:>12}'.format('rows', 'backend', 'mode', 'seconds', 'loaded', 'rows/sec'))
+    for result in results:
+        print('{:>8} {:<8} {:<18} {:>10.3f} {:>10} {:>12.0f}'.format(
+            result['rows_generated'], result['backend'], result['mode'], result['seconds'], result['rows'],
+            result['rows'] / result['seconds'] if result['seconds'] else float('inf')))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark sequential against pipelined loads.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000],
+                        help='Numbers of usage rows to generate, one run per number.')
+    parser.add_argument('--parts', type=int, default=4, help='Files each usage export is split into.')
+    parser.add_argument('--mysql', metavar='CREDS',
+                        help='Also load into the MySQL database of this credentials file. Its tables are dropped.')
+    parser.add_argument('--load_mode', choices=LOAD_METHODS, default='default')
+    parser.add_argument('--depth', type=int, default=PIPELINE_DEPTH, help='Files or chunks cleaned ahead.')
+    parser.add_argument('--stream', type=int, metavar='ROWS', help='Rows per chunk of the streamed modes.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    # The cleaning steps assign to slices of the exports.
+    warnings.simplefilter('ignore', pd.errors.SettingWithCopyWarning)
+    main(args.rows, args.parts, args.mysql, args.load_mode, args.depth, args.stream, args.seed)
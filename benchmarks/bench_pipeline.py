@@ -0,0 +1,183 @@
+'''
+Times reading, cleaning and loading synthetic exports of every dataset into
+SQLite and, optionally, a MySQL database, and saves the timings so later runs
+can be compared against them.
+
+    python -m benchmarks.bench_pipeline --rows 10000 100000 1000000
+    python -m benchmarks.bench_pipeline --rows 100000 --compare benchmarks/results/pipeline-20180101-000000.json
+    python -m benchmarks.bench_pipeline --mysql bench_creds.yml
+
+The MySQL database named in the credentials file has its tables dropped and
+recreated before every run, so point it at a database used for benchmarks only.
+'''
+import os
+import json
+import time
+import platform
+import argparse
+import tempfile
+import warnings
+import sqlalchemy
+import pandas as pd
+from os.path import join, dirname, abspath
+from facilities_dataloader.helper import read_data, data_to_db, create_mysql_engine, LOAD_METHODS
+from facilities_dataloader.schema import create_table_statement
+from facilities_dataloader.parallel import DATASETS, LOAD_STAGES
+from facilities_dataloader.buildings import clean_buildings
+from facilities_dataloader.electricity import clean_electricity, clean_elec_accounts
+from facilities_dataloader.natural_gas import clean_natural_gas, clean_ngas_accounts
+from benchmarks.generators import write_exports
+
+RESULTS_DIRECTORY = join(dirname(abspath(__file__)), 'results')
+
+# dataset -> (dataset type passed to read_data, cleaning step)
+STEPS = {'buildings': ('buildings', clean_buildings),
+         'elec_accounts': ('other', clean_elec_accounts),
+         'ngas_accounts': ('gas_accounts', clean_ngas_accounts),
+         'elec': ('elec', clean_electricity),
+         'ngas': ('other', clean_natural_gas)}
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def reset_tables(engine):
+    '''
+    Drops and recreates the tables loaded by the benchmark from the ddl files.
+    '''
+    dialect = 'sqlite' if engine.dialect.name == 'sqlite' else 'mysql'
+    with engine.begin() as connection:
+        for dataset in DATASETS:
+            tablename = DATASETS[dataset][1]
+            connection.execute(sqlalchemy.text('DROP TABLE IF EXISTS {}'.format(tablename)))
+            connection.execute(sqlalchemy.text(create_table_statement(tablename, dialect=dialect)))
+
+
+def run(rows, engines, method='default', seed=0):
+    '''
+    Generates exports with rows usage rows, then reads, cleans and loads each
+    dataset into every engine in load order.
+
+    Parameters
+    ----------
+    rows: (int) number of rows of each usage export
+    engines: (dict) backend name -> sqlalchemy engine
+    method: (string) how rows are sent, see data_to_db
+    seed: (int) random seed of the generators
+
+    Returns
+    -------
+    results: (list of dicts) rows, dataset, backend, stage, seconds and rows
+             handled, one per dataset and stage
+    '''
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        files = write_exports(directory, rows, seed)
+        for engine in engines.values():
+            reset_tables(engine)
+        for dataset in [dataset for stage in LOAD_STAGES for dataset in stage]:
+            read_as, clean = STEPS[dataset]
+            raw, read_seconds = timed(read_data, files[dataset], read_as, use_cache=False)
+            data, clean_seconds = timed(clean, raw)
+            results.append({'rows': rows, 'dataset': dataset, 'backend': None, 'stage': 'read',
+                            'seconds': read_seconds, 'rows_handled': len(raw)})
+            results.append({'rows': rows, 'dataset': dataset, 'backend': None, 'stage': 'preprocess',
+                            'seconds': clean_seconds, 'rows_handled': len(data)})
+            for backend, engine in engines.items():
+                stats, load_seconds = timed(data_to_db, data, DATASETS[dataset][1], engine, method=method)
+                assert stats is not None, 'Loading {} into {} failed.'.format(dataset, backend)
+                results.append({'rows': rows, 'dataset': dataset, 'backend': backend, 'stage': 'load',
+                                'seconds': load_seconds, 'rows_handled': stats['rows']})
+    return results
+
+
+def compare(results, baseline, tolerance):
+    '''
+    Prints the timings next to those of an earlier run and flags the ones that
+    got slower by more than tolerance.
+
+    Parameters
+    ----------
+    results: (list of dicts) timings of this run, see run
+    baseline: (list of dicts) timings of an earlier run
+    tolerance: (float) allowed slowdown, 0.2 flags timings over 1.2x the baseline
+
+    Returns
+    -------
+    regressions: (list of dicts) timings slower than the baseline allows
+    '''
+    def key(result):
+        return result['rows'], result['dataset'], result['backend'], result['stage']
+
+    before = {key(result): result['seconds'] for result in baseline}
+    regressions = []
+    print('{:>8} {:<14} {:<8} {:<11} {:>10} {:>10} {:>8}'.format('rows', 'dataset', 'backend', 'stage',
+                                                                 'before s', 'now s', 'ratio'))
+    for result in results:
+        if key(result) not in before:
+            continue
+        ratio = result['seconds'] / before[key(result)] if before[key(result)] else float('inf')
+        flag = '  slower' if ratio > 1 + tolerance else ''
+        if flag:
+            regressions.append(result)
+        print('{:>8} {:<14} {:<8} {:<11} {:>10.3f} {:>10.3f} {:>7.2f}x{}'.format(
+            result['rows'], result['dataset'], result['backend'] or '-', result['stage'],
+            before[key(result)], result['seconds'], ratio, flag))
+    return regressions
+
+
+def main(sizes, mysql=None, method='default', output=None, baseline=None, tolerance=0.2, seed=0):
+    results = []
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            engines = {'sqlite': sqlalchemy.create_engine('sqlite:///{}'.format(join(directory, 'bench.db')))}
+            if mysql:
+                engines['mysql'] = create_mysql_engine(mysql)
+            results.extend(run(rows, engines, method, seed))
+            for engine in engines.values():
+                engine.dispose()
+
+    print('{:>8} {:<14} {:<8} {:<11} {:>10} {:>12}'.format('rows', 'dataset', 'backend', 'stage', 'seconds', 'rows/sec'))
+    for result in results:
+        print('{:>8} {:<14} {:<8} {:<11} {:>10.3f} {:>12.0f}'.format(
+            result['rows'], result['dataset'], result['backend'] or '-', result['stage'], result['seconds'],
+            result['rows_handled'] / result['seconds'] if result['seconds'] else float('inf')))
+
+    if output is None:
+        os.makedirs(RESULTS_DIRECTORY, exist_ok=True)
+        output = join(RESULTS_DIRECTORY, time.strftime('pipeline-%Y%m%d-%H%M%S.json'))
+    with open(output, 'w') as f:
+        json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'python': platform.python_version(),
+                   'pandas': pd.__version__,
+                   'method': method,
+                   'seed': seed,
+                   'results': results}, f, indent=1)
+    print('Saved results to {}.'.format(output))
+
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(results, json.load(f)['results'], tolerance)
+        print('{} timings slower than {:.0%} over the baseline.'.format(len(regressions), tolerance))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark reading, cleaning and loading synthetic exports.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='Numbers of usage rows to generate, one run per number.')
+    parser.add_argument('--mysql', metavar='CREDS',
+                        help='Also load into the MySQL database of this credentials file. Its tables are dropped.')
+    parser.add_argument('--load_mode', choices=LOAD_METHODS, default='default')
+    parser.add_argument('--output', help='Where to save the results, by default benchmarks/results/.')
+    parser.add_argument('--compare', metavar='RESULTS', help='Results file of an earlier run to compare against.')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Slowdown over the earlier run that is reported, 0.2 means 20%%.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    # The cleaning steps assign to slices of the exports.
+    warnings.simplefilter('ignore', pd.errors.SettingWithCopyWarning)
+    main(args.rows, args.mysql, args.load_mode, args.output, args.compare, args.tolerance, args.seed)
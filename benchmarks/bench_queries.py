@@ -0,0 +1,133 @@
+'''
+Times typical reporting queries against synthetic usage tables without and
+with the secondary indexes declared in ddl/indexes.sql.
+
+    python -m benchmarks.bench_queries --rows 1000000
+    python -m benchmarks.bench_queries --rows 1000000 --mysql bench_creds.yml
+
+The MySQL database named in the credentials file has its tables dropped and
+recreated, so point it at a database used for benchmarks only.
+'''
+import time
+import argparse
+import tempfile
+import warnings
+import sqlalchemy
+import pandas as pd
+from os.path import join
+from facilities_dataloader.helper import create_mysql_engine
+from facilities_dataloader.table_manager import create_indexes, drop_indexes
+from benchmarks.bench_pipeline import run
+
+# name -> query, the parameters are filled in by query_parameters.
+QUERIES = {'elec_account_history': '''SELECT * FROM elec_usage WHERE account_number = :account
+                                      ORDER BY bill_month''',
+           'elec_months': '''SELECT account_number, SUM(billed_khw) AS kwh FROM elec_usage
+                             WHERE bill_month >= :low AND bill_month < :high GROUP BY account_number''',
+           'ngas_months': '''SELECT SUM(therms) AS therms FROM ngas_usage
+                             WHERE bill_month >= :low AND bill_month < :high''',
+           'ngas_account_history': '''SELECT * FROM ngas_usage WHERE account_number = :gas_account
+                                      ORDER BY bill_month''',
+           'building_elec_by_month': '''SELECT u.bill_month, SUM(u.billed_khw) AS kwh
+                                        FROM elec_usage u JOIN elec_accounts a ON a.account_number = u.account_number
+                                        WHERE a.activity_code = :building GROUP BY u.bill_month'''}
+
+
+def query_parameters(engine):
+    '''
+    Picks an account, a gas account, a building and a quarter that exist in
+    the loaded tables.
+    '''
+    with engine.connect() as connection:
+        account = connection.execute(sqlalchemy.text('SELECT MAX(account_number) FROM elec_usage')).scalar()
+        gas_account = connection.execute(sqlalchemy.text('SELECT MAX(account_number) FROM ngas_usage')).scalar()
+        building = connection.execute(sqlalchemy.text(
+            '''SELECT MAX(a.activity_code) FROM elec_accounts a
+               JOIN elec_usage u ON u.account_number = a.account_number''')).scalar()
+        first = connection.execute(sqlalchemy.text('SELECT MIN(bill_month) FROM elec_usage')).scalar()
+    low = pd.Timestamp(str(first)[:10]) + pd.DateOffset(months=6)
+    return {'account': account, 'gas_account': gas_account, 'building': building,
+            'low': low.strftime('%Y-%m-%d'), 'high': (low + pd.DateOffset(months=3)).strftime('%Y-%m-%d')}
+
+
+def time_queries(engine, parameters, repeat):
+    '''
+    Runs every query repeat times and keeps the fastest run of each.
+
+    Returns
+    -------
+    timings: (dict) query name -> (seconds, rows returned)
+    '''
+    timings = {}
+    with engine.connect() as connection:
+        for name, query in QUERIES.items():
+            best = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                rows = connection.execute(sqlalchemy.text(query), parameters).fetchall()
+                best = min(best, time.perf_counter() - start)
+            timings[name] = (best, len(rows))
+    return timings
+
+
+def compare_indexes(engine, rows, repeat=5, seed=0):
+    '''
+    Loads synthetic exports with rows usage rows, then times the queries
+    without the secondary indexes, builds them and times the queries again.
+
+    Parameters
+    ----------
+    engine: (sqlalchemy.engine.base.Engine) database to load into, its tables are dropped
+    rows: (int) number of rows of each usage export
+    repeat: (int) runs of each query, the fastest is kept
+    seed: (int) random seed of the generators
+
+    Returns
+    -------
+    results: (list of dicts) query, seconds without and with indexes and rows returned
+    '''
+    run(rows, {'backend': engine}, seed=seed)
+    drop_indexes(engine)
+    parameters = query_parameters(engine)
+    before = time_queries(engine, parameters, repeat)
+    start = time.perf_counter()
+    create_indexes(engine)
+    print('Built the indexes in {:.2f}s.'.format(time.perf_counter() - start))
+    after = time_queries(engine, parameters, repeat)
+    return [{'query': name, 'without': before[name][0], 'with': after[name][0], 'rows': after[name][1]}
+            for name in QUERIES]
+
+
+def main(sizes, mysql=None, repeat=5, seed=0):
+    results = []
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            engines = {'sqlite': sqlalchemy.create_engine('sqlite:///{}'.format(join(directory, 'bench.db')))}
+            if mysql:
+                engines['mysql'] = create_mysql_engine(mysql)
+            for backend, engine in engines.items():
+                for result in compare_indexes(engine, rows, repeat, seed):
+                    results.append(dict(result, rows_loaded=rows, backend=backend))
+                engine.dispose()
+
+    print('{:>8} {:<8} {:<24} {:>12} {:>12} {:>9} {:>8}'.format('rows', 'backend', 'query', 'without s',
+                                                               'with s', 'speedup', 'returned'))
+    for result in results:
+        print('{:>8} {:<8} {:<24} {:>12.4f} {:>12.4f} {:>8.1f}x {:>8}'.format(
+            result['rows_loaded'], result['backend'], result['query'], result['without'], result['with'],
+            result['without'] / result['with'] if result['with'] else float('inf'), result['rows']))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark reporting queries without and with secondary indexes.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000],
+                        help='Numbers of usage rows to generate, one run per number.')
+    parser.add_argument('--mysql', metavar='CREDS',
+                        help='Also run against the MySQL database of this credentials file. Its tables are dropped.')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs of each query, the fastest is kept.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    # The cleaning steps assign to slices of the exports.
+    warnings.simplefilter('ignore', pd.errors.SettingWithCopyWarning)
+    main(args.rows, args.mysql, args.repeat, args.seed)
@@ -0,0 +1,53 @@
+'''
+Times how long fodbdriver.py takes to start, in fresh interpreters, against
+the targets of STARTUP_TARGETS. Scheduled runs pay this on every invocation.
+
+    python -m benchmarks.bench_startup --runs 10
+'''
+import sys
+import time
+import argparse
+import subprocess
+from os.path import dirname, abspath
+
+ROOT = dirname(dirname(abspath(__file__)))
+# name -> arguments of the interpreter. The last one imports every loader,
+# what every invocation paid before the modules were imported lazily.
+COMMANDS = {'--help': ['fodbdriver.py', '--help'],
+            'load --help': ['fodbdriver.py', 'load', '--help'],
+            'create-tables imports': ['-c', 'import fodbdriver, facilities_dataloader.table_manager'],
+            'load imports': ['-c', 'import fodbdriver, facilities_dataloader.parallel, facilities_dataloader.anomalies']}
+# Median seconds each command should start in.
+STARTUP_TARGETS = {'--help': 0.2, 'load --help': 0.2, 'create-tables imports': 0.5}
+
+
+def time_command(arguments, runs):
+    '''
+    Median wall time of running the interpreter with arguments, runs times.
+    '''
+    seconds = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + arguments, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        seconds.append(time.perf_counter() - start)
+    return sorted(seconds)[len(seconds) // 2]
+
+
+def main(runs=5):
+    results = []
+    for name, arguments in COMMANDS.items():
+        results.append({'command': name, 'seconds': time_command(arguments, runs),
+                        'target': STARTUP_TARGETS.get(name)})
+
+    print('{:<24} {:>10} {:>10}'.format('command', 'seconds', 'target'))
+    for result in results:
+        print('{:<24} {:>10.3f} {:>10}'.format(result['command'], result['seconds'],
+                                              '' if result['target'] is None else '{:.3f}'.format(result['target'])))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the start-up time of fodbdriver.py.')
+    parser.add_argument('--runs', type=int, default=5, help='Runs of each command, the median is reported.')
+    args = parser.parse_args()
+    main(args.runs)
@@ -0,0 +1,310 @@
+'''
+Synthetic exports shaped like the files the loaders read, dirty values included:
+ids that lost their leading zeros, 'Multiple Demands' peaks, '-' and '#N/A'
+amounts, rows flagged for discard, 'NV' building fields and repeated rows.
+
+    from benchmarks.generators import write_exports
+    files = write_exports('/tmp/exports', rows=100000)
+'''
+import os
+import numpy as np
+import pandas as pd
+from os.path import join
+
+FIRST_MONTH = pd.Timestamp('2012-01-01')
+STREETS = ['STATE ST', 'CLARK ST', 'HALSTED ST', 'ASHLAND AVE', 'WESTERN AVE', 'PULASKI RD', 'CICERO AVE', 'MADISON ST']
+GAS_METER_TYPES = ['Residential', 'Commercial', 'Industrial']
+
+
+def stripped(rng, width, size, max_lost=4):
+    '''
+    Draws ids of up to width digits as integers, the way Excel stores them, so
+    a number of them have lost leading zeros.
+
+    Parameters
+    ----------
+    rng: (numpy.random.Generator) random generator
+    width: (int) number of digits of a full id
+    size: (int) number of ids
+    max_lost: (int) largest number of leading zeros lost
+
+    Returns
+    -------
+    ids: (ndarray of int64) ids
+    '''
+    return rng.integers(1, 10**width, size) // 10**rng.integers(0, max_lost + 1, size)
+
+
+def unique_stripped(rng, width, size):
+    '''
+    Like stripped but without repeats, for ids that are a primary key.
+    '''
+    return rng.choice(10**width, size, replace=False) + 1
+
+
+def activity_codes(buildings):
+    '''
+    Builds distinct 4 character activity codes, the key of buildings.
+    '''
+    return pd.Series(np.arange(buildings)).map('{:04X}'.format)
+
+
+def months(index):
+    '''
+    Turns month numbers counted from FIRST_MONTH into the first day of each month.
+    '''
+    years, month = np.divmod(np.asarray(index) + FIRST_MONTH.month - 1, 12)
+    return pd.to_datetime({'year': FIRST_MONTH.year + years, 'month': month + 1, 'day': 1})
+
+
+def with_repeats(data, rng, fraction):
+    '''
+    Appends copies of a fraction of the rows in random order, as exports that
+    overlap each other contain.
+    '''
+    repeats = data.iloc[rng.choice(len(data), int(len(data) * fraction), replace=False)]
+    data = pd.concat([data, repeats], ignore_index=True)
+    return data.iloc[rng.permutation(len(data))].reset_index(drop=True)
+
+
+def usage_grid(rows):
+    '''
+    Spreads rows over accounts billed every month, about two years of bills
+    each, so every (account, month) pair is used once.
+
+    Returns
+    -------
+    account: (ndarray) account of each row
+    month: (ndarray) month of each row, counted from FIRST_MONTH
+    accounts: (int) number of accounts
+    '''
+    accounts = max(rows // 24, 1)
+    index = np.arange(rows)
+    return index % accounts, index // accounts, accounts
+
+
+def electricity_export(rows, seed=0):
+    '''
+    Builds an electricity export with the columns clean_electricity expects.
+
+    Parameters
+    ----------
+    rows: (int) number of rows
+    seed: (int) random seed
+
+    Returns
+    -------
+    data: (DataFrame) electricity export
+    '''
+    rng = np.random.default_rng(seed)
+    account, month, accounts = usage_grid(rows)
+    account_numbers = stripped(rng, 10, accounts)[account]
+    tails = pd.Series(rng.integers(0, 10**4, rows)).astype(str)
+    suffixes = pd.Series(rng.choice(['', '', '', '', 'R', 'C', 'Z'], rows))
+    bill_month = months(month)
+    stop = bill_month + pd.to_timedelta(rng.integers(0, 28, rows), unit='D')
+    kwh = rng.gamma(2.0, 5000.0, rows).round(1)
+    supply = (kwh * rng.uniform(0.05, 0.08, rows)).round(2)
+    udc = (kwh * rng.uniform(0.03, 0.05, rows)).round(2)
+    peak = pd.Series((kwh / 300).round(2), dtype=object)
+    peak[rng.random(rows) < 0.01] = 'Multiple Demands'
+    discard = pd.Series(np.where(rng.random(rows) < 0.02, 'Y', None), dtype=object)
+    return pd.DataFrame({'Funds': rng.choice(['Corporate', 'Library', 'Fleet'], rows),
+                         'NonConsec?': np.where(rng.random(rows) < 0.05, 'Y', None),
+                         'Discard?': discard,
+                         'Num': np.arange(rows) + 1,
+                         'ACCOUNTID': account + 1,
+                         'STATEMENTNO': pd.Series(rng.integers(10**8, 10**10, rows)).astype(str),
+                         'UDCACCTID': account_numbers,
+                         'INVOICEID': pd.Series(unique_stripped(rng, 10, rows)).astype(str) + '-' + tails + suffixes,
+                         'INVOICEDATE': stop + pd.Timedelta(days=5),
+                         'SERVICE_PERIOD_START': stop - pd.Timedelta(days=30),
+                         'SERVICE_PERIOD_STOP': stop,
+                         'BILLEDKWH': kwh,
+                         'Peak kW': peak,
+                         'SUPPLY CHARGES': supply,
+                         'UDC CHARGES': udc,
+                         'Acctnum': account_numbers,
+                         'Cancel / Rebill?': np.where(rng.random(rows) < 0.03, 'Y', 'N'),
+                         'STATENUM': rng.integers(1, 10**6, rows),
+                         'BILL MO': bill_month,
+                         'ACCTG MO': bill_month + pd.DateOffset(months=1)})
+
+
+def natural_gas_export(rows, seed=0):
+    '''
+    Builds a natural gas export with the columns clean_natural_gas expects,
+    including about 1% repeated rows.
+
+    Parameters
+    ----------
+    rows: (int) number of rows before repeats are added
+    seed: (int) random seed
+
+    Returns
+    -------
+    data: (DataFrame) natural gas export
+    '''
+    rng = np.random.default_rng(seed)
+    account, month, accounts = usage_grid(rows)
+    account_numbers = stripped(rng, 13, accounts)
+    # Only accounts that were migrated have a new account number.
+    new_account_numbers = pd.Series(stripped(rng, 10, accounts)).astype(str) + '-' + \
+                          pd.Series(stripped(rng, 5, accounts, 2)).astype(str)
+    new_account_numbers[rng.random(accounts) < 0.3] = np.nan
+    addresses = pd.Series(rng.integers(1, 9999, accounts)).astype(str) + ' ' + \
+                pd.Series(rng.choice(STREETS, accounts))
+    second_lines = pd.Series(np.where(rng.random(accounts) < 0.1, 'UNIT 1', None), dtype=object)
+    end = months(month) + pd.to_timedelta(rng.integers(0, 28, rows), unit='D')
+    therms = pd.Series(rng.gamma(2.0, 400.0, rows).round(1), dtype=object)
+    therms[rng.random(rows) < 0.02] = rng.choice(['-', 'N/A', '#N/A'])
+    utility = rng.gamma(2.0, 300.0, rows).round(2)
+    supplier = pd.Series(rng.gamma(2.0, 100.0, rows).round(2), dtype=object)
+    supplier[rng.random(rows) < 0.01] = '-'
+    data = pd.DataFrame({'ADDRESS': addresses[account].to_numpy(),
+                         'Address 2': second_lines[account].to_numpy(),
+                         'City': 'CHICAGO',
+                         'Account Number': account_numbers[account],
+                         'New Account Number': new_account_numbers[account].to_numpy(),
+                         'Start Date': end - pd.Timedelta(days=30),
+                         'End Date': end,
+                         'Therms': therms,
+                         'Utility Amount': utility,
+                         'Supplier Amount': supplier})
+    return with_repeats(data, rng, 0.01)
+
+
+def elec_accounts_export(accounts, buildings, seed=0):
+    '''
+    Builds an electricity accounts export, about 5% of rows repeated.
+
+    Parameters
+    ----------
+    accounts: (int) number of accounts
+    buildings: (int) number of buildings the accounts belong to
+    seed: (int) random seed
+
+    Returns
+    -------
+    data: (DataFrame) electricity accounts export
+    '''
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame({'account_number': unique_stripped(rng, 10, accounts),
+                         'activity_code': activity_codes(buildings)[rng.integers(0, buildings, accounts)].to_numpy()})
+    return with_repeats(data, rng, 0.05)
+
+
+def ngas_accounts_export(accounts, buildings, seed=0):
+    '''
+    Builds a natural gas accounts export, about 5% of rows repeated.
+
+    Parameters
+    ----------
+    accounts: (int) number of accounts
+    buildings: (int) number of buildings the accounts belong to
+    seed: (int) random seed
+
+    Returns
+    -------
+    data: (DataFrame) natural gas accounts export
+    '''
+    rng = np.random.default_rng(seed)
+    installed = FIRST_MONTH - pd.to_timedelta(rng.integers(0, 3650, accounts), unit='D')
+    ert_installed = pd.Series(installed + pd.to_timedelta(rng.integers(0, 1000, accounts), unit='D'))
+    ert_meter = rng.random(accounts) < 0.8
+    ert_installed[~ert_meter] = pd.NaT
+    ert_numbers = pd.Series(stripped(rng, 8, accounts, 2), dtype=object)
+    ert_numbers[~ert_meter] = np.nan
+    data = pd.DataFrame({'account_number': unique_stripped(rng, 13, accounts),
+                         'activity_code': activity_codes(buildings)[rng.integers(0, buildings, accounts)].to_numpy(),
+                         'meter_number': pd.Series(rng.integers(10**8, 10**9, accounts)).astype(str),
+                         'type': rng.choice(GAS_METER_TYPES, accounts),
+                         'location': rng.choice(['BSMT', 'EXT', 'ROOF'], accounts),
+                         'install_date': installed,
+                         'ert_meter': ert_meter.astype(int),
+                         'ert_number': ert_numbers,
+                         'ert_install_date': ert_installed})
+    return with_repeats(data, rng, 0.05)
+
+
+def buildings_export(buildings, seed=0):
+    '''
+    Builds a buildings export with the main columns of the buildings table,
+    about 5% of the optional values set to 'NV'.
+
+    Parameters
+    ----------
+    buildings: (int) number of buildings
+    seed: (int) random seed
+
+    Returns
+    -------
+    data: (DataFrame) buildings export
+    '''
+    rng = np.random.default_rng(seed)
+
+    def not_verified(values):
+        values = pd.Series(values, dtype=object)
+        values[rng.random(buildings) < 0.05] = 'NV'
+        return values
+
+    return pd.DataFrame({'inactive': rng.random(buildings) < 0.05,
+                         'activity_code': activity_codes(buildings),
+                         'address': pd.Series(rng.integers(1, 9999, buildings)).astype(str) + ' ' +
+                                    pd.Series(rng.choice(STREETS, buildings)),
+                         'city': 'CHICAGO',
+                         'state': 'IL',
+                         'zipcode': pd.Series(rng.integers(60601, 60661, buildings)).astype(str),
+                         'latitude': rng.uniform(41.65, 42.02, buildings).round(6),
+                         'longitude': rng.uniform(-87.94, -87.52, buildings).round(6),
+                         'building_name': 'BUILDING ' + pd.Series(np.arange(buildings)).astype(str),
+                         'facility_type': rng.choice(['Library', 'Fire Station', 'Police Station', 'Office'], buildings),
+                         'square_footage': not_verified(rng.integers(1000, 200000, buildings)),
+                         'year_built': not_verified(rng.integers(1880, 2017, buildings)),
+                         'ward': rng.integers(1, 51, buildings)})
+
+
+def exports(rows, seed=0):
+    '''
+    Builds one export of every dataset, sized from the number of usage rows:
+    an account per 24 monthly bills and a building per 4 accounts.
+
+    Parameters
+    ----------
+    rows: (int) number of rows of each usage export
+    seed: (int) random seed
+
+    Returns
+    -------
+    exports: (dict) dataset -> DataFrame, datasets named as in parallel.DATASETS
+    '''
+    accounts = max(rows // 24, 1)
+    buildings = max(accounts // 4, 1)
+    return {'buildings': buildings_export(buildings, seed),
+            'elec_accounts': elec_accounts_export(accounts, buildings, seed),
+            'ngas_accounts': ngas_accounts_export(accounts, buildings, seed),
+            'elec': electricity_export(rows, seed),
+            'ngas': natural_gas_export(rows, seed)}
+
+
+def write_exports(directory, rows, seed=0):
+    '''
+    Writes one .csv export of every dataset, laid out as parallel.discover_files
+    expects: directory/<dataset>/<dataset>.csv.
+
+    Parameters
+    ----------
+    directory: (string) directory to write to
+    rows: (int) number of rows of each usage export
+    seed: (int) random seed
+
+    Returns
+    -------
+    files: (dict) dataset -> file path
+    '''
+    files = {}
+    for dataset, data in exports(rows, seed).items():
+        os.makedirs(join(directory, dataset), exist_ok=True)
+        files[dataset] = join(directory, dataset, dataset + '.csv')
+        data.to_csv(files[dataset], index=False)
+    return files
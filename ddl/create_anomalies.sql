@@ -0,0 +1,14 @@
+CREATE TABLE IF NOT EXISTS usage_anomalies (
+source_table VARCHAR(10),
+account_number VARCHAR(16),
+address VARCHAR(60),
+activity_code CHAR(4),
+bill_month DATE,
+service_period_start DATE,
+service_period_stop DATE,
+flag VARCHAR(10),
+metric VARCHAR(20),
+value DOUBLE PRECISION,
+baseline DOUBLE PRECISION,
+score DOUBLE PRECISION
+);
@@ -11,7 +11,8 @@ billed_khw FLOAT,
 peak_kw FLOAT NULL,
 supply_charges FLOAT,
 udc_charges FLOAT,
-total_charges FLOAT
+total_charges FLOAT,
+activity_code CHAR(4)
 );
 
 CREATE TABLE IF NOT EXISTS elec_accounts (
@@ -0,0 +1,15 @@
+CREATE TABLE IF NOT EXISTS load_files (
+file_hash CHAR(64),
+tablename VARCHAR(20),
+filename VARCHAR(255),
+row_count INT,
+loaded_at DATETIME,
+PRIMARY KEY (file_hash, tablename)
+);
+
+CREATE TABLE IF NOT EXISTS load_rows (
+key_hash BIGINT,
+tablename VARCHAR(20),
+row_hash BIGINT,
+PRIMARY KEY (key_hash, tablename)
+);
@@ -12,6 +12,7 @@ total_amount FLOAT,
 address VARCHAR(60),
 address2 VARCHAR(30),
 city VARCHAR(15),
+activity_code CHAR(4),
 PRIMARY KEY (current_account_number, service_period_start, utility_amount, address)
 );
 
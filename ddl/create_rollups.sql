@@ -0,0 +1,12 @@
+CREATE TABLE IF NOT EXISTS building_energy_monthly (
+activity_code CHAR(4),
+bill_month DATE,
+kwh DOUBLE PRECISION,
+peak_kw FLOAT,
+elec_charges DOUBLE PRECISION,
+therms DOUBLE PRECISION,
+ngas_charges DOUBLE PRECISION,
+kbtu DOUBLE PRECISION,
+eui DOUBLE PRECISION,
+PRIMARY KEY (activity_code, bill_month)
+);
@@ -3,3 +3,8 @@ DROP TABLE IF EXISTS elec_accounts;
 DROP TABLE IF EXISTS ngas_usage;
 DROP TABLE IF EXISTS ngas_accounts;
 DROP TABLE IF EXISTS buildings;
+DROP TABLE IF EXISTS load_files;
+DROP TABLE IF EXISTS load_rows;
+DROP TABLE IF EXISTS building_energy_monthly;
+DROP TABLE IF EXISTS usage_anomalies;
+DROP TABLE IF EXISTS schema_version;
@@ -0,0 +1,11 @@
+-- Secondary indexes, created by table_manager.create_indexes once the tables
+-- exist. They can be dropped around bulk loads and created again afterwards.
+CREATE INDEX elec_usage_account_number ON elec_usage (account_number, bill_month);
+CREATE INDEX elec_usage_bill_month ON elec_usage (bill_month);
+CREATE INDEX ngas_usage_account_number ON ngas_usage (account_number, bill_month);
+CREATE INDEX ngas_usage_bill_month ON ngas_usage (bill_month);
+CREATE INDEX elec_usage_activity_code ON elec_usage (activity_code, bill_month);
+CREATE INDEX ngas_usage_activity_code ON ngas_usage (activity_code, bill_month);
+CREATE INDEX usage_anomalies_account_number ON usage_anomalies (account_number, bill_month);
+CREATE INDEX elec_accounts_activity_code ON elec_accounts (activity_code);
+CREATE INDEX ngas_accounts_activity_code ON ngas_accounts (activity_code);
@@ -0,0 +1,320 @@
+import os
+import hashlib
+import sqlalchemy
+import numpy as np
+import pandas as pd
+from os.path import join, exists
+from facilities_dataloader import cache
+from facilities_dataloader.helper import bump_table_versions
+from facilities_dataloader.instrument import stage
+from facilities_dataloader.sinks import is_parquet, read_parquet
+
+# Usage table -> accounts table mapping its account numbers to buildings.
+ACCOUNT_TABLES = {'elec_usage': 'elec_accounts', 'ngas_usage': 'ngas_accounts'}
+# Usage columns looked up in the index, the first one found wins. Natural gas
+# accounts are listed under their 13 digit number, renumbered accounts may
+# only be listed under the new one.
+LOOKUP_COLUMNS = {'elec_usage': ['account_number'],
+                  'ngas_usage': ['account_number', 'current_account_number']}
+# Unmatched accounts printed after a load, the full list is returned.
+UNMATCHED_SHOWN = 10
+# Temporary table the accounts to restamp are staged in, see restamp_usage.
+STAGED_ACCOUNTS = 'staged_accounts'
+
+# index path -> (modification time of the file, index), see account_index.
+_INDEXES = {}
+
+
+def index_path(engine, accounts_table):
+    '''
+    Location of the account index of a database or Parquet sink, in the cache
+    directory. None for an in-memory database, whose index is never saved as
+    other in-memory databases have the same URL.
+    '''
+    if not is_parquet(engine) and engine.url.database in (None, '', ':memory:'):
+        return None
+    location = engine['directory'] if is_parquet(engine) else repr(engine.url)
+    digest = hashlib.sha1(location.encode()).hexdigest()[:16]
+    return join(cache.CACHE_DIRECTORY, '{}-{}.npz'.format(accounts_table, digest))
+
+
+def read_accounts(engine, accounts_table):
+    '''
+    Reads the account numbers and buildings of an accounts table, no rows if
+    the table does not exist yet.
+    '''
+    columns = ['account_number', 'activity_code']
+    if is_parquet(engine):
+        return read_parquet(engine, accounts_table, columns)
+    if not sqlalchemy.inspect(engine).has_table(accounts_table):
+        return pd.DataFrame(columns=columns)
+    return pd.read_sql('SELECT account_number, activity_code FROM {}'.format(accounts_table), engine)
+
+
+def build_index(accounts):
+    '''
+    Builds a hash index from account numbers to the building they are billed
+    for. An account listed for several buildings, such as a gas account with
+    meters in two buildings, is kept for the first building in code order.
+
+    Parameters
+    ----------
+    accounts: (DataFrame) account_number and activity_code, see read_accounts
+
+    Returns
+    -------
+    index: (Series) activity_code indexed by account_number
+    '''
+    accounts = accounts[['account_number', 'activity_code']].dropna().astype(str).drop_duplicates()
+    accounts = accounts.sort_values(['account_number', 'activity_code'])
+    shared = accounts['account_number'].duplicated()
+    if shared.any():
+        print('{} accounts are listed for more than one building, the first is used.'.format(
+            accounts['account_number'][shared].nunique()))
+    accounts = accounts[~shared]
+    return pd.Series(accounts['activity_code'].to_numpy(), index=pd.Index(accounts['account_number'].to_numpy()),
+                     name='activity_code')
+
+
+def save_index(index, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    partial = path + '.partial.npz'
+    np.savez(partial, account_number=index.index.to_numpy(dtype=str), activity_code=index.to_numpy(dtype=str))
+    os.replace(partial, path)
+    _INDEXES[path] = (os.stat(path).st_mtime_ns, index)
+
+
+def load_index(path):
+    with np.load(path, allow_pickle=False) as arrays:
+        return pd.Series(arrays['activity_code'].astype(object), index=pd.Index(arrays['account_number'].astype(object)),
+                         name='activity_code')
+
+
+def account_index(engine, accounts_table, rebuild=False):
+    '''
+    Returns the index of an accounts table, kept in memory while its file is
+    unchanged and read from disk if it was built by an earlier run.
+
+    Parameters
+    ----------
+    engine: (sqlalchemy.engine.base.Engine or dict) Connection to database or
+            Parquet sink, see sinks.parquet_sink.
+    accounts_table: (string) elec_accounts or ngas_accounts
+    rebuild: (bool) build it again from the accounts table
+
+    Returns
+    -------
+    index: (Series) see build_index
+    '''
+    path = index_path(engine, accounts_table)
+    if not rebuild and path and exists(path):
+        modified = os.stat(path).st_mtime_ns
+        if path in _INDEXES and _INDEXES[path][0] == modified:
+            return _INDEXES[path][1]
+        index = load_index(path)
+        _INDEXES[path] = (modified, index)
+        return index
+    index = build_index(read_accounts(engine, accounts_table))
+    if path:
+        save_index(index, path)
+    return index
+
+
+def update_account_index(engine, accounts_table):
+    '''
+    Builds the index of an accounts table again once rows were loaded into it,
+    and stamps the usage already loaded for accounts that were added or moved
+    with their new building. The index is read from the table rather than
+    from the file loaded, since rows of accounts already in the table are
+    skipped unless upserted and keep their building.
+
+    Parameters
+    ----------
+    engine: (sqlalchemy.engine.base.Engine or dict) Connection to database or
+            Parquet sink, see sinks.parquet_sink.
+    accounts_table: (string) elec_accounts or ngas_accounts
+
+    Returns
+    -------
+    index: (Series) see build_index
+    '''
+    path = index_path(engine, accounts_table)
+    previous = account_index(engine, accounts_table) if path and exists(path) else build_index(
+        pd.DataFrame(columns=['account_number', 'activity_code']))
+    index = account_index(engine, accounts_table, rebuild=True)
+    changed = index[index.ne(previous.reindex(index.index)).to_numpy()]
+    print('Indexed {} new or moved accounts of {}, {} in all.'.format(len(changed), accounts_table, len(index)))
+    for tablename, source in ACCOUNT_TABLES.items():
+        if source == accounts_table:
+            restamp_usage(engine, tablename, changed)
+    return index
+
+
+def rebuild_account_indexes(engine, tablenames):
+    '''
+    Builds the index of every accounts table among tablenames again from the
+    table, once it was replaced whole as by staging.reload_tables, and stamps
+    all usage loaded with the buildings of the new index.
+
+    Parameters
+    ----------
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+    tablenames: (list of strings) tables replaced
+
+    Returns
+    -------
+    None
+    '''
+    for tablename, accounts_table in ACCOUNT_TABLES.items():
+        if accounts_table in tablenames:
+            index = account_index(engine, accounts_table, rebuild=True)
+            print('Indexed {} accounts of reloaded {}.'.format(len(index), accounts_table))
+            restamp_usage(engine, tablename, index, clear=True)
+
+
+def forget_account_indexes(engine):
+    '''
+    Removes the saved account indexes of a database, e.g. once its tables were
+    dropped.
+    '''
+    for accounts_table in ACCOUNT_TABLES.values():
+        path = index_path(engine, accounts_table)
+        if path and exists(path):
+            os.remove(path)
+        _INDEXES.pop(path, None)
+
+
+def has_activity_code(engine, tablename):
+    '''
+    Whether rows of a usage table can be stamped with their building. Tables
+    created before activity_code was declared need it added first.
+    '''
+    if is_parquet(engine):
+        return True
+    inspector = sqlalchemy.inspect(engine)
+    if not inspector.has_table(tablename):
+        return True
+    if 'activity_code' in {column['name'] for column in inspector.get_columns(tablename)}:
+        return True
+    print('{0} was created without activity_code, its rows are not stamped with their building. '
+          'Run ALTER TABLE {0} ADD COLUMN activity_code CHAR(4) to add it.'.format(tablename))
+    return False
+
+
+def restamp_statement(dialect, tablename, column):
+    '''
+    UPDATE setting the building of the usage rows whose column holds an
+    account staged in STAGED_ACCOUNTS, one pass over the usage table.
+    '''
+    if dialect == 'mysql':
+        return 'UPDATE {0} JOIN {2} s ON s.account_number = {0}.{1} SET {0}.activity_code = s.activity_code'.format(
+            tablename, column, STAGED_ACCOUNTS)
+    return 'UPDATE {0} SET activity_code = s.activity_code FROM {2} s WHERE s.account_number = {0}.{1}'.format(
+        tablename, column, STAGED_ACCOUNTS)
+
+
+def restamp_usage(engine, tablename, changed, clear=False):
+    '''
+    Sets the building of usage rows already loaded for the accounts of changed.
+    The accounts are staged in a temporary table and joined to the usage table
+    in one UPDATE per lookup column, so the usage table is read once however
+    many accounts changed. Parquet files are not rewritten, usage written to a
+    sink before its accounts keeps no building.
+
+    Parameters
+    ----------
+    engine: (sqlalchemy.engine.base.Engine or dict) Connection to database or
+            Parquet sink, see sinks.parquet_sink.
+    tablename: (string) elec_usage or ngas_usage
+    changed: (Series) buildings of the accounts to restamp, see build_index
+    clear: (bool) first remove the building of every row, so rows of accounts
+           not in changed are left without one
+    '''
+    if (changed.empty and not clear) or is_parquet(engine) or not sqlalchemy.inspect(engine).has_table(tablename) \
+            or not has_activity_code(engine, tablename):
+        return None
+    params = [{'activity_code': code, 'account_number': account} for account, code in changed.items()]
+    drop = 'DROP TEMPORARY TABLE' if engine.dialect.name == 'mysql' else 'DROP TABLE'
+    with stage('restamp_usage', table=tablename, accounts=len(params)):
+        with engine.begin() as connection:
+            connection.execute(sqlalchemy.text('CREATE TEMPORARY TABLE IF NOT EXISTS {} (account_number VARCHAR(32) '
+                                               'PRIMARY KEY, activity_code CHAR(4))'.format(STAGED_ACCOUNTS)))
+            connection.execute(sqlalchemy.text('DELETE FROM {}'.format(STAGED_ACCOUNTS)))
+            if params:
+                connection.execute(sqlalchemy.text('INSERT INTO {} (account_number, activity_code) '
+                                                   'VALUES (:account_number, :activity_code)'.format(STAGED_ACCOUNTS)),
+                                   params)
+            if clear:
+                connection.execute(sqlalchemy.text('UPDATE {} SET activity_code = NULL'.format(tablename)))
+            # In reverse, so the first lookup column wins as in stamp_buildings.
+            for column in reversed(LOOKUP_COLUMNS[tablename]):
+                connection.execute(sqlalchemy.text(restamp_statement(engine.dialect.name, tablename, column)))
+            connection.execute(sqlalchemy.text('{} {}'.format(drop, STAGED_ACCOUNTS)))
+    bump_table_versions(tablename)
+
+
+def lookup_buildings(data, tablename, index):
+    '''
+    Looks the accounts of usage rows up in an account index.
+
+    Returns
+    -------
+    activity_codes: (Series) building of every row, missing where no lookup
+                    column holds a known account
+    '''
+    codes = pd.Series(np.nan, index=data.index, dtype=object)
+    for column in LOOKUP_COLUMNS[tablename]:
+        if column in data.columns:
+            missing = codes.isna()
+            codes[missing] = data.loc[missing, column].astype(object).map(index)
+    return codes
+
+
+def unmatched_accounts(data, tablename):
+    '''
+    Lists the accounts of stamped usage rows that no building was found for.
+
+    Returns
+    -------
+    unmatched: (DataFrame) account_number and the number of rows of each,
+               most rows first
+    '''
+    missing = data.loc[data['activity_code'].isna(), 'account_number'].astype(object)
+    counts = missing.value_counts(dropna=False)
+    return pd.DataFrame({'account_number': counts.index, 'rows': counts.to_numpy()})
+
+
+def stamp_buildings(data, tablename, engine, target=None):
+    '''
+    Adds the building of every usage row as activity_code, looked up in the
+    account index, so readers do not have to join the accounts tables.
+    Accounts without a building are printed together once per call. Other
+    tables are returned unchanged.
+
+    Parameters
+    ----------
+    data: (DataFrame) cleaned rows of tablename
+    tablename: (string) elec_usage or ngas_usage, other tables are ignored
+    engine: (sqlalchemy.engine.base.Engine or dict) Connection to database or
+            Parquet sink, see sinks.parquet_sink.
+    target: (string) table the rows are written to if not tablename, such as
+            a shadow table
+
+    Returns
+    -------
+    data: (DataFrame) rows with activity_code
+    '''
+    if tablename not in ACCOUNT_TABLES or data.empty or 'account_number' not in data.columns \
+            or not has_activity_code(engine, target or tablename):
+        return data
+    with stage('stamp_buildings', data, table=tablename) as record:
+        index = account_index(engine, ACCOUNT_TABLES[tablename])
+        data = data.assign(activity_code=lookup_buildings(data, tablename, index))
+        unmatched = unmatched_accounts(data, tablename)
+        record['rows_out'] = len(data)
+        record['unmatched'] = int(unmatched['rows'].sum())
+    if not unmatched.empty:
+        print('{} rows of {} accounts of {} have no building in {}, e.g. {}.'.format(
+            unmatched['rows'].sum(), len(unmatched), tablename, ACCOUNT_TABLES[tablename],
+            ', '.join(unmatched['account_number'].astype(str).head(UNMATCHED_SHOWN))))
+    return data
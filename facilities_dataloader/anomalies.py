@@ -0,0 +1,227 @@
+import sqlalchemy
+import numpy as np
+import pandas as pd
+from facilities_dataloader.schema import create_table_statement, read_schema
+from facilities_dataloader.instrument import stage
+from facilities_dataloader.helper import bump_table_versions
+from facilities_dataloader.sinks import is_parquet, read_parquet, write_parquet
+from facilities_dataloader.rollups import USAGE_TABLES
+
+ANOMALY_TABLE = 'usage_anomalies'
+
+# Columns identifying the meter a series of bills belongs to. A gas account
+# can be billed for several addresses, each with its own bills.
+SERIES_COLUMNS = {'elec_usage': ['account_number'], 'ngas_usage': ['current_account_number', 'address']}
+# Compared per day of the service period, so a 35 day bill is not an outlier
+# next to 28 day ones.
+PER_DAY_METRICS = {'elec_usage': ['billed_khw'], 'ngas_usage': ['therms']}
+# Already a rate, compared as billed.
+RATE_METRICS = {'elec_usage': ['peak_kw'], 'ngas_usage': []}
+DATE_COLUMNS = ['bill_month', 'service_period_start', 'service_period_stop']
+
+# A bill is compared with the mean and standard deviation of the previous
+# BASELINE_BILLS bills of its meter, once there are MIN_BASELINE_BILLS of them,
+# and flagged when it is more than OUTLIER_SCORE deviations away.
+BASELINE_BILLS = 12
+MIN_BASELINE_BILLS = 6
+OUTLIER_SCORE = 4.0
+# Days allowed between the end of a bill and the start of the next one.
+GAP_DAYS = 1
+
+
+def scanned_columns(tablename):
+    columns = SERIES_COLUMNS[tablename] + DATE_COLUMNS + PER_DAY_METRICS[tablename] + RATE_METRICS[tablename]
+    return columns + [column for column in ['rebill', 'activity_code'] if column not in columns]
+
+
+def read_usage(engine, tablename):
+    '''
+    Reads the columns of a usage table the scan needs, those of them it has.
+
+    Parameters
+    ----------
+    engine: (sqlalchemy.engine.base.Engine or dict) Connection to database or
+            Parquet sink, see sinks.parquet_sink.
+    tablename: (string) elec_usage or ngas_usage
+
+    Returns
+    -------
+    data: (DataFrame) usage with its dates parsed
+    '''
+    columns = [column for column in scanned_columns(tablename) if column in read_schema()[tablename]['columns']]
+    if is_parquet(engine):
+        return read_parquet(engine, tablename, columns)
+    stored = {column['name'] for column in sqlalchemy.inspect(engine).get_columns(tablename)}
+    columns = [column for column in columns if column in stored]
+    data = pd.read_sql('SELECT {} FROM {}'.format(', '.join(columns), tablename), engine)
+    return parse_dates(data)
+
+
+def parse_dates(data):
+    '''
+    Converts the dates of usage read from a database to datetimes. SQLite
+    returns them as text, some with a time of day, MySQL as datetime.date.
+    '''
+    for column in DATE_COLUMNS:
+        if data[column].dtype == object:
+            data[column] = pd.to_datetime(data[column].astype(str).str[:10], errors='coerce')
+    return data
+
+
+def rolling_baseline(metrics, series):
+    '''
+    Mean and standard deviation of the previous BASELINE_BILLS bills of the
+    same meter, for every bill and metric at once. Windowed sums are taken as
+    differences of running sums within each meter, so the cost does not grow
+    with the number of meters as pandas' grouped rolling windows do. Values
+    are centered on their meter's mean first to keep the sums of squares
+    accurate.
+
+    Parameters
+    ----------
+    metrics: (DataFrame) one column per metric, bills of a meter together and
+             in service period order
+    series: (ndarray) meter of every bill, see scan_usage
+
+    Returns
+    -------
+    baseline: (DataFrame) rolling mean, missing until there are
+              MIN_BASELINE_BILLS earlier bills with a value
+    spread: (DataFrame) rolling standard deviation
+    '''
+    position = np.arange(len(series))
+    # Bills of the window of each bill, from low up to the bill itself.
+    order = pd.Series(position).groupby(series, sort=False).cumcount().to_numpy()
+    low = position - np.minimum(order, BASELINE_BILLS)
+    baseline, spread = pd.DataFrame(index=metrics.index), pd.DataFrame(index=metrics.index)
+    for column in metrics.columns:
+        values = metrics[column].astype(float)
+        center = values.groupby(series, sort=False).transform('mean')
+        centered = (values - center).to_numpy()
+        present = ~np.isnan(centered)
+        centered = np.where(present, centered, 0.0)
+        running = pd.DataFrame({'count': present.astype(float), 'sum': centered, 'squares': centered ** 2})
+        # Totals of the bills before each bill of its meter.
+        before = (running.groupby(series, sort=False).cumsum() - running).to_numpy()
+        count, total, squares = (before[position] - before[low]).T
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = total / count
+            variance = np.maximum(squares - total * mean, 0) / (count - 1)
+        enough = count >= MIN_BASELINE_BILLS
+        baseline[column] = np.where(enough, mean + center.to_numpy(), np.nan)
+        spread[column] = np.where(enough, np.sqrt(variance), np.nan)
+    return baseline, spread
+
+
+def flagged(bills, mask, flag, metric, value=np.nan, baseline=np.nan, score=np.nan):
+    rows = bills[mask]
+    return rows.assign(flag=flag, metric=metric, value=pd.Series(value, index=bills.index)[mask],
+                       baseline=pd.Series(baseline, index=bills.index)[mask],
+                       score=pd.Series(score, index=bills.index)[mask])
+
+
+def scan_usage(data, tablename):
+    '''
+    Flags the bills of a usage table that look wrong, over its whole history in
+    one grouped pass:
+
+    - outlier: a metric more than OUTLIER_SCORE standard deviations from the
+      meter's recent bills, see rolling_baseline
+    - overlap: a service period starting before the previous one ended
+    - gap: a service period starting more than GAP_DAYS after it ended
+    - rebill: a bill marked as cancelled and billed again
+
+    Parameters
+    ----------
+    data: (DataFrame) usage rows, see read_usage
+    tablename: (string) elec_usage or ngas_usage
+
+    Returns
+    -------
+    anomalies: (DataFrame) one row per flag with the columns declared for
+               usage_anomalies. value is the metric per day, or for overlaps
+               and gaps the days between the previous stop and this start.
+    '''
+    series_columns = SERIES_COLUMNS[tablename]
+    data = data.sort_values(series_columns + ['service_period_start', 'service_period_stop'], kind='stable')
+    data = data.reset_index(drop=True)
+    series = data.groupby(series_columns, sort=False, dropna=False).ngroup().to_numpy()
+
+    bills = pd.DataFrame({'source_table': tablename,
+                          'account_number': data[series_columns[0]].astype(object),
+                          'address': data['address'].astype(object) if 'address' in data.columns else np.nan,
+                          'activity_code': data['activity_code'].astype(object) if 'activity_code' in data.columns
+                                           else np.nan})
+    for column in DATE_COLUMNS:
+        bills[column] = data[column]
+
+    days = (data['service_period_stop'] - data['service_period_start']).dt.days.clip(lower=1)
+    metrics = pd.DataFrame(index=data.index)
+    for column in PER_DAY_METRICS[tablename]:
+        metrics[column] = pd.to_numeric(data[column], errors='coerce') / days
+    for column in RATE_METRICS[tablename]:
+        metrics[column] = pd.to_numeric(data[column], errors='coerce')
+    baseline, spread = rolling_baseline(metrics, series)
+    scores = (metrics - baseline) / spread.where(spread > 0)
+
+    parts = []
+    for column in metrics.columns:
+        parts.append(flagged(bills, scores[column].abs() > OUTLIER_SCORE, 'outlier', column,
+                             metrics[column], baseline[column], scores[column]))
+
+    previous_stop = data['service_period_stop'].groupby(series, sort=False).shift()
+    between = (data['service_period_start'] - previous_stop).dt.days
+    parts.append(flagged(bills, between < 0, 'overlap', 'service_period', between))
+    parts.append(flagged(bills, between > GAP_DAYS, 'gap', 'service_period', between))
+    if 'rebill' in data.columns:
+        parts.append(flagged(bills, data['rebill'].eq('Y'), 'rebill', 'rebill'))
+    columns = list(read_schema()[ANOMALY_TABLE]['columns'])
+    return pd.concat(parts, ignore_index=True)[columns]
+
+
+def refresh_anomalies(engine, tablenames=None):
+    '''
+    Scans the usage tables for anomalies and replaces their rows of
+    usage_anomalies in one transaction, so readers never see a partial scan.
+
+    Parameters
+    ----------
+    engine: (sqlalchemy.engine.base.Engine or dict) Connection to database or
+            Parquet sink, see sinks.parquet_sink.
+    tablenames: (list of strings) usage tables to scan, all of them if None
+
+    Returns
+    -------
+    anomalies: (DataFrame) rows written, see scan_usage
+    '''
+    tablenames = tablenames or USAGE_TABLES
+    if not is_parquet(engine):
+        existing = set(sqlalchemy.inspect(engine).get_table_names())
+        tablenames = [tablename for tablename in tablenames if tablename in existing]
+    with stage('scan_anomalies', tables=len(tablenames)) as record:
+        scanned = []
+        for tablename in tablenames:
+            data = read_usage(engine, tablename)
+            record['rows_in'] = (record['rows_in'] or 0) + len(data)
+            scanned.append(scan_usage(data, tablename))
+        anomalies = (pd.concat(scanned, ignore_index=True) if scanned
+                     else pd.DataFrame(columns=list(read_schema()[ANOMALY_TABLE]['columns'])))
+        record['rows_out'] = len(anomalies)
+    with stage('write_anomalies', anomalies, table=ANOMALY_TABLE):
+        if is_parquet(engine):
+            kept = read_parquet(engine, ANOMALY_TABLE)
+            kept = kept[~kept['source_table'].isin(tablenames)]
+            write_parquet(pd.concat([kept, anomalies], ignore_index=True), ANOMALY_TABLE, engine, if_exists='replace')
+        else:
+            dialect = 'sqlite' if engine.dialect.name == 'sqlite' else 'mysql'
+            with engine.begin() as connection:
+                connection.execute(sqlalchemy.text(create_table_statement(ANOMALY_TABLE, dialect=dialect)))
+                connection.execute(sqlalchemy.text('DELETE FROM {} WHERE source_table IN :tablenames'.format(
+                    ANOMALY_TABLE)).bindparams(sqlalchemy.bindparam('tablenames', expanding=True)),
+                    {'tablenames': list(tablenames)})
+                anomalies.to_sql(ANOMALY_TABLE, connection, if_exists='append', index=False, chunksize=1000)
+            bump_table_versions(ANOMALY_TABLE)
+    print('Flagged {} bills of {}:'.format(len(anomalies), ', '.join(tablenames)))
+    if len(anomalies):
+        print(anomalies.groupby(['source_table', 'flag', 'metric']).size().to_string())
+    return anomalies
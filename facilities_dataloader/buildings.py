@@ -1,11 +1,27 @@
 import math
-from facilities_dataloader.helper import read_data, create_mysql_engine, data_to_db
+from facilities_dataloader.helper import read_data, get_engine, data_to_db, compact_dtypes
+from facilities_dataloader.validation import screen
+from facilities_dataloader.rollups import refresh_after_load
+from facilities_dataloader.spatial import save_building_index
 
 CREDS = 'creds.yml'
 
-def buildings_data_to_db(filepath):
-    assert type(filepath) == str, 'Please provide a file path as a string.'
-    engine = create_mysql_engine(CREDS)
+def preprocess_buildings(filepath):
     buildings = read_data(filepath, 'buildings')
+    buildings = clean_buildings(buildings)
+    return compact_dtypes(screen(buildings, 'buildings', filepath), 'buildings')
+
+
+def clean_buildings(buildings):
     buildings = buildings.replace('NV', math.nan)
-    data_to_db(buildings, 'buildings', engine)
+    return buildings
+
+
+def buildings_data_to_db(filepath, method='default', chunksize=None, engine=None):
+    assert type(filepath) == str, 'Please provide a file path as a string.'
+    engine = engine or get_engine(CREDS)
+    buildings = preprocess_buildings(filepath)
+    stats = data_to_db(buildings, 'buildings', engine, method=method, chunksize=chunksize, skip_existing=True)
+    if stats and stats['rows']:
+        refresh_after_load(engine, 'buildings', buildings)
+        save_building_index(engine)
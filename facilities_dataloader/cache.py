@@ -0,0 +1,174 @@
+import os
+import pickle
+import hashlib
+import pandas as pd
+from os.path import join, expanduser, abspath, getsize
+
+CACHE_DIRECTORY = os.environ.get('FODB_CACHE_DIR', join(expanduser('~'), '.cache', 'facilities_db'))
+CACHE_MAX_BYTES = int(os.environ.get('FODB_CACHE_MAX_BYTES', 2 * 2**30))
+CACHE_ENABLED = os.environ.get('FODB_NO_CACHE') is None
+
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+
+def disable_cache():
+    '''
+    Turns off the parse cache for the rest of the run, e.g. for --no-cache.
+    '''
+    global CACHE_ENABLED
+    CACHE_ENABLED = False
+
+
+def cache_key(filepath, dataset, read_options):
+    '''
+    Builds the cache key of a parsed file. The key changes whenever the file is
+    modified or the options used to parse it change.
+
+    Parameters
+    ----------
+    filepath: (string) location of the file
+    dataset: (string) dataset type passed to read_data
+    read_options: (dict) keyword arguments passed to the pandas reader
+
+    Returns
+    -------
+    key: (string) hex digest identifying the parsed frame
+    '''
+    stat = os.stat(filepath)
+    identity = repr((abspath(filepath), stat.st_mtime_ns, stat.st_size, dataset, sorted(read_options.items())))
+    return hashlib.sha1(identity.encode()).hexdigest()
+
+
+def _arrow_safe(data):
+    '''
+    Checks whether a frame survives a round trip through Feather unchanged.
+    Object columns mixing strings with numbers, as spreadsheets often do, do not.
+    '''
+    return (all(type(column) == str for column in data.columns) and
+            all(pd.api.types.infer_dtype(data[column], skipna=True) in ('string', 'empty')
+                for column in data.columns if data[column].dtype == object))
+
+
+def load(key, directory=None):
+    '''
+    Reads a parsed frame from the cache. Feather files are memory-mapped.
+
+    Parameters
+    ----------
+    key: (string) cache key, see cache_key
+    directory: (string) cache directory
+
+    Returns
+    -------
+    data: (DataFrame) the cached frame, or None if it is not cached
+    '''
+    directory = directory or CACHE_DIRECTORY
+    for extension in ['.feather', '.pkl']:
+        path = join(directory, key + extension)
+        if not os.path.exists(path):
+            continue
+        try:
+            if extension == '.feather':
+                data = feather.read_table(path, memory_map=True).to_pandas()
+                # Arrow reads missing strings back as None, pandas parsers give NaN.
+                for column in data.columns[(data.dtypes == object).to_numpy()]:
+                    data[column] = data[column].where(data[column].notna(), float('nan'))
+            else:
+                with open(path, 'rb') as f:
+                    data = pickle.load(f)
+        except Exception:
+            os.remove(path)
+            return None
+        # Touching the file marks it as recently used for eviction.
+        os.utime(path)
+        return data
+    return None
+
+
+def store(key, data, directory=None, max_bytes=None):
+    '''
+    Writes a parsed frame to the cache, as Feather when pyarrow is installed and
+    the frame round trips through Arrow unchanged, otherwise as a pickle. The
+    least recently used files are evicted to keep the cache under max_bytes.
+
+    Parameters
+    ----------
+    key: (string) cache key, see cache_key
+    data: (DataFrame) parsed frame
+    directory: (string) cache directory
+    max_bytes: (int) maximum total size of the cache directory
+
+    Returns
+    -------
+    None
+    '''
+    directory = directory or CACHE_DIRECTORY
+    os.makedirs(directory, exist_ok=True)
+    use_feather = feather is not None and _arrow_safe(data)
+    path = join(directory, key + ('.feather' if use_feather else '.pkl'))
+    partial = path + '.partial'
+    if use_feather:
+        feather.write_feather(data.reset_index(drop=True), partial, compression='uncompressed')
+    else:
+        with open(partial, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(partial, path)
+    evict(directory, max_bytes)
+
+
+def evict(directory=None, max_bytes=None):
+    '''
+    Deletes the least recently used cached files until the cache fits in max_bytes.
+
+    Parameters
+    ----------
+    directory: (string) cache directory
+    max_bytes: (int) maximum total size of the cache directory
+
+    Returns
+    -------
+    None
+    '''
+    directory = directory or CACHE_DIRECTORY
+    max_bytes = max_bytes or CACHE_MAX_BYTES
+    paths = [join(directory, f) for f in os.listdir(directory) if f.endswith(('.feather', '.pkl'))]
+    paths.sort(key=lambda path: os.stat(path).st_mtime, reverse=True)
+    total = 0
+    for path in paths:
+        total += getsize(path)
+        if total > max_bytes:
+            os.remove(path)
+
+
+def cached_read(filepath, dataset, reader, read_options, use_cache=None, directory=None):
+    '''
+    Parses a file with reader, or returns the frame parsed from the same file
+    with the same options on an earlier run.
+
+    Parameters
+    ----------
+    filepath: (string) location of the file
+    dataset: (string) dataset type passed to read_data
+    reader: (function) pandas reader such as pd.read_csv
+    read_options: (dict) keyword arguments passed to reader
+    use_cache: (bool) whether to use the cache, defaults to CACHE_ENABLED
+    directory: (string) cache directory, defaults to CACHE_DIRECTORY
+
+    Returns
+    -------
+    data: (DataFrame) parsed frame
+    '''
+    if not (CACHE_ENABLED if use_cache is None else use_cache):
+        return reader(filepath, **read_options)
+    key = cache_key(filepath, dataset, read_options)
+    data = load(key, directory)
+    if data is None:
+        data = reader(filepath, **read_options)
+        try:
+            store(key, data, directory)
+        except Exception as e:
+            print('Could not cache {}: {}'.format(filepath, e))
+    return data
@@ -0,0 +1,17 @@
+'''
+Settings the command line needs before it loads anything else. Only the
+standard library may be imported here, see fodbdriver.py.
+'''
+
+# Credentials file of the MySQL database, see helper.load_credentials.
+CREDS = 'creds.yml'
+
+# How rows are sent to the database, see helper.data_to_db.
+LOAD_METHODS = ['default', 'multi', 'infile', 'upsert']
+DEFAULT_CHUNKSIZE = 1000
+
+# Chunks or files read ahead of the one being written, see streaming.run_pipeline.
+PIPELINE_DEPTH = 2
+
+# Where loads can write instead of the MySQL database of creds.yml, see sinks.open_sink.
+SINK_TYPES = ['parquet', 'sqlite']
@@ -1,5 +1,15 @@
 import math
-from facilities_dataloader.helper import read_data, create_mysql_engine, data_to_db, restore_leading_zeros
+import pandas as pd
+from facilities_dataloader.helper import (read_data, get_engine, data_to_db, compact_dtypes,
+                                          restore_leading_zeros_column, numbers_or_text,
+                                          fix_invoice_ids)
+from facilities_dataloader.schema import SOURCE_COLUMNS
+from facilities_dataloader.manifest import incremental_data_to_db
+from facilities_dataloader.accounts import stamp_buildings, update_account_index
+from facilities_dataloader.instrument import stage
+from facilities_dataloader.validation import screen
+from facilities_dataloader.rollups import refresh_after_load
+from facilities_dataloader.streaming import stream_data_to_db
 
 CREDS = 'creds.yml'
 
@@ -53,97 +63,163 @@ def preprocess_electricity(filepath):
     data: (DataFrame) cleaned and preprocessed dataframe.
     '''
     data = read_data(filepath, 'elec')
-    col_names = {'Funds': 'funds',
-                     'NonConsec?': 'nonconsec',
-                     'Discard?': 'discard',
-                     'Num': 'num',
-                     'ACCOUNTID': 'account_id',
-                     'STATEMENTNO': 'statement_number',
-                     'UDCACCTID': 'account_number',
-                     'INVOICEID': 'invoice_id',
-                     'INVOICEDATE': 'invoice_date',
-                     'SERVICE_PERIOD_START': 'service_period_start',
-                     'SERVICE_PERIOD_STOP': 'service_period_stop',
-                     'BILLEDKWH': 'billed_khw',
-                     'Peak kW': 'peak_kw',
-                     'SUPPLY CHARGES': 'supply_charges',
-                     'UDC CHARGES': 'udc_charges',
-                     'Acctnum': 'acctnum',
-                     'Cancel / Rebill?': 'rebill',
-                     'STATENUM': 'statenum',
-                     'BILL MO': 'bill_month',
-                     'ACCTG MO': 'acctg_month'}
-
-    # Ensuring that the electricity data are being loaded.
-    assert list(data.columns) == list(col_names.keys()), "Make sure column names match the columns as provided in the documentation."
-
-    # Removing records flagged for removal.
-    data = data[~data['Discard?'].isin(['Y'])]
-
-    # Renaming columns using names above.
-    data = data.rename(columns = col_names)
-
-    # Fix account number to restore dropped leading zeros and ensure it has 10 digits
-    data['account_number'] = data['account_number'].apply(lambda x: restore_leading_zeros(x, 10))
-
-    # Fix invoice id to ensure it has 10-4 digits by restoring dropped zeros
-    data['invoice_id'] = data['invoice_id'].apply(fix_invoice_id)
-
-    # Replacing instances of "Multiple Demands" with "NULL"
-    data['peak_kw'] = data['peak_kw'].apply(lambda x: math.nan if x == 'Multiple Demands' else x)
-
-    col_order = ['invoice_id',
-                 'statement_number',
-                 'account_number',
-                 'bill_month',
-                 'acctg_month',
-                 'service_period_start',
-                 'service_period_stop',
-                 'rebill',
-                 'billed_khw',
-                 'peak_kw',
-                 'supply_charges',
-                 'udc_charges']
-
-    data = data[col_order]
-    data['total_charges'] = data['supply_charges'] + data['udc_charges']
+    data = clean_electricity(data)
+    return compact_dtypes(screen(data, 'elec_usage', filepath), 'elec_usage')
+
+
+def clean_electricity(data):
+    '''
+    Clean and prepare electricity data as read from an electricity file.
+
+    Parameters
+    ----------
+    data: (DataFrame) electricity data, or a chunk of it, as read by read_data.
+
+    Returns
+    -------
+    data: (DataFrame) cleaned and preprocessed dataframe.
+    '''
+    col_names = SOURCE_COLUMNS['elec_usage']
+
+    with stage('clean_electricity.select_columns', data) as record:
+        # Ensuring that the electricity data are being loaded.
+        assert list(data.columns) == list(col_names.keys()), "Make sure column names match the columns as provided in the documentation."
+
+        # Removing records flagged for removal.
+        data = data[~data['Discard?'].isin(['Y'])]
+
+        # Renaming columns using names above.
+        data = data.rename(columns = col_names)
+        record['rows_out'] = len(data)
+
+    with stage('clean_electricity.fix_ids', data) as record:
+        # Fix account number to restore dropped leading zeros and ensure it has 10 digits
+        data['account_number'] = restore_leading_zeros_column(data['account_number'], 10)
+
+        # Fix invoice id to ensure it has 10-4 digits by restoring dropped zeros.
+        # Ids that cannot be fixed are left as they are for validation to reject.
+        data['invoice_id'], invalid_ids = fix_invoice_ids(data['invoice_id'])
+        record['rows_out'] = len(data)
+
+    with stage('clean_electricity.values', data) as record:
+        # Replacing instances of "Multiple Demands" with "NULL"
+        data['peak_kw'] = data['peak_kw'].apply(lambda x: math.nan if x == 'Multiple Demands' else x)
+        # A .csv column holding "Multiple Demands" is read as text, numbers included.
+        data['peak_kw'] = numbers_or_text(data['peak_kw'])
+
+        col_order = ['invoice_id',
+                     'statement_number',
+                     'account_number',
+                     'bill_month',
+                     'acctg_month',
+                     'service_period_start',
+                     'service_period_stop',
+                     'rebill',
+                     'billed_khw',
+                     'peak_kw',
+                     'supply_charges',
+                     'udc_charges']
+
+        data = data[col_order]
+        data['total_charges'] = data['supply_charges'] + data['udc_charges']
+        record['rows_out'] = len(data)
 
     return data
 
 
-def electricity_data_to_db(filepath):
+def electricity_data_to_db(filepath, method='default', chunksize=None, incremental=False, stream_rows=None, engine=None,
+                           pipeline_depth=None):
     '''
     Sends electricity data to a database table named elec_usage.
 
     Parameters
     ----------
     filepath: (string) filepath for file containing electricity utility data.
+    method: (string) {default, multi, infile, upsert} how rows are sent, see data_to_db.
+    chunksize: (int) number of rows per statement when method is multi or upsert.
+    incremental: (bool) skip the file if it was already loaded and only send
+                 new or changed rows, see manifest.incremental_data_to_db.
+    stream_rows: (int) read a .csv file this many rows at a time and load each
+                 chunk as it is ready, see streaming.stream_data_to_db.
+    engine: (sqlalchemy.engine.base.Engine) connection to reuse, by default
+            the shared engine for creds.yml.
+    pipeline_depth: (int) with stream_rows, read up to this many chunks ahead
+                    while the previous one is written, see streaming.run_pipeline.
 
     Returns
     -------
     None
     '''
     assert type(filepath) == str, 'Please provide a file path as a string.'
-    engine = create_mysql_engine(CREDS)
-    elec_data = preprocess_electricity(filepath)
-    data_to_db(elec_data, 'elec_usage', engine)
+    engine = engine or get_engine(CREDS)
+    if incremental:
+        incremental_data_to_db(filepath, 'elec_usage', preprocess_electricity, engine, chunksize=chunksize)
+        return None
+    if stream_rows:
+        stream_data_to_db(filepath, 'elec', clean_electricity, 'elec_usage', engine, stream_rows, method, chunksize,
+                          pipeline_depth)
+        return None
+    elec_data = stamp_buildings(preprocess_electricity(filepath), 'elec_usage', engine)
+    stats = data_to_db(elec_data, 'elec_usage', engine, method=method, chunksize=chunksize, skip_existing=True)
+    if stats and stats['rows']:
+        refresh_after_load(engine, 'elec_usage', elec_data)
+
+
+def preprocess_elec_accounts(filepath):
+    '''
+    Reads and cleans electricity accounts data so it is ready to be sent to the
+    elec_accounts table.
+
+    Parameters
+    ----------
+    filepath: (string) filepath for file containing electricity accounts data.
+
+    Returns
+    -------
+    elec_accounts: (DataFrame) deduplicated accounts with fixed account numbers
+    '''
+    elec_accounts = read_data(filepath, 'other')
+    elec_accounts = clean_elec_accounts(elec_accounts)
+    return compact_dtypes(screen(elec_accounts, 'elec_accounts', filepath), 'elec_accounts')
 
 
-def elec_accounts_to_db(filepath):
+def clean_elec_accounts(elec_accounts):
+    '''
+    Clean electricity accounts data as read from an accounts file.
+
+    Parameters
+    ----------
+    elec_accounts: (DataFrame) electricity accounts as read by read_data.
+
+    Returns
+    -------
+    elec_accounts: (DataFrame) deduplicated accounts with fixed account numbers
+    '''
+    elec_accounts = elec_accounts.drop_duplicates()
+    elec_accounts['account_number'] = restore_leading_zeros_column(elec_accounts['account_number'], 10)
+    return elec_accounts
+
+
+def elec_accounts_to_db(filepath, method='default', chunksize=None, engine=None):
     '''
     Sends electricity accounts data to database table named elec_accounts.
 
     Parameters
     ----------
     filepath: (string) filepath for file containing electricity accounts data.
+    method: (string) {default, multi, infile, upsert} how rows are sent, see data_to_db.
+    chunksize: (int) number of rows per statement when method is multi or upsert.
+    engine: (sqlalchemy.engine.base.Engine) connection to reuse, by default
+            the shared engine for creds.yml.
 
     Returns
     -------
     None
     '''
     assert type(filepath) == str, 'Please provide a file path as a string.'
-    engine = create_mysql_engine(CREDS)
-    elec_accounts = read_data(filepath, 'other')
-    elec_accounts = elec_accounts.drop_duplicates()
-    elec_accounts['account_number'] = elec_accounts['account_number'].apply(lambda x: restore_leading_zeros(x, 10))
-    data_to_db(elec_accounts, 'elec_accounts', engine)
+    engine = engine or get_engine(CREDS)
+    elec_accounts = preprocess_elec_accounts(filepath)
+    stats = data_to_db(elec_accounts, 'elec_accounts', engine, method=method, chunksize=chunksize, skip_existing=True)
+    if stats and stats['rows']:
+        update_account_index(engine, 'elec_accounts')
+        refresh_after_load(engine, 'elec_accounts', elec_accounts)
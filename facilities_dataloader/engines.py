@@ -0,0 +1,110 @@
+import os
+import atexit
+import threading
+import yaml
+import sqlalchemy
+from functools import lru_cache
+
+# Shared engines by credentials file, see get_engine.
+POOL_RECYCLE_SECONDS = 3600
+_ENGINES = {}
+_ENGINES_LOCK = threading.Lock()
+# Number of times this process wrote to each table, see bump_table_versions.
+TABLE_VERSIONS = {}
+_VERSIONS_LOCK = threading.Lock()
+
+
+@lru_cache()
+def load_credentials(creds_path):
+    '''
+    Reads a YAML credentials file. Each file is only read once per run.
+
+    Parameters
+    ----------
+    creds_path: (string) Path to YAML file containing database credentials.
+
+    Returns
+    -------
+    creds: (dict) user, pass, host, database and optionally ddl_directory
+    '''
+    assert os.path.exists(creds_path), 'Credentials file {} does not exist.'.format(creds_path)
+    with open(creds_path) as f:
+        return yaml.safe_load(f)
+
+
+def create_mysql_engine(creds_path, pool_size=5):
+    '''
+    Create engine to connect to a database.
+
+    Parameters
+    ----------
+    creds_path: (string) Path to YAML file containing database credentials.
+    pool_size: (int) number of connections kept open, enough for every thread
+               that shares the engine to hold one.
+
+    Returns
+    -------
+    engine: (sqlalchemy.engine.base.Engine) Engine used to establish connection
+    '''
+    creds = load_credentials(creds_path)
+    user, password, host, database = creds['user'], creds['pass'], creds['host'], creds['database']
+    engine = sqlalchemy.create_engine('mysql+mysqlconnector://{}:{}@{}/{}'.format(user, password, host, database),
+                                      connect_args={'allow_local_infile': True},
+                                      pool_size=pool_size,
+                                      pool_pre_ping=True,
+                                      pool_recycle=POOL_RECYCLE_SECONDS)
+    return engine
+
+
+def get_engine(creds_path, pool_size=5):
+    '''
+    Returns the engine shared by everything that connects with the same
+    credentials file, creating it on first use. Its connection pool is reused
+    across loaders and disposed of when the process exits.
+
+    Parameters
+    ----------
+    creds_path: (string) Path to YAML file containing database credentials.
+    pool_size: (int) number of connections kept open, only used by the call
+               that creates the engine.
+
+    Returns
+    -------
+    engine: (sqlalchemy.engine.base.Engine) Engine used to establish connection
+    '''
+    key = os.path.abspath(creds_path)
+    with _ENGINES_LOCK:
+        if key not in _ENGINES:
+            _ENGINES[key] = create_mysql_engine(creds_path, pool_size)
+        return _ENGINES[key]
+
+
+def dispose_engines():
+    '''
+    Closes the pooled connections of every shared engine, see get_engine.
+    '''
+    with _ENGINES_LOCK:
+        for engine in _ENGINES.values():
+            engine.dispose()
+        _ENGINES.clear()
+
+
+atexit.register(dispose_engines)
+
+
+def bump_table_versions(*tablenames):
+    '''
+    Records a write to tables, so results read from them before, such as the
+    cached results of the query module, are known to be out of date.
+    '''
+    with _VERSIONS_LOCK:
+        for tablename in tablenames:
+            TABLE_VERSIONS[tablename] = TABLE_VERSIONS.get(tablename, 0) + 1
+
+
+def table_versions(tablenames):
+    '''
+    Returns the number of writes this process made to each table, see bump_table_versions.
+    '''
+    with _VERSIONS_LOCK:
+        return tuple(TABLE_VERSIONS.get(tablename, 0) for tablename in tablenames)
@@ -1,61 +1,479 @@
 import os
 import math
-import yaml
+import time
+import sqlite3
+import tempfile
 import sqlalchemy
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from mysql.connector.errors import IntegrityError
+from facilities_dataloader.cache import cached_read
+from facilities_dataloader.defaults import LOAD_METHODS, DEFAULT_CHUNKSIZE
+from facilities_dataloader.engines import (load_credentials, create_mysql_engine, get_engine, dispose_engines,
+                                           bump_table_versions, table_versions)
+from facilities_dataloader.instrument import stage
+from facilities_dataloader.schema import (primary_key, column_types, create_table_statement, read_schema, table_dtypes,
+                                          sqlalchemy_types, read_dtypes, date_columns, SOURCE_COLUMNS)
+from facilities_dataloader.sinks import is_parquet, write_parquet, read_parquet
+from facilities_dataloader.table_manager import stored_primary_key
 
-def read_data(filepath, dataset, sep=','):
+# Used to change the data type of the columns specified below when reading:
+# the text columns of each dataset's table are read as text, see schema.read_dtypes.
+READ_DTYPES = {'elec': read_dtypes('elec_usage', SOURCE_COLUMNS['elec_usage']),
+               'gas_accounts': read_dtypes('ngas_accounts'),
+               'buildings': read_dtypes('buildings'),
+               'other': {'account_no': str}}
+READ_DATE_COLUMNS = {'gas_accounts': date_columns('ngas_accounts')}
+
+SQLITE_MAX_VARIABLES = 32766 if sqlite3.sqlite_version_info >= (3, 32) else 999
+# Date column bounding the existing keys a batch can collide with, see
+# existing_key_hashes. Monthly exports only overlap loaded bills near their dates.
+KEY_RANGE_COLUMNS = {'elec_usage': 'bill_month', 'ngas_usage': 'service_period_start'}
+
+
+
+def read_options_for(dataset):
+    '''
+    Builds the pandas reader options that fix the column types of a dataset.
+
+    Parameters
+    ----------
+    dataset: (string) {elec, gas_accounts, buildings, other} String indicating which dataset is being read.
+
+    Returns
+    -------
+    read_options: (dict) keyword arguments for pd.read_csv or pd.read_excel
+    '''
+    read_options = {'dtype': READ_DTYPES[dataset]}
+    if READ_DATE_COLUMNS.get(dataset):
+        read_options['parse_dates'] = READ_DATE_COLUMNS[dataset]
+    return read_options
+
+
+def read_data(filepath, dataset, sep=',', use_cache=None):
     '''
     Reads data from excel file into a DataFrame and fixes data column types.
+    Parsed files are cached on disk, so reading the same unchanged file again
+    skips parsing it.
 
     Parameters
     ----------
     filepath: (string) Filepath for the excel document containing the desired data.
+    dataset: (string) {elec, gas_accounts, buildings, other} String indicating which dataset is being read.
+    sep: (string) Field separator for .csv files.
+    use_cache: (bool) Whether to use the parse cache, see cache.cached_read.
+
+    Returns
+    -------
+    data: (DataFrame) Data read from the file.
+    '''
+    assert type(filepath) == str, "You must provide the filepath as a string."
+    assert os.path.exists(filepath) == 1, "File does not exist."
+    read_options = read_options_for(dataset)
+    with stage('read_data', file=filepath, dataset=dataset) as record:
+        if '.csv' in filepath:
+            read_options['sep'] = sep
+            data = cached_read(filepath, dataset, pd.read_csv, read_options, use_cache)
+        else:
+            data = cached_read(filepath, dataset, pd.read_excel, read_options, use_cache)
+        record['rows_out'] = len(data)
+
+    return data
+
+
+def read_data_chunks(filepath, dataset, rows, sep=','):
+    '''
+    Reads a .csv file a chunk of rows at a time, so only one chunk is held in
+    memory. Chunks are not cached.
+
+    Parameters
+    ----------
+    filepath: (string) Filepath for the .csv file containing the desired data.
+    dataset: (string) {elec, gas_accounts, buildings, other} String indicating which dataset is being read.
+    rows: (int) Number of rows per chunk.
+    sep: (string) Field separator.
 
     Returns
     -------
-    dataset: (string) {elec, gas} String indicating which dataset is being read.
+    chunks: (iterator of DataFrames) the file's rows, rows at a time
     '''
-    # Used to change the data type of the columns specified below
-    col_types = {'elec': {'STATEMENTNO': str},
-                 'gas_accounts':  {'install_date': pd.to_datetime,
-                                    'ert_install_date': pd.to_datetime},
-                 'buildings': {'zipcode': str,
-                               'nrel_bca_leed_analysis': str,
-                               'nrel_renewable_reopt_analysis': str,
-                               'retrocommision': str,
-                               'energy_assessment': str,
-                               'gr_sq_ft_location2': str},
-                 'other': {'account_no': str}}
     assert type(filepath) == str, "You must provide the filepath as a string."
     assert os.path.exists(filepath) == 1, "File does not exist."
-    if '.csv' in filepath:
-        data = pd.read_csv(filepath, converters=col_types[dataset], sep=sep)
+    assert '.csv' in filepath, "Only .csv files can be read in chunks."
+    return pd.read_csv(filepath, chunksize=rows, sep=sep, **read_options_for(dataset))
+
+
+def compact_column(values, dtype):
+    '''
+    Converts a column to a compact dtype, see schema.SQL_TYPES. Values the
+    dtype cannot hold, such as text in a BOOLEAN column, leave the column as
+    it was rather than be lost.
+
+    Parameters
+    ----------
+    values: (Series) column of a cleaned frame
+    dtype: (string) pandas dtype name from schema.table_dtypes
+
+    Returns
+    -------
+    values: (Series) the column, converted if it could be
+    '''
+    if dtype.startswith('datetime'):
+        converted = pd.to_datetime(values, errors='coerce')
+    elif dtype in ['category', 'string[pyarrow]']:
+        text = values.astype(object)
+        text = text.where(text.isna(), text.astype(str))
+        # Text that repeats, like account numbers on monthly bills, is held
+        # once per distinct value.
+        if dtype == 'category' or text.nunique() <= len(text) / 2:
+            return text.astype('category')
+        return text.astype(dtype)
     else:
-        data = pd.read_excel(filepath, converters=col_types[dataset])
+        converted = pd.to_numeric(values, errors='coerce')
+        try:
+            converted = converted.astype(dtype)
+        except (TypeError, ValueError):
+            # Fractions in an INT column, kept as they are for the database to round.
+            return values
+    if (converted.isna() & values.notna()).any():
+        return values
+    return converted
+
+
+def compact_dtypes(data, tablename):
+    '''
+    Converts the columns of a cleaned frame to the compact dtypes declared
+    for its table, see schema.table_dtypes, and records the memory saved.
+
+    Parameters
+    ----------
+    data: (DataFrame) cleaned rows of tablename
+    tablename: (string) name of the table as declared in the ddl files
+
+    Returns
+    -------
+    data: (DataFrame) copy of data with compact column types
+    '''
+    dtypes = table_dtypes(tablename)
+    with stage('compact_dtypes', data, table=tablename) as record:
+        record['mb_before'] = data.memory_usage(index=False, deep=True).sum() / 2**20
+        data = data.copy()
+        for column in data.columns:
+            if column in dtypes:
+                data[column] = compact_column(data[column], dtypes[column])
+        record['mb_after'] = data.memory_usage(index=False, deep=True).sum() / 2**20
+        record['rows_out'] = len(data)
+    return data
+
+
+def memory_report(frames):
+    '''
+    Prints and returns the memory each table's rows take as cleaned and with
+    compact dtypes, see compact_dtypes.
+
+    Parameters
+    ----------
+    frames: (dict) table name -> cleaned DataFrame, with the dtypes cleaning left
+
+    Returns
+    -------
+    report: (DataFrame) table, rows, mb_before, mb_after and ratio, one row per table
+    '''
+    rows = []
+    for tablename, data in frames.items():
+        before = data.memory_usage(index=False, deep=True).sum() / 2**20
+        after = compact_dtypes(data, tablename).memory_usage(index=False, deep=True).sum() / 2**20
+        rows.append({'table': tablename, 'rows': len(data), 'mb_before': before, 'mb_after': after,
+                     'ratio': before / after if after else math.inf})
+    report = pd.DataFrame(rows, columns=['table', 'rows', 'mb_before', 'mb_after', 'ratio'])
+    print(report.to_string(index=False, float_format='{:.2f}'.format))
+    return report
+
+
+def load_data_infile(data, tablename, engine):
+    '''
+    Bulk loads a DataFrame into a MySQL table by writing it to a temporary CSV
+    file and issuing LOAD DATA LOCAL INFILE, a single statement for the whole
+    frame instead of one round trip per row.
+
+    Parameters
+    ----------
+    data: (DataFrame) DataFrame containing the data to load.
+    tablename: (string) Name of the table to load data into.
+    engine: (sqlalchemy.engine.base.Engine) Connection to a MySQL database.
+
+    Returns
+    -------
+    None
+    '''
+    assert engine.dialect.name == 'mysql', "LOAD DATA INFILE is only supported by MySQL."
+    data = data.copy()
+    for column in data.columns:
+        if isinstance(data[column].dtype, (pd.CategoricalDtype, pd.StringDtype)):
+            data[column] = data[column].astype(object)
+        if data[column].dtype in [bool, 'boolean']:
+            data[column] = data[column].astype('Int8')
+        elif data[column].dtype == object:
+            # Backslash is the escape character for LOAD DATA.
+            data[column] = data[column].map(lambda x: x.replace('\\', '\\\\') if type(x) == str else x)
+
+    csv_file = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False)
+    try:
+        data.to_csv(csv_file, index=False, header=False, na_rep='\\N', lineterminator='\n')
+        csv_file.close()
+        statement = """LOAD DATA LOCAL INFILE '{}' INTO TABLE {}
+                       FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"'
+                       LINES TERMINATED BY '\\n' ({})""".format(csv_file.name.replace("'", "\\'"), tablename,
+                                                               ', '.join(data.columns))
+        with engine.begin() as connection:
+            connection.exec_driver_sql(statement)
+    finally:
+        csv_file.close()
+        os.remove(csv_file.name)
+
+
+def comparable(data, tablename):
+    '''
+    Casts columns to the types the database stores them as, so values read back
+    from a table compare equal to the values that were written. FLOAT columns
+    are single precision in MySQL, for example.
+
+    Parameters
+    ----------
+    data: (DataFrame) data destined for, or read from, tablename
+    tablename: (string) name of the table as declared in the ddl files
 
+    Returns
+    -------
+    data: (DataFrame) copy of data with normalized column types
+    '''
+    types = column_types(tablename)
+    data = data.copy()
+    for column in data.columns:
+        sql_type = types.get(column)
+        if sql_type == 'DATE' and data[column].dtype == object:
+            # SQLite returns dates as text, with a time of day when pandas
+            # wrote them, and a column can hold both forms.
+            values = data[column]
+            data[column] = pd.to_datetime(values.astype(str).str[:10].where(values.notna()), errors='coerce')
+        elif sql_type in ['DATE', 'DATETIME', 'TIMESTAMP']:
+            # Dates read back from Parquet come in ms, hashes need one unit.
+            data[column] = pd.to_datetime(data[column], errors='coerce').astype('datetime64[ns]')
+        elif sql_type == 'FLOAT':
+            data[column] = pd.to_numeric(data[column], errors='coerce').astype('float32')
+        elif sql_type in ['DOUBLE', 'DECIMAL']:
+            data[column] = pd.to_numeric(data[column], errors='coerce').astype('float64')
+        elif sql_type in ['INT', 'INTEGER', 'SMALLINT', 'BIGINT', 'BOOL', 'BOOLEAN']:
+            data[column] = pd.to_numeric(data[column], errors='coerce')
+        else:
+            values = data[column].astype(object)
+            data[column] = values.where(values.isna(), values.astype(str))
     return data
 
 
-def create_mysql_engine(creds_path):
+def fetch_existing_rows(data, tablename, engine, key, chunksize=500):
+    '''
+    Reads the rows of a table that may share a primary key with data, selecting
+    on the first key column in batches.
+
+    Parameters
+    ----------
+    data: (DataFrame) new data with the key columns
+    tablename: (string) name of the table to read from
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+    key: (list of strings) primary key columns
+    chunksize: (int) number of key values per SELECT
+
+    Returns
+    -------
+    existing: (DataFrame) rows of tablename matching the first key column
+    '''
+    values = data[key[0]].dropna().unique().tolist()
+    statement = sqlalchemy.text('SELECT * FROM {} WHERE {} IN :values'.format(tablename, key[0]))
+    statement = statement.bindparams(sqlalchemy.bindparam('values', expanding=True))
+    chunks = []
+    with engine.connect() as connection:
+        for start in range(0, len(values), chunksize):
+            chunks.append(pd.read_sql(statement, connection,
+                                      params={'values': values[start:start + chunksize]}))
+    if not chunks:
+        return pd.DataFrame(columns=data.columns)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def key_hashes(data, tablename, key):
+    '''
+    Hashes the primary key of every row after casting it to the types the
+    database stores, so a key read back from the table hashes the same.
+
+    Parameters
+    ----------
+    data: (DataFrame) rows with the key columns
+    tablename: (string) name of the table as declared in the ddl files
+    key: (list of strings) primary key columns
+
+    Returns
+    -------
+    hashes: (ndarray of uint64) hash of each row's key
+    '''
+    return pd.util.hash_pandas_object(comparable(data[key], tablename), index=False).to_numpy()
+
+
+def existing_key_hashes(data, tablename, engine, key, chunksize=100000):
     '''
-    Create engine to connect to a database.
+    Reads the keys already in a table that could collide with data in one bulk
+    query, limited to the dates data covers when the table has a date range
+    column, see KEY_RANGE_COLUMNS. Keys are kept only as 64 bit hashes.
 
     Parameters
     ----------
-    creds_path: (string) Path to YAML file containing database credentials.
+    data: (DataFrame) new rows with the key columns
+    tablename: (string) name of the table as declared in the ddl files
+    engine: (sqlalchemy.engine.base.Engine) Connection to database, or a
+            Parquet sink, see sinks.parquet_sink.
+    key: (list of strings) primary key columns
+    chunksize: (int) number of keys read at a time
 
     Returns
     -------
-    engine: (sqlalchemy.engine.base.Engine) Engine used to establish connection
+    hashes: (ndarray of uint64) hashes of the existing keys, see key_hashes
     '''
-    creds = yaml.load(open(creds_path))
-    user, password, host, database = creds['user'], creds['pass'], creds['host'], creds['database']
-    engine = sqlalchemy.create_engine('mysql+mysqlconnector://{}:{}@{}/{}'.format(user, password, host, database))
-    return engine
+    params = {}
+    column = KEY_RANGE_COLUMNS.get(tablename)
+    dates = pd.to_datetime(data[column], errors='coerce') if column in data.columns else None
+    if dates is not None and len(dates) and dates.notna().all():
+        # Dates as YYYY-MM-DD with an exclusive upper bound compare correctly
+        # with DATE columns and with dates SQLite stores as text.
+        params = {'low': dates.min().strftime('%Y-%m-%d'),
+                  'high': (dates.max() + pd.Timedelta(days=1)).strftime('%Y-%m-%d')}
+    if is_parquet(engine):
+        existing = read_parquet(engine, tablename, key, params.get('low'), params.get('high'), by=column)
+        return key_hashes(existing, tablename, key) if len(existing) else np.empty(0, dtype=np.uint64)
+    if not sqlalchemy.inspect(engine).has_table(tablename):
+        return np.empty(0, dtype=np.uint64)
+    statement = 'SELECT {} FROM {}'.format(', '.join(key), tablename)
+    if params:
+        statement += ' WHERE {0} >= :low AND {0} < :high'.format(column)
+    hashes = []
+    with engine.connect() as connection:
+        for chunk in pd.read_sql(sqlalchemy.text(statement), connection, params=params, chunksize=chunksize):
+            hashes.append(key_hashes(chunk, tablename, key))
+    return np.concatenate(hashes) if hashes else np.empty(0, dtype=np.uint64)
+
+
+def drop_existing_rows(data, tablename, engine):
+    '''
+    Anti-joins new rows against the keys already in a table, so only rows that
+    would not collide with the primary key are sent.
+
+    Parameters
+    ----------
+    data: (DataFrame) new rows
+    tablename: (string) name of the table as declared in the ddl files
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
 
-def data_to_db(data, tablename, engine, if_exists='append'):
+    Returns
+    -------
+    data: (DataFrame) rows whose key is not in the table yet
+    skipped: (int) number of rows dropped
+    '''
+    key = stored_primary_key(engine, tablename)
+    existing = existing_key_hashes(data, tablename, engine, key)
+    if not len(existing) or data.empty:
+        return data, 0
+    in_table = np.isin(key_hashes(data, tablename, key), existing)
+    return data[~in_table], int(in_table.sum())
+
+
+def classify_rows(data, existing, tablename, key):
+    '''
+    Compares new rows with the rows already in a table.
+
+    Parameters
+    ----------
+    data: (DataFrame) new data
+    existing: (DataFrame) rows already in the table, see fetch_existing_rows
+    tablename: (string) name of the table as declared in the ddl files
+    key: (list of strings) primary key columns
+
+    Returns
+    -------
+    status: (Series) 'inserted', 'updated' or 'unchanged' for each row of data
+    '''
+    new = comparable(data, tablename).reset_index(drop=True)
+    old = comparable(existing[[column for column in data.columns if column in existing.columns]], tablename)
+    old = old.drop_duplicates(subset=key)
+    merged = new.merge(old, on=key, how='left', suffixes=('', '_existing'), indicator=True)
+
+    changed = pd.Series(False, index=merged.index)
+    for column in old.columns:
+        if column in key:
+            continue
+        new_values, old_values = merged[column], merged[column + '_existing']
+        same = (new_values == old_values) | (new_values.isna() & old_values.isna())
+        changed |= ~same
+
+    status = pd.Series('unchanged', index=merged.index)
+    status[changed] = 'updated'
+    status[merged['_merge'] == 'left_only'] = 'inserted'
+    status.index = data.index
+    return status
+
+
+def upsert_data(data, tablename, engine, chunksize=None):
+    '''
+    Inserts new rows and updates changed rows of a table, matching rows on the
+    primary key of the table, see table_manager.stored_primary_key. Rows that are already in the table
+    unchanged are not sent at all.
+
+    Parameters
+    ----------
+    data: (DataFrame) DataFrame containing the data to load.
+    tablename: (string) Name of the table to load data into.
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+    chunksize: (int) Number of rows per statement.
+
+    Returns
+    -------
+    counts: (dict) Number of rows inserted, updated and unchanged.
+    '''
+    key = stored_primary_key(engine, tablename)
+    if not sqlalchemy.inspect(engine).has_table(tablename):
+        # Created from the ddl so that the primary key exists to upsert on.
+        with engine.begin() as connection:
+            connection.execute(sqlalchemy.text(create_table_statement(tablename, dialect=engine.dialect.name)))
+
+    existing = fetch_existing_rows(data, tablename, engine, key)
+    status = classify_rows(data, existing, tablename, key)
+    counts = {name: int((status == name).sum()) for name in ['inserted', 'updated', 'unchanged']}
+
+    changed = data[status != 'unchanged']
+    records = changed.astype(object).where(changed.notna(), None).to_dict('records')
+    if not records:
+        return counts
+
+    table = sqlalchemy.Table(tablename, sqlalchemy.MetaData(), autoload_with=engine)
+    updates = [column for column in changed.columns if column not in key]
+    if engine.dialect.name == 'mysql':
+        statement = mysql_insert(table)
+        statement = statement.on_duplicate_key_update({column: statement.inserted[column] for column in updates})
+    else:
+        statement = sqlite_insert(table)
+        statement = statement.on_conflict_do_update(index_elements=key,
+                                                    set_={column: statement.excluded[column] for column in updates})
+
+    chunksize = chunksize or DEFAULT_CHUNKSIZE
+    with engine.begin() as connection:
+        for start in range(0, len(records), chunksize):
+            connection.execute(statement, records[start:start + chunksize])
+    return counts
+
+
+def data_to_db(data, tablename, engine, if_exists='append', method='default', chunksize=None, skip_existing=False):
     '''
     Append usage data to the appropriate database table.
 
@@ -63,21 +481,111 @@ def data_to_db(data, tablename, engine, if_exists='append'):
     ----------
     data: (DataFrame) DataFrame containing new usage data to append.
     tablename: (string) Name of the table to append data to.
-    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+    engine: (sqlalchemy.engine.base.Engine) Connection to database, or a
+            Parquet sink to write the table's dataset to instead, see
+            sinks.parquet_sink. Parquet datasets are written in batches
+            whatever the method, and cannot be upserted.
     if_exists: (string) If the table already exists, the new data will be appended to the existing table.
+    method: (string) {default, multi, infile, upsert} How rows are sent to the
+            database. default sends one row per statement, multi sends chunksize
+            rows per INSERT and infile uses LOAD DATA LOCAL INFILE on MySQL,
+            falling back to multi on other databases such as SQLite. upsert
+            inserts new rows and updates changed ones by primary key, so a
+            batch overlapping rows already in the table still loads.
+    chunksize: (int) Number of rows per INSERT when method is multi or upsert.
+    skip_existing: (bool) Leave out rows whose primary key is already in the
+                   table instead of failing the load on them, see drop_existing_rows.
+                   Not used with upsert, which updates those rows.
 
     Returns
     -------
-    message: (string) String verifying that there are more rows in table.
+    stats: (dict) Number of rows loaded, seconds taken and rows per second, plus
+           rows skipped as already loaded when skip_existing is set and rows
+           inserted, updated and unchanged for upserts. None if the load failed.
     '''
-    assert type(engine) == sqlalchemy.engine.base.Engine, "Make sure to provide engine."
+    assert type(engine) == sqlalchemy.engine.base.Engine or is_parquet(engine), "Make sure to provide engine."
     assert type(data) == pd.core.frame.DataFrame, "Input a DataFrame, not a {}".format(type(data))
     assert type(tablename) == str, "Tablename must be a string, not a {}.".format(type(tablename))
+    assert method in LOAD_METHODS, "Method must be one of {}, not {}.".format(LOAD_METHODS, method)
+    if is_parquet(engine):
+        assert method != 'upsert', "Parquet datasets can only be appended to, not upserted."
+        method = 'parquet'
+    elif method == 'upsert':
+        assert engine.dialect.name in ['mysql', 'sqlite'], \
+            "Upserts need a MySQL or SQLite database, not {}.".format(engine.dialect.name)
+    elif method == 'infile' and engine.dialect.name != 'mysql':
+        method = 'multi'
+    if method == 'multi':
+        chunksize = chunksize or DEFAULT_CHUNKSIZE
+        if engine.dialect.name == 'sqlite':
+            # SQLite limits the number of parameters in a single statement.
+            chunksize = min(chunksize, SQLITE_MAX_VARIABLES // max(len(data.columns), 1))
+
+    skipped = None
+    if skip_existing and method != 'upsert':
+        with stage('drop_existing_rows', data, table=tablename) as record:
+            total = len(data)
+            data, skipped = drop_existing_rows(data, tablename, engine)
+            record['rows_out'] = len(data)
+        if skipped:
+            print('Skipping {} of {} rows already in {}.'.format(skipped, total, tablename))
+
+    start = time.perf_counter()
     try:
-        data.to_sql(tablename, engine, if_exists='append', index=False)
+        with stage('data_to_db', data, table=tablename, method=method) as record:
+            if method == 'parquet':
+                write_parquet(data, tablename, engine, if_exists)
+            elif method == 'infile':
+                load_data_infile(data, tablename, engine)
+            elif method == 'upsert':
+                counts = upsert_data(data, tablename, engine, chunksize)
+            else:
+                # Declared types for to_sql to create the table with. Only
+                # then, as SQLAlchemy checks values against them on insert.
+                dtype = None
+                if tablename in read_schema() and not sqlalchemy.inspect(engine).has_table(tablename):
+                    dtype = sqlalchemy_types(tablename)
+                data.to_sql(tablename, engine, if_exists=if_exists, index=False, dtype=dtype,
+                            method='multi' if method == 'multi' else None, chunksize=chunksize)
+            record['rows_out'] = len(data)
     except Exception as e:
-        print(str(e).split('[SQL')[0])
-    return None
+        # The stage record keeps the full error, see instrument.stage.
+        print('Failed to load {} rows into {}, none of them were loaded: {}'.format(len(data), tablename,
+                                                                                 str(e).split('[SQL')[0]))
+        return None
+    seconds = time.perf_counter() - start
+    bump_table_versions(tablename)
+
+    stats = {'rows': len(data),
+             'seconds': seconds,
+             'rows_per_sec': len(data) / seconds if seconds else math.inf}
+    print('Loaded {rows} rows into {table} in {seconds:.2f}s ({rows_per_sec:.0f} rows/sec).'.format(table=tablename, **stats))
+    if skipped is not None:
+        stats['skipped'] = skipped
+    if method == 'upsert':
+        stats.update(counts)
+        print('{inserted} inserted, {updated} updated, {unchanged} unchanged.'.format(**counts))
+    return stats
+
+
+def numbers_or_text(values):
+    '''
+    Converts a column read as text to numbers. Values that are not numbers are
+    left as they are for validation to reject, see validation.is_number.
+
+    Parameters
+    ----------
+    values: (Series) column holding numbers, possibly as text
+
+    Returns
+    -------
+    values: (Series) numeric column, or an object column mixing numbers and
+            the values that could not be converted
+    '''
+    numbers = pd.to_numeric(values, errors='coerce')
+    if (numbers.isna() & values.notna()).any():
+        return numbers.astype(object).where(numbers.notna(), values)
+    return numbers
 
 
 def restore_leading_zeros(number, n):
@@ -101,3 +609,193 @@ def restore_leading_zeros(number, n):
             number = '0' + number
 
     return number
+
+
+def _fix_each_distinct(values, fix):
+    '''
+    Applies fix once per distinct id instead of once per row, since account
+    numbers repeat on every monthly bill. Only all-string or all-integer columns
+    are factorized, since mixed columns could merge values like 1 and 1.0 that
+    the fixers treat differently.
+
+    Parameters
+    ----------
+    values: (ndarray) object array of ids
+    fix: (function) takes an object array of ids and returns a tuple of arrays
+         of the same length
+
+    Returns
+    -------
+    results: (tuple of ndarrays) the output of fix expanded back to every row
+    '''
+    if pd.api.types.infer_dtype(values, skipna=True) not in ('string', 'integer'):
+        return fix(values)
+    # Factorizing costs more than it saves when ids are mostly unique, so
+    # estimate the number of distinct ids from duplicate pairs in a sample.
+    sample = values[::max(len(values) // 10000, 1)]
+    sample = sample[pd.notna(sample)]
+    duplicates = len(sample) - len(pd.unique(sample))
+    if duplicates == 0 or len(sample)**2 / (2 * duplicates) > len(values) / 2:
+        return fix(values)
+    codes, uniques = pd.factorize(values)
+    missing = codes == -1
+    results = []
+    for distinct, missing_result in zip(fix(np.asarray(uniques, dtype=object)), fix(values[missing])):
+        result = np.empty(len(values), dtype=object)
+        result[~missing] = distinct[codes[~missing]]
+        result[missing] = missing_result
+        results.append(result)
+    return tuple(results)
+
+
+def _types_of(values):
+    '''
+    Flags which ids are floats (missing) and which are strings.
+
+    Parameters
+    ----------
+    values: (ndarray) object array of ids
+
+    Returns
+    -------
+    is_float: (ndarray of bool) rows holding a float, treated as missing
+    is_str: (ndarray of bool) rows holding a string
+    '''
+    if pd.api.types.infer_dtype(values, skipna=True) in ('string', 'empty'):
+        # Only missing values can be something other than strings.
+        is_str = pd.notna(values)
+        is_float = ~is_str
+        is_float[is_float] = [type(value) == float for value in values[is_float]]
+        return is_float, is_str
+    types = pd.Series(values, dtype=object).map(type).to_numpy()
+    return types == float, types == str
+
+
+def restore_leading_zeros_column(numbers, n):
+    '''
+    Vectorized restore_leading_zeros. Fixes a whole column of numbers that lost
+    their leading zeros until each has n digits.
+
+    Parameters
+    ----------
+    numbers: (Series) numbers that lost leading zeros
+    n: (int) number of digits final numbers should have
+
+    Returns
+    -------
+    numbers: (Series) numbers with n digits and leading zeros restored
+    '''
+    def fix(values):
+        is_float, _ = _types_of(values)
+        strings = pa.array([str(value) for value in values], type=pa.string())
+        fixed = pc.utf8_lpad(strings, width=n, padding='0').to_numpy(zero_copy_only=False).astype(object)
+        fixed[is_float] = math.nan
+        return (fixed,)
+
+    fixed, = _fix_each_distinct(numbers.to_numpy(dtype=object), fix)
+    return pd.Series(fixed, index=numbers.index, name=numbers.name)
+
+
+def fix_hyphenated_ids(ids, head_width, tail_width, suffix_tail_width=None,
+                       require_tail=False):
+    '''
+    Restores dropped leading zeros in ids of the form head-tail for a whole
+    column at once. Ids that cannot be fixed are left untouched and collected
+    into a report instead of raising on the first one.
+
+    Parameters
+    ----------
+    ids: (Series) ids without leading zeros
+    head_width: (int) number of characters the part before the hyphen should have
+    tail_width: (int) number of characters the part after the hyphen should have
+    suffix_tail_width: (int) tail width used when the tail ends in R, C or Z
+    require_tail: (bool) whether an empty tail makes the id invalid
+
+    Returns
+    -------
+    fixed: (Series) ids with restored zeros, math.nan where ids were missing
+    invalid: (DataFrame) invalid ids with the reason each one was rejected
+    '''
+    max_tail_width = max(tail_width, suffix_tail_width or 0)
+
+    def fix(values):
+        is_float, is_str = _types_of(values)
+        strings = pc.fill_null(pa.array(values, type=pa.string(), mask=~is_str), '')
+
+        # Split into at most head, tail and everything after a second hyphen.
+        parts = pc.split_pattern(strings, '-', max_splits=2)
+        if len(parts) and pc.min_max(pc.list_value_length(parts)).as_py() == {'min': 2, 'max': 2}:
+            # Common case, every id has exactly one hyphen.
+            head = pc.list_element(parts, 0)
+            tail = pc.list_element(parts, 1)
+            has_hyphen = np.ones(len(values), dtype=bool)
+            rest = ''
+        else:
+            parts = pc.list_slice(parts, 0, 3, return_fixed_size_list=True)
+            head = pc.list_element(parts, 0)
+            tail = pc.list_element(parts, 1)
+            rest = pc.list_element(parts, 2)
+            has_hyphen = pc.is_valid(tail).to_numpy(zero_copy_only=False)
+            tail = pc.fill_null(tail, '')
+            rest = pc.if_else(pc.is_valid(rest), pc.binary_join_element_wise('-', pc.fill_null(rest, ''), ''), '')
+
+        padded_head = pc.utf8_lpad(head, width=head_width, padding='0')
+        padded_tail = pc.utf8_lpad(tail, width=tail_width, padding='0')
+        if suffix_tail_width is not None:
+            has_suffix = pc.or_(pc.or_(pc.ends_with(tail, 'R'), pc.ends_with(tail, 'C')), pc.ends_with(tail, 'Z'))
+            padded_tail = pc.if_else(has_suffix, pc.utf8_lpad(tail, width=suffix_tail_width, padding='0'), padded_tail)
+        fixed = pc.binary_join_element_wise(padded_head, '-', padded_tail, rest, '')
+
+        # The first failed check is the reason reported for an id.
+        checks = [(~is_str, 'not a string'),
+                  (~has_hyphen, "missing '-' character"),
+                  (require_tail & (pc.utf8_length(tail).to_numpy() == 0), 'nothing after hyphen'),
+                  (pc.utf8_length(head).to_numpy() > head_width, 'too many characters before hyphen'),
+                  (pc.utf8_length(padded_tail).to_numpy() > max_tail_width, 'too many characters after hyphen')]
+        reasons = np.select([failed for failed, _ in checks], [reason for _, reason in checks], None)
+        reasons[is_float] = None
+
+        fixed = np.where(pd.isna(reasons), fixed.to_numpy(zero_copy_only=False), values)
+        fixed[is_float] = math.nan
+        return fixed, reasons
+
+    values = ids.to_numpy(dtype=object)
+    fixed, reasons = _fix_each_distinct(values, fix)
+    is_invalid = pd.notna(reasons)
+    invalid = pd.DataFrame({'id': values[is_invalid], 'reason': reasons[is_invalid]},
+                           index=ids.index[is_invalid])
+
+    return pd.Series(fixed, index=ids.index, name=ids.name), invalid
+
+
+def fix_invoice_ids(invoice_ids):
+    '''
+    Vectorized fix_invoice_id. Invoice ids must be 10-4 characters, or 10-5 when
+    the part after the hyphen ends in R, C or Z.
+
+    Parameters
+    ----------
+    invoice_ids: (Series) invoice ids without leading zeros
+
+    Returns
+    -------
+    fixed: (Series) reformatted invoice ids with restored zeros
+    invalid: (DataFrame) invoice ids that could not be fixed and why
+    '''
+    return fix_hyphenated_ids(invoice_ids, 10, 4, suffix_tail_width=5, require_tail=True)
+
+
+def fix_new_account_nmbrs(acct_numbers):
+    '''
+    Vectorized fix_new_account_nmbr. New account numbers must be 10-5 characters.
+
+    Parameters
+    ----------
+    acct_numbers: (Series) new account numbers without leading zeros
+
+    Returns
+    -------
+    fixed: (Series) reformatted account numbers with replaced zeros
+    invalid: (DataFrame) account numbers that could not be fixed and why
+    '''
+    return fix_hyphenated_ids(acct_numbers, 10, 5)
@@ -0,0 +1,164 @@
+import sys
+import json
+import time
+import resource
+import threading
+from contextlib import contextmanager
+
+# Stages recorded in this process since metrics were enabled, see stage.
+RECORDS = []
+# File the records are appended to as JSON lines, see enable_metrics.
+METRICS_PATH = None
+_LOCK = threading.Lock()
+
+
+def enable_metrics(path):
+    '''
+    Writes every stage recorded from now on to a file as one JSON object per
+    line, replacing what the file held. Worker processes started afterwards
+    append to the same file.
+
+    Parameters
+    ----------
+    path: (string) location of the JSON lines file
+
+    Returns
+    -------
+    None
+    '''
+    global METRICS_PATH
+    open(path, 'w').close()
+    METRICS_PATH = path
+
+
+def peak_rss_mb():
+    '''
+    Returns the largest resident set size the process has had so far, in MB.
+    '''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+@contextmanager
+def stage(name, data=None, **fields):
+    '''
+    Records the wall time, rows in and out and peak memory of a step of the
+    pipeline. Set record['rows_out'] inside the block, and any other field
+    worth keeping such as the table loaded. A step that raises is recorded
+    with its error before the exception propagates.
+
+        with stage('read_data', file=filepath) as record:
+            data = pd.read_csv(filepath)
+            record['rows_out'] = len(data)
+
+    Parameters
+    ----------
+    name: (string) name of the step
+    data: (DataFrame) input of the step, its length is recorded as rows_in
+    fields: extra fields added to the record
+
+    Returns
+    -------
+    record: (dict) the record, yielded to the block
+    '''
+    record = {'stage': name, 'rows_in': None if data is None else len(data), 'rows_out': None}
+    record.update(fields)
+    peak_before = peak_rss_mb()
+    start = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record['error'] = '{}: {}'.format(type(e).__name__, e)
+        raise
+    finally:
+        record['seconds'] = time.perf_counter() - start
+        record['peak_rss_mb'] = peak_rss_mb()
+        # Only a step that pushed the peak up is charged for the growth.
+        record['rss_growth_mb'] = record['peak_rss_mb'] - peak_before
+        record['timestamp'] = time.time()
+        emit(record)
+
+
+def emit(record):
+    '''
+    Keeps a stage record and writes it to the metrics file, if metrics are
+    enabled. Otherwise the record is dropped, so a long load does not
+    accumulate them.
+
+    Parameters
+    ----------
+    record: (dict) see stage
+
+    Returns
+    -------
+    None
+    '''
+    if not METRICS_PATH:
+        return None
+    with _LOCK:
+        RECORDS.append(record)
+        # One short write per line in append mode, so lines written by
+        # several processes do not interleave.
+        with open(METRICS_PATH, 'a') as f:
+            f.write(json.dumps(record, default=str) + '\n')
+
+
+def read_metrics(path):
+    '''
+    Reads the stage records written to a JSON lines file.
+
+    Parameters
+    ----------
+    path: (string) location of the JSON lines file
+
+    Returns
+    -------
+    records: (list of dicts) see stage
+    '''
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(records):
+    '''
+    Totals the records of each stage.
+
+    Parameters
+    ----------
+    records: (list of dicts) see stage
+
+    Returns
+    -------
+    summary: (list of dicts) stage, calls, seconds, rows_in, rows_out, errors and
+             the largest peak_rss_mb, slowest stage first
+    '''
+    totals = {}
+    for record in records:
+        total = totals.setdefault(record['stage'], {'stage': record['stage'], 'calls': 0, 'seconds': 0.0,
+                                                    'rows_in': 0, 'rows_out': 0, 'errors': 0, 'peak_rss_mb': 0.0})
+        total['calls'] += 1
+        total['seconds'] += record['seconds']
+        total['rows_in'] += record['rows_in'] or 0
+        total['rows_out'] += record['rows_out'] or 0
+        total['errors'] += 'error' in record
+        total['peak_rss_mb'] = max(total['peak_rss_mb'], record['peak_rss_mb'])
+    return sorted(totals.values(), key=lambda total: total['seconds'], reverse=True)
+
+
+def print_summary(records):
+    '''
+    Prints a table of the time, rows and memory of each stage.
+
+    Parameters
+    ----------
+    records: (list of dicts) see stage
+
+    Returns
+    -------
+    None
+    '''
+    print('{:<40} {:>6} {:>10} {:>11} {:>11} {:>7} {:>12}'.format(
+        'stage', 'calls', 'seconds', 'rows in', 'rows out', 'errors', 'peak RSS MB'))
+    for total in summarize(records):
+        print('{stage:<40} {calls:>6} {seconds:>10.3f} {rows_in:>11} {rows_out:>11} {errors:>7} {peak_rss_mb:>12.1f}'.format(**total))
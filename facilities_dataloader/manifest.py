@@ -0,0 +1,221 @@
+import hashlib
+import datetime
+import sqlalchemy
+import pandas as pd
+from os.path import join, basename
+from facilities_dataloader.helper import data_to_db, comparable
+from facilities_dataloader.schema import DDL_DIRECTORY, split_statements
+from facilities_dataloader.table_manager import stored_primary_key
+from facilities_dataloader.rollups import refresh_after_load
+from facilities_dataloader.accounts import stamp_buildings
+
+MANIFEST_DDL = join(DDL_DIRECTORY, 'create_manifest.sql')
+
+
+def create_manifest_tables(engine):
+    '''
+    Creates the load_files and load_rows tables if they do not exist yet.
+
+    Parameters
+    ----------
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+
+    Returns
+    -------
+    None
+    '''
+    with engine.begin() as connection:
+        for statement in split_statements(open(MANIFEST_DDL).read()):
+            connection.exec_driver_sql(statement)
+
+
+def file_digest(filepath, blocksize=2**20):
+    '''
+    Hashes the contents of a file.
+
+    Parameters
+    ----------
+    filepath: (string) location of the file
+    blocksize: (int) number of bytes read at a time
+
+    Returns
+    -------
+    digest: (string) hex SHA-256 of the file contents
+    '''
+    sha = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def file_already_loaded(file_hash, tablename, engine):
+    '''
+    Checks whether a file with the same contents was already loaded into a table.
+
+    Parameters
+    ----------
+    file_hash: (string) hash of the file, see file_digest
+    tablename: (string) name of the table the file is loaded into
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+
+    Returns
+    -------
+    loaded: (bool) True if the file is in the manifest
+    '''
+    statement = sqlalchemy.text('SELECT COUNT(*) FROM load_files WHERE file_hash = :file_hash AND tablename = :tablename')
+    with engine.connect() as connection:
+        count = connection.execute(statement, {'file_hash': file_hash, 'tablename': tablename}).scalar()
+    return count > 0
+
+
+def row_hashes(data, tablename, key):
+    '''
+    Hashes the primary key and the full contents of every row, with columns
+    cast to their stored types so hashes do not depend on the dtypes of data.
+
+    Parameters
+    ----------
+    data: (DataFrame) preprocessed data destined for tablename
+    tablename: (string) name of the table as declared in the ddl files
+    key: (list of strings) primary key columns, see table_manager.stored_primary_key
+
+    Returns
+    -------
+    hashes: (DataFrame) key_hash and row_hash for each row, as signed 64 bit integers
+    '''
+    values = comparable(data, tablename)
+    key_hash = pd.util.hash_pandas_object(values[key], index=False)
+    row_hash = pd.util.hash_pandas_object(values, index=False)
+    return pd.DataFrame({'key_hash': key_hash.to_numpy().view('int64'),
+                         'tablename': tablename,
+                         'row_hash': row_hash.to_numpy().view('int64')}, index=data.index)
+
+
+def loaded_row_hashes(hashes, tablename, engine, chunksize=500):
+    '''
+    Reads the manifest entries of the keys in hashes, selecting on key_hash in
+    batches so only the keys of the incoming rows are read, not every row ever
+    loaded into the table.
+
+    Parameters
+    ----------
+    hashes: (DataFrame) row hashes of the incoming rows, see row_hashes
+    tablename: (string) name of the table as declared in the ddl files
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+    chunksize: (int) number of key hashes per SELECT
+
+    Returns
+    -------
+    loaded: (DataFrame) key_hash and row_hash of the keys already loaded
+    '''
+    keys = hashes['key_hash'].unique().tolist()
+    statement = sqlalchemy.text('SELECT key_hash, row_hash FROM load_rows WHERE tablename = :tablename AND key_hash IN :keys')
+    statement = statement.bindparams(sqlalchemy.bindparam('keys', expanding=True))
+    chunks = []
+    with engine.connect() as connection:
+        for start in range(0, len(keys), chunksize):
+            chunks.append(pd.read_sql(statement, connection,
+                                      params={'tablename': tablename, 'keys': keys[start:start + chunksize]}))
+    if not chunks:
+        return pd.DataFrame({'key_hash': pd.Series(dtype='int64'), 'row_hash': pd.Series(dtype='int64')})
+    return pd.concat(chunks, ignore_index=True)
+
+
+def new_or_changed_rows(data, tablename, engine):
+    '''
+    Drops the rows that were already loaded into a table unchanged, comparing
+    row hashes against the manifest entries of their keys, see loaded_row_hashes.
+
+    Parameters
+    ----------
+    data: (DataFrame) preprocessed data destined for tablename
+    tablename: (string) name of the table as declared in the ddl files
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+
+    Returns
+    -------
+    delta: (DataFrame) rows of data that are new or changed
+    hashes: (DataFrame) row hashes of delta, see row_hashes
+    changed: (Series of bool) rows of delta whose key was loaded before
+    '''
+    hashes = row_hashes(data, tablename, stored_primary_key(engine, tablename))
+    loaded = loaded_row_hashes(hashes, tablename, engine)
+
+    known_key = hashes['key_hash'].isin(loaded['key_hash'])
+    known_row = pd.MultiIndex.from_frame(hashes[['key_hash', 'row_hash']]).isin(
+        pd.MultiIndex.from_frame(loaded[['key_hash', 'row_hash']]))
+    send = ~known_row
+    return data[send], hashes[send], known_key[send]
+
+
+def record_load(filepath, file_hash, tablename, hashes, changed, engine):
+    '''
+    Adds a loaded file and the hashes of the rows sent to the manifest. The
+    file is only recorded once its row hashes are, so a file whose hashes
+    could not be written is compared row by row again on its next load.
+
+    Parameters
+    ----------
+    filepath: (string) location of the loaded file
+    file_hash: (string) hash of the file, see file_digest
+    tablename: (string) name of the table the file was loaded into
+    hashes: (DataFrame) row hashes of the rows sent, see row_hashes
+    changed: (Series of bool) rows whose key was already in the manifest
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+
+    Returns
+    -------
+    recorded: (bool) True if the file and its row hashes were recorded
+    '''
+    new_keys = hashes[~changed].drop_duplicates(subset=['key_hash'], keep='last')
+    written = [data_to_db(new_keys, 'load_rows', engine, method='multi')]
+    if changed.any():
+        written.append(data_to_db(hashes[changed].drop_duplicates(subset=['key_hash'], keep='last'),
+                                  'load_rows', engine, method='upsert'))
+    if any(stats is None for stats in written):
+        print('Not recording {} as loaded into {}, its row hashes could not be written.'.format(filepath, tablename))
+        return False
+    loaded_file = pd.DataFrame({'file_hash': [file_hash],
+                                'tablename': [tablename],
+                                'filename': [basename(filepath)],
+                                'row_count': [len(hashes)],
+                                'loaded_at': [datetime.datetime.now()]})
+    return data_to_db(loaded_file, 'load_files', engine, method='upsert') is not None
+
+
+def incremental_data_to_db(filepath, tablename, preprocess, engine, chunksize=None):
+    '''
+    Loads only what changed since the last load: files already loaded byte for
+    byte are skipped without being parsed, and of the remaining rows only the
+    new or changed ones are sent. These are upserted, so rows loaded before the
+    manifest existed do not cause duplicate key errors.
+
+    Parameters
+    ----------
+    filepath: (string) location of the file to load
+    tablename: (string) name of the table to load the file into
+    preprocess: (function) takes filepath and returns the cleaned DataFrame
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+    chunksize: (int) number of rows per statement.
+
+    Returns
+    -------
+    stats: (dict) see data_to_db, None if the file was skipped or the load failed
+    '''
+    create_manifest_tables(engine)
+    file_hash = file_digest(filepath)
+    if file_already_loaded(file_hash, tablename, engine):
+        print('Skipping {}, it was already loaded into {}.'.format(filepath, tablename))
+        return None
+
+    data = preprocess(filepath)
+    delta, hashes, changed = new_or_changed_rows(data, tablename, engine)
+    print('{} of {} rows are new or changed, {} already loaded.'.format(len(delta), len(data), len(data) - len(delta)))
+
+    delta = stamp_buildings(delta, tablename, engine)
+    stats = data_to_db(delta, tablename, engine, method='upsert', chunksize=chunksize)
+    if stats is not None:
+        record_load(filepath, file_hash, tablename, hashes, changed, engine)
+        refresh_after_load(engine, tablename, delta)
+    return stats
@@ -1,9 +1,19 @@
 import math
 import datetime
 import pandas as pd
-from facilities_dataloader.helper import read_data, create_mysql_engine, data_to_db, restore_leading_zeros
+from facilities_dataloader.helper import (read_data, get_engine, data_to_db, compact_dtypes,
+                                          restore_leading_zeros_column, numbers_or_text,
+                                          fix_new_account_nmbrs)
+from facilities_dataloader.schema import SOURCE_COLUMNS
+from facilities_dataloader.manifest import incremental_data_to_db
+from facilities_dataloader.accounts import stamp_buildings, update_account_index
+from facilities_dataloader.instrument import stage
+from facilities_dataloader.validation import screen
+from facilities_dataloader.rollups import refresh_after_load
+from facilities_dataloader.streaming import stream_data_to_db
 
 CREDS = 'creds.yml'
+NULL_VALUES = ["-", "N/A", "#N/A"]
 
 def fix_new_account_nmbr(acct_number):
     '''
@@ -35,11 +45,6 @@ def fix_new_account_nmbr(acct_number):
     return '-'.join(split)
 
 
-def current_account_number(data):
-        account_number = data['new_account_number'] if data['new_account_number'] is not math.nan else data['account_number']
-        return account_number
-
-
 def preprocess_natural_gas(filepath):
     '''
     Load, clean, and prepare natural_gas data for loading into MySQL database.
@@ -53,97 +58,190 @@ def preprocess_natural_gas(filepath):
     data: (DataFrame) cleaned and preprocessed dataframe.
     '''
     data = read_data(filepath, 'other')
-    col_names = {"ADDRESS": "address",
-                 "Address 2": "address2",
-                 "City": "city",
-                 "Account Number": "account_number",
-                 "New Account Number": "new_account_number",
-                 "Start Date": "service_period_start",
-                 "End Date": "service_period_stop",
-                 "Therms": "therms",
-                 "Utility Amount": "utility_amount",
-                 "Supplier Amount": "supplier_amount"}
-
-    # Ensuring that the natural_gas data are being loaded.
-    data = data[list(col_names.keys())]
-    assert list(data.columns) == list(col_names.keys()), "Make sure column names match the columns as provided in the documentation."
-
-    # Renaming columns using names above
-    data = data.rename(columns = col_names)
-
-    # Replacing instances of unaccepted characters with "NULL"
-    data = data.replace(["-", "N/A", "#N/A"], math.nan)
-
-    # Creates a column with the first day of the month using the period end date.
-    data['bill_month'] = data['service_period_stop'].apply(lambda x: x.replace(day=1))
-
-    # Creating total_amount column. Note: NaN/Null value in either results in NaN/Null sum.
-    data['total_amount'] = data['utility_amount'] + data['supplier_amount']
-
-    # Restores leading zeros in account number so that it has 13 digits
-    data['account_number'] = data['account_number'].apply(lambda x: restore_leading_zeros(x, 13))
-
-    # Reformats the account number to ensure leading zeros are replaced where lost.
-    data['new_account_number'] = data['new_account_number'].apply(fix_new_account_nmbr)
-
-    # Takes new account number where exists and uses account nubmer otherwise.
-    data['current_account_number'] = data.apply(current_account_number, axis=1)
-
-    data = data.drop_duplicates()
-
-    col_order = ['account_number',
-                 'new_account_number',
-                 'current_account_number',
-                 'bill_month',
-                 'service_period_start',
-                 'service_period_stop',
-                 'therms',
-                 'utility_amount',
-                 'supplier_amount',
-                 'total_amount',
-                 'address',
-                 'address2',
-                 'city']
-
-    data = data[col_order]
+    data = clean_natural_gas(data)
+    return compact_dtypes(screen(data, 'ngas_usage', filepath), 'ngas_usage')
+
+
+def clean_natural_gas(data):
+    '''
+    Clean and prepare natural_gas data as read from a natural_gas file.
+
+    Parameters
+    ----------
+    data: (DataFrame) natural_gas data, or a chunk of it, as read by read_data.
+
+    Returns
+    -------
+    data: (DataFrame) cleaned and preprocessed dataframe.
+    '''
+    col_names = SOURCE_COLUMNS['ngas_usage']
+
+    with stage('clean_natural_gas.select_columns', data) as record:
+        # Ensuring that the natural_gas data are being loaded.
+        data = data[list(col_names.keys())]
+        assert list(data.columns) == list(col_names.keys()), "Make sure column names match the columns as provided in the documentation."
+
+        # Renaming columns using names above
+        data = data.rename(columns = col_names)
+
+        # Replacing instances of unaccepted characters with "NULL", only text
+        # columns can hold them.
+        for column in data.columns[(data.dtypes == object).to_numpy()]:
+            data[column] = data[column].mask(data[column].isin(NULL_VALUES), math.nan)
+
+        # Addresses repeat on every monthly bill, categories store each once.
+        data['address'] = data['address'].astype('category')
+        data['city'] = data['city'].astype('category')
+        record['rows_out'] = len(data)
+
+    with stage('clean_natural_gas.dates_and_amounts', data) as record:
+        # Dates are already parsed in Excel files but not in .csv files.
+        data['service_period_start'] = pd.to_datetime(data['service_period_start'])
+        data['service_period_stop'] = pd.to_datetime(data['service_period_stop'])
+
+        # Creates a column with the first day of the month using the period end date.
+        stop = data['service_period_stop']
+        data['bill_month'] = stop - pd.to_timedelta(stop.dt.day - 1, unit='D')
+
+        # A .csv column holding "-" is read as text, numbers included.
+        for column in ['therms', 'utility_amount', 'supplier_amount']:
+            data[column] = numbers_or_text(data[column])
+
+        # Creating total_amount column. Note: NaN/Null value in either results in NaN/Null sum.
+        data['total_amount'] = (pd.to_numeric(data['utility_amount'], errors='coerce')
+                                + pd.to_numeric(data['supplier_amount'], errors='coerce'))
+        record['rows_out'] = len(data)
+
+    with stage('clean_natural_gas.fix_ids', data) as record:
+        # Restores leading zeros in account number so that it has 13 digits
+        data['account_number'] = restore_leading_zeros_column(data['account_number'], 13)
+
+        # Reformats the account number to ensure leading zeros are replaced where lost.
+        # Numbers that cannot be fixed are left as they are for validation to reject.
+        data['new_account_number'], invalid_ids = fix_new_account_nmbrs(data['new_account_number'])
+
+        # Takes new account number where exists and uses account nubmer otherwise.
+        data['current_account_number'] = data['new_account_number'].where(data['new_account_number'].notna(),
+                                                                          data['account_number'])
+        record['rows_out'] = len(data)
+
+    with stage('clean_natural_gas.dedupe', data) as record:
+        data = data.drop_duplicates()
+
+        col_order = ['account_number',
+                     'new_account_number',
+                     'current_account_number',
+                     'bill_month',
+                     'service_period_start',
+                     'service_period_stop',
+                     'therms',
+                     'utility_amount',
+                     'supplier_amount',
+                     'total_amount',
+                     'address',
+                     'address2',
+                     'city']
+
+        data = data[col_order]
+        record['rows_out'] = len(data)
 
     return data
 
 
-def natural_gas_data_to_db(filepath):
+def natural_gas_data_to_db(filepath, method='default', chunksize=None, incremental=False, stream_rows=None, engine=None,
+                           pipeline_depth=None):
     '''
     Sends natural_gas data to a database table named elec_usage.
 
     Parameters
     ----------
     filepath: (string) filepath for file containing natural_gas utility data.
+    method: (string) {default, multi, infile, upsert} how rows are sent, see data_to_db.
+    chunksize: (int) number of rows per statement when method is multi or upsert.
+    incremental: (bool) skip the file if it was already loaded and only send
+                 new or changed rows, see manifest.incremental_data_to_db.
+    stream_rows: (int) read a .csv file this many rows at a time and load each
+                 chunk as it is ready, see streaming.stream_data_to_db.
+    engine: (sqlalchemy.engine.base.Engine) connection to reuse, by default
+            the shared engine for creds.yml.
+    pipeline_depth: (int) with stream_rows, read up to this many chunks ahead
+                    while the previous one is written, see streaming.run_pipeline.
 
     Returns
     -------
     None
     '''
     assert type(filepath) == str, 'Please provide a file path as a string.'
-    engine = create_mysql_engine(CREDS)
-    ngas_data = preprocess_natural_gas(filepath)
-    data_to_db(ngas_data, 'ngas_usage', engine)
+    engine = engine or get_engine(CREDS)
+    if incremental:
+        incremental_data_to_db(filepath, 'ngas_usage', preprocess_natural_gas, engine, chunksize=chunksize)
+        return None
+    if stream_rows:
+        stream_data_to_db(filepath, 'other', clean_natural_gas, 'ngas_usage', engine, stream_rows, method, chunksize,
+                          pipeline_depth)
+        return None
+    ngas_data = stamp_buildings(preprocess_natural_gas(filepath), 'ngas_usage', engine)
+    stats = data_to_db(ngas_data, 'ngas_usage', engine, method=method, chunksize=chunksize, skip_existing=True)
+    if stats and stats['rows']:
+        refresh_after_load(engine, 'ngas_usage', ngas_data)
+
+
+def preprocess_ngas_accounts(filepath):
+        '''
+        Reads and cleans natural gas accounts data so it is ready to be sent to
+        the ngas_accounts table.
+
+        Parameters
+        ----------
+        filepath: (string) filepath for file containing natural gas account data.
 
+        Returns
+        -------
+        ngas_accounts: (DataFrame) deduplicated accounts with fixed account and ERT numbers
+        '''
+        ngas_accounts = read_data(filepath, 'gas_accounts')
+        ngas_accounts = clean_ngas_accounts(ngas_accounts)
+        return compact_dtypes(screen(ngas_accounts, 'ngas_accounts', filepath), 'ngas_accounts')
+
+
+def clean_ngas_accounts(ngas_accounts):
+        '''
+        Clean natural gas accounts data as read from an accounts file.
+
+        Parameters
+        ----------
+        ngas_accounts: (DataFrame) natural gas accounts as read by read_data.
 
-def ngas_accounts_to_db(filepath):
+        Returns
+        -------
+        ngas_accounts: (DataFrame) deduplicated accounts with fixed account and ERT numbers
+        '''
+        ngas_accounts = ngas_accounts.drop_duplicates()
+        ngas_accounts['account_number'] = restore_leading_zeros_column(ngas_accounts['account_number'], 13)
+        ngas_accounts['ert_number'] = restore_leading_zeros_column(ngas_accounts['ert_number'], 9)
+        return ngas_accounts
+
+
+def ngas_accounts_to_db(filepath, method='default', chunksize=None, engine=None):
         '''
         Sends natural gas accounts data to database table named ngas_accounts.
 
         Parameters
         ----------
         filepath: (string) filepath for file containing natural gas account data.
+        method: (string) {default, multi, infile, upsert} how rows are sent, see data_to_db.
+        chunksize: (int) number of rows per statement when method is multi or upsert.
+        engine: (sqlalchemy.engine.base.Engine) connection to reuse, by default
+                the shared engine for creds.yml.
 
         Returns
         -------
         None
         '''
         assert type(filepath) == str, 'Please provide a file path as a string.'
-        engine = create_mysql_engine(CREDS)
-        ngas_accounts = read_data(filepath, 'gas_accounts')
-        ngas_accounts = ngas_accounts.drop_duplicates()
-        ngas_accounts['account_number'] = ngas_accounts['account_number'].apply(lambda x: restore_leading_zeros(x, 13))
-        ngas_accounts['ert_number'] = ngas_accounts['ert_number'].apply(lambda x: restore_leading_zeros(x, 9))
-        data_to_db(ngas_accounts, 'ngas_accounts', engine)
+        engine = engine or get_engine(CREDS)
+        ngas_accounts = preprocess_ngas_accounts(filepath)
+        stats = data_to_db(ngas_accounts, 'ngas_accounts', engine, method=method, chunksize=chunksize, skip_existing=True)
+        if stats and stats['rows']:
+            update_account_index(engine, 'ngas_accounts')
+            refresh_after_load(engine, 'ngas_accounts', ngas_accounts)
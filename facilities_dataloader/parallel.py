@@ -0,0 +1,267 @@
+import os
+import glob
+import time
+from os.path import join, isdir
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future
+from facilities_dataloader.helper import data_to_db
+from facilities_dataloader.rollups import MAPPING_TABLES, touched_months, refresh_rollups
+from facilities_dataloader.spatial import save_building_index
+from facilities_dataloader.accounts import ACCOUNT_TABLES, stamp_buildings, update_account_index
+from facilities_dataloader.streaming import PIPELINE_DEPTH, pipeline
+from facilities_dataloader.buildings import preprocess_buildings
+from facilities_dataloader.electricity import preprocess_electricity, preprocess_elec_accounts
+from facilities_dataloader.natural_gas import preprocess_natural_gas, preprocess_ngas_accounts
+
+# dataset -> (function that cleans one file, table the file is loaded into)
+DATASETS = {'buildings': (preprocess_buildings, 'buildings'),
+            'elec_accounts': (preprocess_elec_accounts, 'elec_accounts'),
+            'ngas_accounts': (preprocess_ngas_accounts, 'ngas_accounts'),
+            'elec': (preprocess_electricity, 'elec_usage'),
+            'ngas': (preprocess_natural_gas, 'ngas_usage')}
+
+# Tables in the same stage are loaded concurrently, a stage only starts once
+# the one before it is done so buildings exist before the accounts that
+# reference them, and accounts before usage.
+LOAD_STAGES = [['buildings'], ['elec_accounts', 'ngas_accounts'], ['elec', 'ngas']]
+
+FILE_EXTENSIONS = ('.csv', '.xlsx', '.xls')
+
+
+def expand_paths(pattern):
+    '''
+    Lists the files matching a path or glob pattern such as exports/elec_*.xlsx.
+
+    Parameters
+    ----------
+    pattern: (string) file path or glob pattern
+
+    Returns
+    -------
+    filepaths: (list of strings) matching files, sorted so monthly exports load in order
+    '''
+    filepaths = sorted(path for path in glob.glob(pattern) if not isdir(path))
+    assert filepaths, 'No files match {}.'.format(pattern)
+    return filepaths
+
+
+def discover_files(directory):
+    '''
+    Finds the export files in a directory laid out with one subdirectory per
+    dataset, e.g. directory/elec/2018-01.xlsx and directory/buildings/buildings.csv.
+
+    Parameters
+    ----------
+    directory: (string) directory containing one subdirectory per dataset
+
+    Returns
+    -------
+    files: (dict) dataset -> sorted list of file paths, see DATASETS
+    '''
+    assert isdir(directory), '{} is not a directory.'.format(directory)
+    files = {}
+    for dataset in DATASETS:
+        subdirectory = join(directory, dataset)
+        if not isdir(subdirectory):
+            continue
+        filepaths = sorted(join(subdirectory, f) for f in os.listdir(subdirectory)
+                           if f.endswith(FILE_EXTENSIONS) and not f.startswith(('.', '~$')))
+        if filepaths:
+            files[dataset] = filepaths
+    return files
+
+
+def load_dataset(dataset, filepaths, preprocessed, engine, method, chunksize, tablename=None):
+    '''
+    Loads the preprocessed files of one dataset, one after another in file order.
+
+    Parameters
+    ----------
+    dataset: (string) key of DATASETS
+    filepaths: (list of strings) files of the dataset
+    preprocessed: (dict) file path -> Future returning the cleaned DataFrame
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+    method: (string) how rows are sent, see data_to_db.
+    chunksize: (int) number of rows per statement.
+    tablename: (string) table to load into instead of the dataset's own
+
+    Returns
+    -------
+    report: (list of dicts) dataset, file, table, status, rows, seconds,
+            error and bill months loaded for every file
+    '''
+    # Rows already in a live table are left out, a shadow table starts empty.
+    skip_existing = tablename is None
+    tablename = tablename or DATASETS[dataset][1]
+    report = []
+    for filepath in filepaths:
+        result = {'dataset': dataset, 'file': filepath, 'table': tablename,
+                  'status': 'failed', 'rows': 0, 'seconds': 0.0, 'error': None, 'months': []}
+        start = time.perf_counter()
+        try:
+            data = stamp_buildings(preprocessed[filepath].result(), DATASETS[dataset][1], engine, tablename)
+            stats = data_to_db(data, tablename, engine, method=method, chunksize=chunksize,
+                               skip_existing=skip_existing)
+            if stats is None:
+                result['error'] = 'load into {} failed'.format(tablename)
+            else:
+                result['status'], result['rows'] = 'loaded', stats['rows']
+                result['months'] = touched_months(data) if stats['rows'] else []
+                if stats['rows'] and tablename in ACCOUNT_TABLES.values():
+                    update_account_index(engine, tablename)
+        except Exception as e:
+            result['error'] = '{}: {}'.format(type(e).__name__, e)
+        result['seconds'] = time.perf_counter() - start
+        report.append(result)
+    return report
+
+
+def print_report(report):
+    '''
+    Prints one line per file with the outcome of its load and a final count.
+
+    Parameters
+    ----------
+    report: (list of dicts) see load_dataset
+
+    Returns
+    -------
+    None
+    '''
+    for result in report:
+        line = '{:<7} {:<14} {:>9} rows {:>8.2f}s  {}'.format(result['status'], result['table'], result['rows'],
+                                                              result['seconds'], result['file'])
+        if result['error']:
+            line += '  ({})'.format(result['error'])
+        print(line)
+    failed = sum(result['status'] != 'loaded' for result in report)
+    print('{} of {} files loaded, {} failed.'.format(len(report) - failed, len(report), failed))
+
+
+def parallel_load(files, engine, workers=4, method='default', chunksize=None, tablenames=None):
+    '''
+    Loads many export files at once. Every file is cleaned in a pool of worker
+    processes as soon as the run starts, while the loads go through threads
+    sharing one pooled engine: the tables of a stage are written concurrently
+    and the files of a table in order, following LOAD_STAGES.
+
+    Parameters
+    ----------
+    files: (dict) dataset -> list of file paths, see discover_files
+    engine: (sqlalchemy.engine.base.Engine) Connection to database, its pool
+            should hold at least as many connections as there are workers.
+    workers: (int) number of processes cleaning files and of threads loading them
+    method: (string) how rows are sent, see data_to_db.
+    chunksize: (int) number of rows per statement.
+    tablenames: (dict) table -> table to load into instead, e.g. a shadow table.
+                The monthly rollups are only refreshed when loading the live tables.
+
+    Returns
+    -------
+    report: (list of dicts) outcome of every file, see load_dataset
+    '''
+    unknown = set(files) - set(DATASETS)
+    assert not unknown, 'Unknown datasets {}, expected some of {}.'.format(sorted(unknown), list(DATASETS))
+    assert workers >= 1, 'Please use at least one worker.'
+    tablenames = tablenames or {}
+    report = []
+    with ProcessPoolExecutor(workers) as processes, ThreadPoolExecutor(workers) as threads:
+        preprocessed = {dataset: {filepath: processes.submit(DATASETS[dataset][0], filepath)
+                                  for filepath in filepaths}
+                        for dataset, filepaths in files.items()}
+        for stage in LOAD_STAGES:
+            loads = [threads.submit(load_dataset, dataset, files[dataset], preprocessed[dataset],
+                                    engine, method, chunksize, tablenames.get(DATASETS[dataset][1]))
+                     for dataset in stage if files.get(dataset)]
+            for load in loads:
+                report.extend(load.result())
+    print_report(report)
+    if not tablenames:
+        after_load(report, engine)
+    return report
+
+
+def preprocessed_files(files):
+    '''
+    Cleans files one at a time in load order, see LOAD_STAGES.
+
+    Parameters
+    ----------
+    files: (dict) dataset -> list of file paths, see discover_files
+
+    Returns
+    -------
+    preprocessed: (generator of tuples) dataset, file path and a done Future
+                  holding the cleaned DataFrame or the error cleaning raised
+    '''
+    for stage in LOAD_STAGES:
+        for dataset in stage:
+            for filepath in files.get(dataset, []):
+                future = Future()
+                try:
+                    future.set_result(DATASETS[dataset][0](filepath))
+                except Exception as e:
+                    future.set_exception(e)
+                yield dataset, filepath, future
+
+
+def pipeline_load(files, engine, method='default', chunksize=None, depth=PIPELINE_DEPTH):
+    '''
+    Loads many export files in a single process, cleaning the next file while
+    the previous one is written, see streaming.run_pipeline. Unlike
+    parallel_load, which cleans every file up front, at most depth cleaned
+    files are held in memory. Files are written in load order, one at a time.
+
+    Parameters
+    ----------
+    files: (dict) dataset -> list of file paths, see discover_files
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+    method: (string) how rows are sent, see data_to_db.
+    chunksize: (int) number of rows per statement.
+    depth: (int) number of files cleaned ahead of the one being written
+
+    Returns
+    -------
+    report: (list of dicts) outcome of every file, see load_dataset
+    '''
+    unknown = set(files) - set(DATASETS)
+    assert not unknown, 'Unknown datasets {}, expected some of {}.'.format(sorted(unknown), list(DATASETS))
+
+    def write(item):
+        dataset, filepath, future = item
+        return load_dataset(dataset, [filepath], {filepath: future}, engine, method, chunksize)
+
+    report = [result for results in pipeline(preprocessed_files(files), write, depth) for result in results]
+    print_report(report)
+    after_load(report, engine)
+    return report
+
+
+def after_load(report, engine):
+    '''
+    Refreshes what is derived from the tables loaded: the monthly rollups and,
+    when buildings were loaded, the spatial index of buildings.
+    '''
+    refresh_loaded_rollups(report, engine)
+    if any(result['table'] == 'buildings' and result['rows'] for result in report):
+        save_building_index(engine)
+
+
+def refresh_loaded_rollups(report, engine):
+    '''
+    Brings building_energy_monthly up to date once every file is loaded: only
+    the months of the usage loaded are recomputed, unless accounts or buildings
+    changed, which can move usage of any month between buildings.
+
+    Parameters
+    ----------
+    report: (list of dicts) outcome of every file, see load_dataset
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+
+    Returns
+    -------
+    rows: (int) see rollups.refresh_rollups
+    '''
+    loaded = [result for result in report if result['status'] == 'loaded' and result['rows']]
+    if any(result['table'] in MAPPING_TABLES for result in loaded):
+        return refresh_rollups(engine)
+    return refresh_rollups(engine, sorted({month for result in loaded for month in result['months']}))
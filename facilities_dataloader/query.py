@@ -0,0 +1,174 @@
+import os
+import time
+import threading
+import sqlalchemy
+import pandas as pd
+from collections import OrderedDict
+from facilities_dataloader.helper import get_engine, table_versions
+from facilities_dataloader.rollups import ROLLUP_TABLE
+
+CREDS = 'creds.yml'
+
+# Results kept in memory, least recently used first, see read_query.
+QUERY_CACHE_SIZE = int(os.environ.get('FODB_QUERY_CACHE_SIZE', 256))
+# Writes made by this process invalidate cached results at once. Writes made
+# by other processes, such as a loader run, are seen once a result expires.
+QUERY_CACHE_SECONDS = float(os.environ.get('FODB_QUERY_CACHE_SECONDS', 300))
+_CACHE = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+CACHE_STATS = {'hits': 0, 'misses': 0}
+
+# Columns the rollup can be ranked by, see top_consumers.
+RANK_COLUMNS = ['kwh', 'peak_kw', 'elec_charges', 'therms', 'ngas_charges', 'kbtu', 'eui']
+
+
+def clear_query_cache():
+    with _CACHE_LOCK:
+        _CACHE.clear()
+        CACHE_STATS.update(hits=0, misses=0)
+
+
+def read_query(statement, params, tables, engine, parse_dates=None):
+    '''
+    Runs a parameterized query, or returns its result from memory if the same
+    query ran less than QUERY_CACHE_SECONDS ago and none of the tables it
+    reads were written since, see helper.bump_table_versions.
+
+    Parameters
+    ----------
+    statement: (string) SQL with :name placeholders
+    params: (dict) values of the placeholders
+    tables: (list of strings) tables the query reads
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+    parse_dates: (list of strings) columns to return as dates
+
+    Returns
+    -------
+    data: (DataFrame) result of the query, a copy callers are free to change
+    '''
+    key = (str(engine.url), statement, tuple(sorted(params.items())))
+    # Taken before reading, so a write made during the query invalidates it.
+    versions = table_versions(tables)
+    with _CACHE_LOCK:
+        cached = _CACHE.get(key)
+        if cached and cached[0] > time.monotonic() and cached[1] == versions:
+            _CACHE.move_to_end(key)
+            CACHE_STATS['hits'] += 1
+            return cached[2].copy()
+        CACHE_STATS['misses'] += 1
+
+    with engine.connect() as connection:
+        data = pd.read_sql(sqlalchemy.text(statement), connection, params=params, parse_dates=parse_dates)
+
+    with _CACHE_LOCK:
+        _CACHE[key] = (time.monotonic() + QUERY_CACHE_SECONDS, versions, data)
+        _CACHE.move_to_end(key)
+        while len(_CACHE) > QUERY_CACHE_SIZE:
+            _CACHE.popitem(last=False)
+    return data.copy()
+
+
+def month_bounds(start, end):
+    '''
+    Bounds of the months from start to end inclusive, as YYYY-MM-DD strings
+    with an exclusive upper bound.
+    '''
+    start = pd.Timestamp(start).to_period('M').to_timestamp()
+    end = pd.Timestamp(end).to_period('M').to_timestamp() + pd.offsets.MonthBegin(1)
+    assert start < end, 'Please give a start before the end.'
+    return start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+
+
+def building_usage(activity_code, start, end, engine=None):
+    '''
+    Monthly energy use of a building, from the building_energy_monthly rollup.
+
+    Parameters
+    ----------
+    activity_code: (string) building
+    start: (string or date) first month, e.g. '2018-01'
+    end: (string or date) last month, included
+    engine: (sqlalchemy.engine.base.Engine) connection to reuse, by default
+            the shared engine for creds.yml.
+
+    Returns
+    -------
+    usage: (DataFrame) one row per month with kwh, peak_kw, elec_charges,
+           therms, ngas_charges, kbtu and eui
+    '''
+    low, high = month_bounds(start, end)
+    statement = '''SELECT bill_month, kwh, peak_kw, elec_charges, therms, ngas_charges, kbtu, eui
+                   FROM {} WHERE activity_code = :activity_code AND bill_month >= :low AND bill_month < :high
+                   ORDER BY bill_month'''.format(ROLLUP_TABLE)
+    return read_query(statement, {'activity_code': activity_code, 'low': low, 'high': high},
+                      [ROLLUP_TABLE], engine or get_engine(CREDS), parse_dates=['bill_month'])
+
+
+def top_consumers(bill_month, n=10, by='kbtu', engine=None):
+    '''
+    Buildings that used the most energy in a month.
+
+    Parameters
+    ----------
+    bill_month: (string or date) month, e.g. '2018-01'
+    n: (int) number of buildings
+    by: (string) rollup column to rank by, see RANK_COLUMNS
+    engine: (sqlalchemy.engine.base.Engine) connection to reuse, by default
+            the shared engine for creds.yml.
+
+    Returns
+    -------
+    consumers: (DataFrame) activity_code, building_name, address and the
+               month's rollup columns, largest first
+    '''
+    assert by in RANK_COLUMNS, 'Please rank by one of {}, not {}.'.format(RANK_COLUMNS, by)
+    assert int(n) > 0, 'Please ask for at least one building.'
+    low, high = month_bounds(bill_month, bill_month)
+    # The ranking column is checked against RANK_COLUMNS, it cannot be a parameter.
+    statement = '''SELECT r.activity_code, b.building_name, b.address, r.kwh, r.peak_kw, r.elec_charges,
+                          r.therms, r.ngas_charges, r.kbtu, r.eui
+                   FROM {0} r LEFT JOIN buildings b ON b.activity_code = r.activity_code
+                   WHERE r.bill_month >= :low AND r.bill_month < :high AND r.{1} IS NOT NULL
+                   ORDER BY r.{1} DESC LIMIT :n'''.format(ROLLUP_TABLE, by)
+    return read_query(statement, {'low': low, 'high': high, 'n': int(n)},
+                      [ROLLUP_TABLE, 'buildings'], engine or get_engine(CREDS))
+
+
+def buildings_eui(start, end, ward=None, engineer_zone=None, engine=None):
+    '''
+    Energy use intensity of buildings over a period, optionally only those of
+    a ward or engineer zone.
+
+    Parameters
+    ----------
+    start: (string or date) first month, e.g. '2018-01'
+    end: (string or date) last month, included
+    ward: (int) only buildings of this ward
+    engineer_zone: (int) only buildings of this engineer zone
+    engine: (sqlalchemy.engine.base.Engine) connection to reuse, by default
+            the shared engine for creds.yml.
+
+    Returns
+    -------
+    buildings: (DataFrame) activity_code, building_name, ward, engineer_zone,
+               square_footage, kbtu over the period and eui, the kBtu per
+               square foot, highest first. Buildings without usage have no eui.
+    '''
+    low, high = month_bounds(start, end)
+    params = {'low': low, 'high': high}
+    filters = []
+    if ward is not None:
+        filters.append('b.ward = :ward')
+        params['ward'] = int(ward)
+    if engineer_zone is not None:
+        filters.append('b.engineer_zone = :engineer_zone')
+        params['engineer_zone'] = int(engineer_zone)
+    statement = '''SELECT b.activity_code, b.building_name, b.ward, b.engineer_zone, b.square_footage,
+                          SUM(r.kbtu) AS kbtu, SUM(r.kbtu) / NULLIF(b.square_footage, 0) AS eui
+                   FROM buildings b
+                   LEFT JOIN {} r ON r.activity_code = b.activity_code
+                                 AND r.bill_month >= :low AND r.bill_month < :high
+                   {}
+                   GROUP BY b.activity_code, b.building_name, b.ward, b.engineer_zone, b.square_footage
+                   ORDER BY eui DESC'''.format(ROLLUP_TABLE, 'WHERE ' + ' AND '.join(filters) if filters else '')
+    return read_query(statement, params, [ROLLUP_TABLE, 'buildings'], engine or get_engine(CREDS))
@@ -0,0 +1,230 @@
+import sqlalchemy
+import pandas as pd
+from facilities_dataloader.schema import create_table_statement
+from facilities_dataloader.instrument import stage
+from facilities_dataloader.helper import bump_table_versions
+from facilities_dataloader.sinks import is_parquet
+
+ROLLUP_TABLE = 'building_energy_monthly'
+
+# Tables the rollup is computed from. Loading usage only changes the months it
+# covers, loading accounts or buildings can change any month.
+USAGE_TABLES = ['elec_usage', 'ngas_usage']
+MAPPING_TABLES = ['elec_accounts', 'ngas_accounts', 'buildings']
+
+KBTU_PER_KWH = 3.412
+KBTU_PER_THERM = 100.0
+
+# Usage of each building and month, through the accounts billed for it.
+# Accounts are made distinct as ngas_accounts holds one row per meter.
+ELEC_SQL = '''SELECT a.activity_code, u.bill_month, SUM(u.billed_khw) AS kwh,
+                     MAX(u.peak_kw) AS peak_kw, SUM(u.total_charges) AS elec_charges
+              FROM elec_usage u
+              JOIN (SELECT DISTINCT account_number, activity_code FROM elec_accounts) a
+                ON a.account_number = u.account_number
+              {where}
+              GROUP BY a.activity_code, u.bill_month'''
+
+# Gas usage is matched on its account number, or else on its current number
+# for renumbered accounts listed only under the new one, as
+# accounts.stamp_buildings does.
+NGAS_SQL = '''SELECT activity_code, bill_month, SUM(therms) AS therms, SUM(total_amount) AS ngas_charges
+              FROM (SELECT a.activity_code, u.bill_month, u.therms, u.total_amount
+                    FROM ngas_usage u
+                    JOIN (SELECT DISTINCT account_number, activity_code FROM ngas_accounts) a
+                      ON a.account_number = u.account_number
+                    {where}
+                    UNION ALL
+                    SELECT a.activity_code, u.bill_month, u.therms, u.total_amount
+                    FROM ngas_usage u
+                    JOIN (SELECT DISTINCT account_number, activity_code FROM ngas_accounts) a
+                      ON a.account_number = u.current_account_number
+                     AND NOT EXISTS (SELECT 1 FROM ngas_accounts l WHERE l.account_number = u.account_number)
+                    {where}) billed
+              GROUP BY activity_code, bill_month'''
+
+MONTH_RANGE = 'WHERE {column} >= :low AND {column} < :high'
+
+
+def touched_months(data):
+    '''
+    Lists the bill months present in loaded usage rows.
+
+    Parameters
+    ----------
+    data: (DataFrame) rows loaded into elec_usage or ngas_usage
+
+    Returns
+    -------
+    months: (list of Timestamps) first day of every bill month, sorted
+    '''
+    if 'bill_month' not in data.columns:
+        return []
+    months = pd.to_datetime(data['bill_month'], errors='coerce').dropna()
+    return sorted(months.dt.to_period('M').dt.to_timestamp().unique())
+
+
+def month_range(months):
+    '''
+    Bounds of the span of months to refresh as YYYY-MM-DD strings, with an
+    exclusive upper bound, which compare correctly with DATE columns and with
+    dates SQLite stores as text.
+    '''
+    return {'low': min(months).strftime('%Y-%m-%d'),
+            'high': (max(months) + pd.offsets.MonthBegin(1)).strftime('%Y-%m-%d')}
+
+
+def sources(engine):
+    '''
+    Lists the usage queries whose tables exist, electricity and natural gas
+    each need their usage and accounts tables.
+    '''
+    tables = set(sqlalchemy.inspect(engine).get_table_names())
+    queries = []
+    if {'elec_usage', 'elec_accounts'} <= tables:
+        queries.append(ELEC_SQL)
+    if {'ngas_usage', 'ngas_accounts'} <= tables:
+        queries.append(NGAS_SQL)
+    return queries, 'buildings' in tables
+
+
+def regroup(data, sums, maxima=()):
+    '''
+    Adds up rows of the same building and month, which SQLite can return more
+    than once when a month was stored both as a date and as a timestamp.
+    '''
+    data['bill_month'] = pd.to_datetime(data['bill_month'].astype(str).str[:10])
+    grouped = data.groupby(['activity_code', 'bill_month'])
+    parts = [grouped[list(sums)].sum(min_count=1)]
+    if maxima:
+        parts.append(grouped[list(maxima)].max())
+    return pd.concat(parts, axis=1)
+
+
+def compute_rollup(engine, months=None):
+    '''
+    Aggregates electricity and natural gas usage per building and month, with
+    the energy use intensity (kBtu per square foot) of each month.
+
+    Parameters
+    ----------
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+    months: (list of Timestamps) months to aggregate, see touched_months.
+            Every month if None.
+
+    Returns
+    -------
+    rollup: (DataFrame) one row per building and month, columns as declared
+            for building_energy_monthly
+    '''
+    queries, has_buildings = sources(engine)
+    where, params = '', {}
+    if months is not None:
+        where, params = MONTH_RANGE.format(column='u.bill_month'), month_range(months)
+
+    columns = ['activity_code', 'bill_month', 'kwh', 'peak_kw', 'elec_charges', 'therms', 'ngas_charges', 'kbtu', 'eui']
+    parts = []
+    with engine.connect() as connection:
+        for query in queries:
+            part = pd.read_sql(sqlalchemy.text(query.format(where=where)), connection, params=params)
+            if query is ELEC_SQL:
+                parts.append(regroup(part, ['kwh', 'elec_charges'], ['peak_kw']))
+            else:
+                parts.append(regroup(part, ['therms', 'ngas_charges']))
+        areas = (pd.read_sql('SELECT activity_code, square_footage FROM buildings', connection)
+                 if has_buildings else pd.DataFrame(columns=['activity_code', 'square_footage']))
+
+    if not parts:
+        return pd.DataFrame(columns=columns)
+    rollup = pd.concat(parts, axis=1).reset_index()
+    rollup = rollup.reindex(columns=columns[:7])
+    rollup['kbtu'] = (rollup['kwh'].fillna(0) * KBTU_PER_KWH
+                      + rollup['therms'].fillna(0) * KBTU_PER_THERM)
+    square_footage = rollup['activity_code'].map(areas.drop_duplicates('activity_code')
+                                                  .set_index('activity_code')['square_footage'])
+    square_footage = pd.to_numeric(square_footage, errors='coerce')
+    rollup['eui'] = rollup['kbtu'] / square_footage.where(square_footage > 0)
+    rollup['bill_month'] = pd.to_datetime(rollup['bill_month']).dt.date
+    return rollup[columns]
+
+
+def refresh_rollups(engine, months=None):
+    '''
+    Recomputes building_energy_monthly for the months a load touched, deleting
+    and inserting those months in one transaction so readers never see them
+    half updated. Does nothing until the usage and accounts tables of
+    electricity or natural gas exist, nor for a Parquet sink.
+
+    Parameters
+    ----------
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+    months: (list of Timestamps) months to refresh, see touched_months. Every
+            month if None.
+
+    Returns
+    -------
+    rows: (int) number of rollup rows written, None if there was nothing to do
+    '''
+    if months is not None and not len(months):
+        return None
+    if is_parquet(engine) or not sources(engine)[0]:
+        return None
+    dialect = 'sqlite' if engine.dialect.name == 'sqlite' else 'mysql'
+    with stage('refresh_rollups', table=ROLLUP_TABLE, months=None if months is None else len(months)) as record:
+        rollup = compute_rollup(engine, months)
+        with engine.begin() as connection:
+            connection.execute(sqlalchemy.text(create_table_statement(ROLLUP_TABLE, dialect=dialect)))
+            if months is None:
+                connection.execute(sqlalchemy.text('DELETE FROM {}'.format(ROLLUP_TABLE)))
+            else:
+                connection.execute(sqlalchemy.text('DELETE FROM {} {}'.format(
+                    ROLLUP_TABLE, MONTH_RANGE.format(column='bill_month'))), month_range(months))
+            rollup.to_sql(ROLLUP_TABLE, connection, if_exists='append', index=False, chunksize=1000)
+        bump_table_versions(ROLLUP_TABLE)
+        record['rows_out'] = len(rollup)
+    print('Refreshed {} rows of {} for {}.'.format(
+        len(rollup), ROLLUP_TABLE, 'every month' if months is None else '{} months'.format(len(months))))
+    return len(rollup)
+
+
+def rebuild_rollups(engine):
+    '''
+    Drops building_energy_monthly and computes it again from every month of
+    usage, e.g. after changing how it is computed.
+
+    Parameters
+    ----------
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+
+    Returns
+    -------
+    rows: (int) number of rollup rows written, None if there is no usage to roll up
+    '''
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text('DROP TABLE IF EXISTS {}'.format(ROLLUP_TABLE)))
+    return refresh_rollups(engine)
+
+
+def refresh_after_load(engine, tablename, data):
+    '''
+    Keeps building_energy_monthly up to date after rows were loaded into
+    tablename: usage refreshes the months it covers, accounts and buildings
+    every month. Other tables are ignored.
+
+    Parameters
+    ----------
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+    tablename: (string) table the rows were loaded into
+    data: (DataFrame) rows loaded
+
+    Returns
+    -------
+    rows: (int) see refresh_rollups
+    '''
+    if data is None or data.empty:
+        return None
+    if tablename in USAGE_TABLES:
+        return refresh_rollups(engine, touched_months(data))
+    if tablename in MAPPING_TABLES:
+        return refresh_rollups(engine)
+    return None
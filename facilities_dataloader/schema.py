@@ -0,0 +1,420 @@
+import re
+import sqlalchemy
+from os import listdir
+from os.path import join, dirname, abspath, exists
+from functools import lru_cache, partial
+
+DDL_DIRECTORY = join(dirname(dirname(abspath(__file__))), 'ddl')
+INDEX_FILE = 'indexes.sql'
+
+# How each SQL type of the ddl files is held in memory, sent to the database
+# and stored in Parquet: compact pandas dtype, SQLAlchemy type, Arrow type
+# alias. Aliases keep pyarrow from being imported with the schema.
+# Text is kept in Arrow buffers rather than as Python objects, see table_dtypes
+# for the text columns held as categories.
+SQL_TYPES = {'VARCHAR': ('string[pyarrow]', sqlalchemy.String, 'string'),
+             'TEXT': ('string[pyarrow]', sqlalchemy.Text, 'string'),
+             'CHAR': ('category', sqlalchemy.CHAR, 'string'),
+             'ENUM': ('category', sqlalchemy.Enum, 'string'),
+             'INT': ('Int32', sqlalchemy.Integer, 'int32'),
+             'INTEGER': ('Int32', sqlalchemy.Integer, 'int32'),
+             'SMALLINT': ('Int16', sqlalchemy.SmallInteger, 'int16'),
+             'BIGINT': ('Int64', sqlalchemy.BigInteger, 'int64'),
+             'BOOL': ('boolean', sqlalchemy.Boolean, 'bool'),
+             'BOOLEAN': ('boolean', sqlalchemy.Boolean, 'bool'),
+             'FLOAT': ('float32', sqlalchemy.Float, 'float32'),
+             'DOUBLE': ('float64', partial(sqlalchemy.Float, 53), 'float64'),
+             'DECIMAL': ('float64', partial(sqlalchemy.Float, 53), 'float64'),
+             'DATE': ('datetime64[ns]', sqlalchemy.Date, 'date32'),
+             'DATETIME': ('datetime64[ns]', sqlalchemy.DateTime, 'timestamp[s]'),
+             'TIMESTAMP': ('datetime64[ns]', sqlalchemy.DateTime, 'timestamp[s]')}
+TEXT_TYPES = ['VARCHAR', 'TEXT', 'CHAR', 'ENUM']
+DATE_TYPES = ['DATE', 'DATETIME', 'TIMESTAMP']
+
+# Column names of the usage exports -> columns of their tables. Export columns
+# not declared for the table are dropped while cleaning.
+SOURCE_COLUMNS = {'elec_usage': {'Funds': 'funds',
+                                 'NonConsec?': 'nonconsec',
+                                 'Discard?': 'discard',
+                                 'Num': 'num',
+                                 'ACCOUNTID': 'account_id',
+                                 'STATEMENTNO': 'statement_number',
+                                 'UDCACCTID': 'account_number',
+                                 'INVOICEID': 'invoice_id',
+                                 'INVOICEDATE': 'invoice_date',
+                                 'SERVICE_PERIOD_START': 'service_period_start',
+                                 'SERVICE_PERIOD_STOP': 'service_period_stop',
+                                 'BILLEDKWH': 'billed_khw',
+                                 'Peak kW': 'peak_kw',
+                                 'SUPPLY CHARGES': 'supply_charges',
+                                 'UDC CHARGES': 'udc_charges',
+                                 'Acctnum': 'acctnum',
+                                 'Cancel / Rebill?': 'rebill',
+                                 'STATENUM': 'statenum',
+                                 'BILL MO': 'bill_month',
+                                 'ACCTG MO': 'acctg_month'},
+                  'ngas_usage': {'ADDRESS': 'address',
+                                 'Address 2': 'address2',
+                                 'City': 'city',
+                                 'Account Number': 'account_number',
+                                 'New Account Number': 'new_account_number',
+                                 'Start Date': 'service_period_start',
+                                 'End Date': 'service_period_stop',
+                                 'Therms': 'therms',
+                                 'Utility Amount': 'utility_amount',
+                                 'Supplier Amount': 'supplier_amount'}}
+
+
+def split_statements(sql):
+    '''
+    Splits the text of a .sql file into statements on the semicolons that end
+    them. Semicolons inside quoted strings or identifiers and in comments do
+    not end a statement, and comments (--, # and /* */) are left out.
+
+    Parameters
+    ----------
+    sql: (string) contents of a .sql file
+
+    Returns
+    -------
+    statements: (list of strings) statements without their semicolons, empty ones left out
+    '''
+    statements, current = [], []
+    position, length = 0, len(sql)
+    while position < length:
+        character = sql[position]
+        if character in '\'"`':
+            # A quote is escaped by a backslash or by doubling it.
+            end = position + 1
+            while end < length:
+                if sql[end] == '\\' and character != '`':
+                    end += 2
+                elif sql[end] == character and sql[end + 1:end + 2] == character:
+                    end += 2
+                elif sql[end] == character:
+                    break
+                else:
+                    end += 1
+            current.append(sql[position:end + 1])
+            position = end + 1
+        elif sql.startswith('--', position) or character == '#':
+            end = sql.find('\n', position)
+            position = length if end == -1 else end
+        elif sql.startswith('/*', position):
+            end = sql.find('*/', position + 2)
+            position = length if end == -1 else end + 2
+            current.append(' ')
+        elif character == ';':
+            statements.append(''.join(current).strip())
+            current = []
+            position += 1
+        else:
+            current.append(character)
+            position += 1
+    statements.append(''.join(current).strip())
+    return [statement for statement in statements if statement]
+
+
+def split_columns(body):
+    '''
+    Splits the body of a CREATE TABLE statement on the commas that separate
+    column definitions, ignoring commas inside parentheses such as enum('Yes','No').
+
+    Parameters
+    ----------
+    body: (string) text between the outer parentheses of a CREATE TABLE statement
+
+    Returns
+    -------
+    definitions: (list of strings) column and constraint definitions
+    '''
+    definitions, depth, current = [], 0, ''
+    for character in body:
+        if character == ',' and depth == 0:
+            definitions.append(current.strip())
+            current = ''
+            continue
+        depth += {'(': 1, ')': -1}.get(character, 0)
+        current += character
+    definitions.append(current.strip())
+    return [definition for definition in definitions if definition]
+
+
+def parse_create_tables(filepath):
+    '''
+    Reads the CREATE TABLE statements in a .sql file.
+
+    Parameters
+    ----------
+    filepath: (string) filepath for .sql file
+
+    Returns
+    -------
+    tables: (dict) table name -> {'columns': dict of column name -> SQL type,
+            'primary_key': list of primary key columns}
+    '''
+    tables = {}
+    for statement in split_statements(open(filepath).read()):
+        match = re.search(r'CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)\s*\((.*)\)',
+                          statement, re.IGNORECASE | re.DOTALL)
+        if not match:
+            continue
+        columns, primary_key = {}, []
+        for definition in split_columns(match.group(2)):
+            key = re.match(r'PRIMARY\s+KEY\s*\((.*)\)', definition, re.IGNORECASE)
+            if key:
+                primary_key = [column.strip() for column in key.group(1).split(',')]
+                continue
+            name, sql_type = definition.split(None, 1)
+            if re.search(r'\bPRIMARY\s+KEY\b', sql_type, re.IGNORECASE):
+                primary_key = [name]
+                sql_type = re.sub(r'\s*\bPRIMARY\s+KEY\b', '', sql_type, flags=re.IGNORECASE)
+            columns[name] = sql_type.strip()
+        tables[match.group(1)] = {'columns': columns, 'primary_key': primary_key}
+    return tables
+
+
+@lru_cache()
+def read_schema(ddl_directory=DDL_DIRECTORY):
+    '''
+    Reads every table defined in the create_*.sql files of the ddl directory.
+
+    Parameters
+    ----------
+    ddl_directory: (string) directory containing the .sql files
+
+    Returns
+    -------
+    tables: (dict) table name -> {'columns', 'primary_key'}, see parse_create_tables
+    '''
+    tables = {}
+    for file in sorted(listdir(ddl_directory)):
+        if file.startswith('create') and file.endswith('.sql'):
+            tables.update(parse_create_tables(join(ddl_directory, file)))
+    return tables
+
+
+def parse_indexes(filepath):
+    '''
+    Reads the CREATE INDEX statements in a .sql file.
+
+    Parameters
+    ----------
+    filepath: (string) filepath for .sql file
+
+    Returns
+    -------
+    indexes: (dict) table name -> {index name: list of indexed columns}
+    '''
+    sql = ';\n'.join(split_statements(open(filepath).read()))
+    indexes = {}
+    for name, tablename, columns in re.findall(r'CREATE\s+INDEX\s+(\w+)\s+ON\s+(\w+)\s*\(([^)]*)\)',
+                                                sql, re.IGNORECASE):
+        indexes.setdefault(tablename, {})[name] = [column.strip() for column in columns.split(',')]
+    return indexes
+
+
+@lru_cache()
+def read_indexes(ddl_directory=DDL_DIRECTORY):
+    '''
+    Reads the secondary indexes declared in the index file of the ddl directory.
+
+    Parameters
+    ----------
+    ddl_directory: (string) directory containing the .sql files
+
+    Returns
+    -------
+    indexes: (dict) table name -> {index name: columns}, see parse_indexes
+    '''
+    filepath = join(ddl_directory, INDEX_FILE)
+    return parse_indexes(filepath) if exists(filepath) else {}
+
+
+def secondary_indexes(tablename, ddl_directory=DDL_DIRECTORY):
+    '''
+    Looks up the secondary indexes declared for a table.
+
+    Parameters
+    ----------
+    tablename: (string) name of the table as declared in the ddl files
+    ddl_directory: (string) directory containing the .sql files
+
+    Returns
+    -------
+    indexes: (dict) index name -> list of indexed columns, empty if none are declared
+    '''
+    return read_indexes(ddl_directory).get(tablename, {})
+
+
+def primary_key(tablename, ddl_directory=DDL_DIRECTORY):
+    '''
+    Looks up the primary key columns of a table as declared in the ddl files.
+
+    Parameters
+    ----------
+    tablename: (string) name of the table
+    ddl_directory: (string) directory containing the .sql files
+
+    Returns
+    -------
+    columns: (list of strings) primary key columns
+    '''
+    tables = read_schema(ddl_directory)
+    assert tablename in tables, "Table {} is not defined in {}.".format(tablename, ddl_directory)
+    assert tables[tablename]['primary_key'], "Table {} has no primary key.".format(tablename)
+    return tables[tablename]['primary_key']
+
+
+def column_types(tablename, ddl_directory=DDL_DIRECTORY):
+    '''
+    Looks up the SQL types of a table's columns as declared in the ddl files.
+
+    Parameters
+    ----------
+    tablename: (string) name of the table
+    ddl_directory: (string) directory containing the .sql files
+
+    Returns
+    -------
+    columns: (dict) column name -> base SQL type in upper case, e.g. VARCHAR
+    '''
+    tables = read_schema(ddl_directory)
+    assert tablename in tables, "Table {} is not defined in {}.".format(tablename, ddl_directory)
+    return {name: re.match(r'\w+', sql_type).group(0).upper()
+            for name, sql_type in tables[tablename]['columns'].items()}
+
+
+def column_lengths(tablename, ddl_directory=DDL_DIRECTORY):
+    '''
+    Looks up the declared length of a table's CHAR and VARCHAR columns.
+
+    Parameters
+    ----------
+    tablename: (string) name of the table
+    ddl_directory: (string) directory containing the .sql files
+
+    Returns
+    -------
+    lengths: (dict) column name -> maximum number of characters
+    '''
+    tables = read_schema(ddl_directory)
+    assert tablename in tables, "Table {} is not defined in {}.".format(tablename, ddl_directory)
+    lengths = {}
+    for name, sql_type in tables[tablename]['columns'].items():
+        match = re.match(r'(?:VAR)?CHAR\s*\((\d+)\)', sql_type, re.IGNORECASE)
+        if match:
+            lengths[name] = int(match.group(1))
+    return lengths
+
+
+def table_dtypes(tablename, ddl_directory=DDL_DIRECTORY):
+    '''
+    Looks up the compact pandas dtype of each column of a table, see SQL_TYPES.
+
+    Parameters
+    ----------
+    tablename: (string) name of the table
+    ddl_directory: (string) directory containing the .sql files
+
+    Returns
+    -------
+    dtypes: (dict) column name -> pandas dtype name
+    '''
+    return {column: SQL_TYPES.get(sql_type, ('object',))[0]
+            for column, sql_type in column_types(tablename, ddl_directory).items()}
+
+
+def sqlalchemy_types(tablename, ddl_directory=DDL_DIRECTORY):
+    '''
+    Builds the SQLAlchemy type of each column of a table with its declared
+    length or values, for pandas to_sql.
+
+    Parameters
+    ----------
+    tablename: (string) name of the table
+    ddl_directory: (string) directory containing the .sql files
+
+    Returns
+    -------
+    types: (dict) column name -> SQLAlchemy type instance
+    '''
+    declared = read_schema(ddl_directory)[tablename]['columns']
+    lengths = column_lengths(tablename, ddl_directory)
+    types = {}
+    for column, sql_type in column_types(tablename, ddl_directory).items():
+        if sql_type not in SQL_TYPES:
+            continue
+        factory = SQL_TYPES[sql_type][1]
+        if sql_type == 'ENUM':
+            types[column] = factory(*re.findall(r"'([^']*)'", declared[column]), name=column)
+        elif column in lengths:
+            types[column] = factory(lengths[column])
+        else:
+            types[column] = factory()
+    return types
+
+
+def arrow_types(tablename, ddl_directory=DDL_DIRECTORY):
+    '''
+    Looks up the Arrow type each column of a table is stored as, see SQL_TYPES.
+    '''
+    import pyarrow as pa
+    return {column: pa.type_for_alias(SQL_TYPES.get(sql_type, (None, None, 'string'))[2])
+            for column, sql_type in column_types(tablename, ddl_directory).items()}
+
+
+def read_dtypes(tablename, source_columns=None, ddl_directory=DDL_DIRECTORY):
+    '''
+    Builds the reader dtypes that keep the text columns of a table as text,
+    so ids read from an export keep their leading zeros and are not turned
+    into floats by a missing value.
+
+    Parameters
+    ----------
+    tablename: (string) name of the table the export is loaded into
+    source_columns: (dict) export column -> table column, see SOURCE_COLUMNS.
+                    The export uses the table's names if None.
+    ddl_directory: (string) directory containing the .sql files
+
+    Returns
+    -------
+    dtypes: (dict) export column -> str
+    '''
+    types = column_types(tablename, ddl_directory)
+    source_columns = source_columns or {column: column for column in types}
+    return {source: str for source, column in source_columns.items() if types.get(column) in TEXT_TYPES}
+
+
+def date_columns(tablename, ddl_directory=DDL_DIRECTORY):
+    return [column for column, sql_type in column_types(tablename, ddl_directory).items() if sql_type in DATE_TYPES]
+
+
+def create_table_statement(tablename, name=None, dialect='mysql', with_primary_key=True, ddl_directory=DDL_DIRECTORY):
+    '''
+    Builds the CREATE TABLE statement for a table declared in the ddl files.
+
+    Parameters
+    ----------
+    tablename: (string) name of the table as declared in the ddl files
+    name: (string) name to give the created table, defaults to tablename
+    dialect: (string) {mysql, sqlite} database the statement is for. SQLite
+             does not understand enum columns so they become TEXT.
+    with_primary_key: (bool) whether to declare the primary key, leave it out
+                      to add it once the table is loaded
+    ddl_directory: (string) directory containing the .sql files
+
+    Returns
+    -------
+    statement: (string) CREATE TABLE IF NOT EXISTS statement
+    '''
+    tables = read_schema(ddl_directory)
+    assert tablename in tables, "Table {} is not defined in {}.".format(tablename, ddl_directory)
+    definitions = []
+    for column, sql_type in tables[tablename]['columns'].items():
+        if dialect == 'sqlite':
+            sql_type = re.sub(r'enum\s*\(.*?\)', 'TEXT', sql_type, flags=re.IGNORECASE)
+        definitions.append('{} {}'.format(column, sql_type))
+    if with_primary_key and tables[tablename]['primary_key']:
+        definitions.append('PRIMARY KEY ({})'.format(', '.join(tables[tablename]['primary_key'])))
+    return 'CREATE TABLE IF NOT EXISTS {} (\n{}\n)'.format(name or tablename, ',\n'.join(definitions))
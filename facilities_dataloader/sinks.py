@@ -0,0 +1,199 @@
+import os
+import time
+import uuid
+import shutil
+import sqlalchemy
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from os.path import join, exists, abspath
+from facilities_dataloader.schema import read_schema, arrow_types, create_table_statement
+from facilities_dataloader.defaults import SINK_TYPES
+
+# Column each Parquet table is split into directories by, one per month, so
+# reading a range of months only opens the files of those months.
+PARQUET_PARTITION_COLUMNS = {'elec_usage': 'bill_month', 'ngas_usage': 'bill_month'}
+# Rows per row group, the unit Parquet readers skip using column statistics.
+PARQUET_BATCH_ROWS = 100000
+
+
+def parquet_sink(directory, batch_rows=PARQUET_BATCH_ROWS):
+    '''
+    Describes a directory of Parquet datasets, one subdirectory per table,
+    which data_to_db can write to in place of an engine.
+
+    Parameters
+    ----------
+    directory: (string) directory holding the datasets, created if missing
+    batch_rows: (int) rows per row group
+
+    Returns
+    -------
+    sink: (dict) backend, directory and batch_rows
+    '''
+    os.makedirs(directory, exist_ok=True)
+    return {'backend': 'parquet', 'directory': abspath(directory), 'batch_rows': batch_rows}
+
+
+def is_parquet(sink):
+    return isinstance(sink, dict) and sink.get('backend') == 'parquet'
+
+
+def sqlite_sink(path):
+    '''
+    Opens a SQLite database file, creating it and the tables declared in the
+    ddl files if needed, so loads into it get the declared column types rather
+    than the ones pandas would guess.
+
+    Parameters
+    ----------
+    path: (string) location of the database file
+
+    Returns
+    -------
+    engine: (sqlalchemy.engine.base.Engine) Connection to the database.
+    '''
+    engine = sqlalchemy.create_engine('sqlite:///{}'.format(abspath(path)))
+    with engine.begin() as connection:
+        for tablename in read_schema():
+            connection.exec_driver_sql(create_table_statement(tablename, dialect='sqlite'))
+    return engine
+
+
+def open_sink(target):
+    '''
+    Opens what a load writes to instead of the MySQL database of creds.yml.
+
+    Parameters
+    ----------
+    target: (string) parquet:DIRECTORY or sqlite:PATH, see SINK_TYPES
+
+    Returns
+    -------
+    sink: (dict or sqlalchemy.engine.base.Engine) see parquet_sink and sqlite_sink
+    '''
+    backend, _, location = target.partition(':')
+    assert backend in SINK_TYPES and location, \
+        'Please give the sink as one of {} followed by a path, e.g. parquet:exports, not {}.'.format(
+            ['{}:PATH'.format(backend) for backend in SINK_TYPES], target)
+    return parquet_sink(location) if backend == 'parquet' else sqlite_sink(location)
+
+
+def arrow_schema(tablename):
+    '''
+    Arrow schema of a table as declared in the ddl files, see schema.SQL_TYPES.
+    '''
+    return pa.schema(list(arrow_types(tablename).items()))
+
+
+def arrow_table(data, tablename):
+    '''
+    Converts rows to the declared types of a table. Declared columns missing
+    from data are written as nulls, so every file of a dataset has the same
+    schema.
+
+    Parameters
+    ----------
+    data: (DataFrame) cleaned rows of tablename
+    tablename: (string) name of the table as declared in the ddl files
+
+    Returns
+    -------
+    table: (pyarrow.Table) rows with the columns and types of arrow_schema
+    '''
+    schema = arrow_schema(tablename)
+    unknown = set(data.columns) - set(schema.names)
+    assert not unknown, 'Columns {} are not declared for {}.'.format(sorted(unknown), tablename)
+    arrays = []
+    for field in schema:
+        if field.name not in data.columns:
+            arrays.append(pa.nulls(len(data), field.type))
+            continue
+        values = data[field.name]
+        if pa.types.is_string(field.type):
+            values = values.astype(object)
+            values = values.where(values.isna(), values.astype(str))
+        elif pa.types.is_temporal(field.type):
+            values = pd.to_datetime(values, errors='coerce')
+        else:
+            values = pd.to_numeric(values, errors='coerce')
+            if pa.types.is_boolean(field.type) or pa.types.is_integer(field.type):
+                values = values.astype('Int64')
+        arrays.append(pa.array(values, from_pandas=True).cast(field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def partitioning(tablename):
+    column = PARQUET_PARTITION_COLUMNS.get(tablename)
+    if column is None:
+        return None
+    return ds.partitioning(pa.schema([arrow_schema(tablename).field(column)]), flavor='hive')
+
+
+def write_parquet(data, tablename, sink, if_exists='append'):
+    '''
+    Writes rows to the Parquet dataset of a table in row groups of the sink's
+    batch_rows, partitioned by month for the usage tables. Every write adds
+    new files, so appending never rewrites what is already there.
+
+    Parameters
+    ----------
+    data: (DataFrame) cleaned rows of tablename
+    tablename: (string) name of the table as declared in the ddl files
+    sink: (dict) see parquet_sink
+    if_exists: (string) {append, replace} replace removes the dataset first
+
+    Returns
+    -------
+    None
+    '''
+    assert if_exists in ['append', 'replace'], 'Parquet datasets can be appended to or replaced, not {}.'.format(if_exists)
+    directory = join(sink['directory'], tablename)
+    if if_exists == 'replace' and exists(directory):
+        shutil.rmtree(directory)
+    if data.empty:
+        return None
+    table = arrow_table(data, tablename)
+    # A name no earlier write used, in write order when listed.
+    basename = 'part-{}-{}-{{i}}.parquet'.format(time.strftime('%Y%m%d%H%M%S'), uuid.uuid4().hex[:8])
+    ds.write_dataset(table, directory, format='parquet', partitioning=partitioning(tablename),
+                     basename_template=basename, existing_data_behavior='overwrite_or_ignore',
+                     max_rows_per_group=sink['batch_rows'], min_rows_per_group=min(sink['batch_rows'], len(table)))
+
+
+def read_parquet(sink, tablename, columns=None, start=None, end=None, by=None):
+    '''
+    Reads a table back from its Parquet dataset. Only the months of a usage
+    table from start to end are opened, and other range filters skip the row
+    groups whose statistics rule them out.
+
+        read_parquet(sink, 'elec_usage', ['account_number', 'billed_khw'], '2017-01-01', '2018-01-01')
+
+    Parameters
+    ----------
+    sink: (dict) see parquet_sink
+    tablename: (string) name of the table as declared in the ddl files
+    columns: (list of strings) columns to read, all of them if None
+    start: (string or date) only rows with by on or after this date
+    end: (string or date) only rows with by before this date
+    by: (string) date column start and end apply to, by default the
+        partition column of the table, see PARQUET_PARTITION_COLUMNS
+
+    Returns
+    -------
+    data: (DataFrame) rows of the table
+    '''
+    schema = arrow_schema(tablename)
+    directory = join(sink['directory'], tablename)
+    if not exists(directory):
+        return schema.empty_table().to_pandas(date_as_object=False)[columns or schema.names]
+    dataset = ds.dataset(directory, schema=schema, format='parquet', partitioning=partitioning(tablename))
+    by = by or PARQUET_PARTITION_COLUMNS.get(tablename)
+    condition = None
+    for bound, operator in [(start, '__ge__'), (end, '__lt__')]:
+        if bound is not None:
+            assert by, 'Please give the date column to filter {} by.'.format(tablename)
+            value = pa.scalar(pd.Timestamp(bound).to_pydatetime(), pa.timestamp('s')).cast(schema.field(by).type)
+            compared = getattr(ds.field(by), operator)(value)
+            condition = compared if condition is None else condition & compared
+    return dataset.to_table(columns=columns, filter=condition).to_pandas(date_as_object=False)
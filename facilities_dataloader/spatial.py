@@ -0,0 +1,338 @@
+import os
+import hashlib
+import sqlalchemy
+import numpy as np
+import pandas as pd
+from os.path import join, exists
+from facilities_dataloader import cache
+from facilities_dataloader.sinks import is_parquet
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180
+# Side of a grid cell. Buildings are a few hundred meters to a few km apart.
+CELL_KM = 1.0
+# Highest latitude used to size cells, cells closer to the poles are wider.
+MAX_LATITUDE = 89.0
+
+# Written abbreviated by the buildings export, see normalize_addresses.
+ADDRESS_WORDS = {'STREET': 'ST', 'AVENUE': 'AVE', 'ROAD': 'RD', 'BOULEVARD': 'BLVD', 'DRIVE': 'DR',
+                 'PLACE': 'PL', 'PARKWAY': 'PKWY', 'COURT': 'CT', 'NORTH': 'N', 'SOUTH': 'S',
+                 'EAST': 'E', 'WEST': 'W'}
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    '''
+    Great circle distances between points, broadcasting like numpy.
+    '''
+    phi1, phi2 = np.radians(latitude), np.radians(latitudes)
+    dphi = phi2 - phi1
+    dlambda = np.radians(longitudes) - np.radians(longitude)
+    a = np.sin(dphi / 2)**2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2)**2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def build_index(buildings, cell_km=CELL_KM):
+    '''
+    Builds a grid index over the coordinates of buildings: every building is
+    put in a cell of about cell_km by cell_km and the buildings are sorted by
+    cell, so the buildings of a row of cells are one slice of the arrays.
+    Buildings without coordinates are left out.
+
+    Parameters
+    ----------
+    buildings: (DataFrame) activity_code, latitude and longitude of every building
+    cell_km: (float) side of a grid cell in km
+
+    Returns
+    -------
+    index: (dict of ndarrays) the grid, see within_radius, nearest and match_nearest
+    '''
+    latitude = pd.to_numeric(buildings['latitude'], errors='coerce').to_numpy(dtype=float)
+    longitude = pd.to_numeric(buildings['longitude'], errors='coerce').to_numpy(dtype=float)
+    located = np.isfinite(latitude) & np.isfinite(longitude)
+    assert located.any(), 'No building has coordinates.'
+    latitude, longitude = latitude[located], longitude[located]
+    codes = buildings['activity_code'].to_numpy()[located].astype(str)
+
+    # Longitude cells are sized at the latitude furthest from the equator so
+    # no cell is narrower than cell_km.
+    widest = min(np.abs(latitude).max(), MAX_LATITUDE)
+    lat_step = cell_km / KM_PER_DEGREE
+    lon_step = cell_km / (KM_PER_DEGREE * np.cos(np.radians(widest)))
+    origin = np.array([latitude.min(), longitude.min()])
+    rows = ((latitude - origin[0]) // lat_step).astype(np.int64)
+    columns = ((longitude - origin[1]) // lon_step).astype(np.int64)
+    shape = np.array([rows.max() + 1, columns.max() + 1])
+    cells = rows * shape[1] + columns
+    order = np.argsort(cells, kind='stable')
+    return {'latitude': latitude[order], 'longitude': longitude[order], 'activity_code': codes[order],
+            'cell': cells[order], 'origin': origin, 'step': np.array([lat_step, lon_step]), 'shape': shape}
+
+
+def cell_of(index, latitude, longitude):
+    '''
+    Row and column of the cells holding points, outside the grid for points
+    outside the buildings' bounding box.
+    '''
+    row = np.floor((np.asarray(latitude, dtype=float) - index['origin'][0]) / index['step'][0]).astype(np.int64)
+    column = np.floor((np.asarray(longitude, dtype=float) - index['origin'][1]) / index['step'][1]).astype(np.int64)
+    return row, column
+
+
+def candidates(index, first_row, last_row, first_column, last_column):
+    '''
+    Positions of the buildings in a block of cells, bounds included.
+    '''
+    first_row, last_row = max(first_row, 0), min(last_row, index['shape'][0] - 1)
+    first_column, last_column = max(first_column, 0), min(last_column, index['shape'][1] - 1)
+    if first_row > last_row or first_column > last_column:
+        return np.empty(0, dtype=np.int64)
+    rows = np.arange(first_row, last_row + 1) * index['shape'][1]
+    starts = np.searchsorted(index['cell'], rows + first_column, side='left')
+    stops = np.searchsorted(index['cell'], rows + last_column, side='right')
+    if not (stops > starts).any():
+        return np.empty(0, dtype=np.int64)
+    return np.concatenate([np.arange(start, stop) for start, stop in zip(starts, stops) if stop > start])
+
+
+def _within(index, latitude, longitude, km):
+    '''
+    Positions and distances of the buildings within km of a point, unsorted.
+    '''
+    lat_span = km / KM_PER_DEGREE
+    nearest_pole = min(abs(latitude) + lat_span, MAX_LATITUDE)
+    lon_span = km / (KM_PER_DEGREE * np.cos(np.radians(nearest_pole)))
+    if abs(latitude) + lat_span >= 90 or lon_span >= 180:
+        # The circle reaches a pole or around the world, every longitude is in it.
+        lon_span = np.inf
+    first_row, first_column = cell_of(index, latitude - lat_span, longitude - min(lon_span, 360))
+    last_row, last_column = cell_of(index, latitude + lat_span, longitude + min(lon_span, 360))
+    found = candidates(index, first_row, last_row, first_column, last_column)
+    distances = haversine_km(latitude, longitude, index['latitude'][found], index['longitude'][found])
+    close = distances <= km
+    return found[close], distances[close]
+
+
+def result(index, found, distances):
+    order = np.argsort(distances, kind='stable')
+    return pd.DataFrame({'activity_code': index['activity_code'][found[order]],
+                         'distance_km': distances[order]})
+
+
+def within_radius(index, latitude, longitude, km):
+    '''
+    Finds the buildings within a distance of a point.
+
+    Parameters
+    ----------
+    index: (dict) see build_index
+    latitude: (float) latitude of the point
+    longitude: (float) longitude of the point
+    km: (float) radius in km
+
+    Returns
+    -------
+    buildings: (DataFrame) activity_code and distance_km, nearest first
+    '''
+    return result(index, *_within(index, latitude, longitude, km))
+
+
+def nearest(index, latitude, longitude, k=1):
+    '''
+    Finds the k buildings closest to a point, searching a radius that doubles
+    until it holds k buildings.
+
+    Parameters
+    ----------
+    index: (dict) see build_index
+    latitude: (float) latitude of the point
+    longitude: (float) longitude of the point
+    k: (int) number of buildings
+
+    Returns
+    -------
+    buildings: (DataFrame) activity_code and distance_km of the k nearest
+               buildings, nearest first
+    '''
+    assert k >= 1, 'Please ask for at least one building.'
+    return result(index, *_nearest(index, latitude, longitude, k))
+
+
+def _nearest(index, latitude, longitude, k):
+    '''
+    Positions and distances of the k buildings closest to a point, nearest first.
+    '''
+    k = min(k, len(index['cell']))
+    km = CELL_KM
+    while True:
+        found, distances = _within(index, latitude, longitude, km)
+        if len(found) >= k:
+            order = np.argsort(distances, kind='stable')[:k]
+            return found[order], distances[order]
+        km *= 2
+
+
+def match_nearest(index, latitudes, longitudes, max_km=None):
+    '''
+    Matches many points, such as meter or service locations, to their nearest
+    building. Points are grouped by grid cell and each group is compared with
+    the buildings of the surrounding block of 3 by 3 cells at once. Points
+    whose match is further away than the block guarantees, or that have no
+    building around them, are searched again in blocks twice as wide.
+
+    Parameters
+    ----------
+    index: (dict) see build_index
+    latitudes: (array of floats) latitude of every point
+    longitudes: (array of floats) longitude of every point
+    max_km: (float) leave points further than this from every building unmatched
+
+    Returns
+    -------
+    matches: (DataFrame) activity_code and distance_km for every point, in the
+             order given, missing for points without coordinates or a building
+             within max_km
+    '''
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    best = np.full(len(latitudes), -1, dtype=np.int64)
+    distance = np.full(len(latitudes), np.inf)
+    pending = np.flatnonzero(np.isfinite(latitudes) & np.isfinite(longitudes))
+    lat_step, lon_step = index['step']
+    reach = 1
+    while len(pending):
+        rows, columns = cell_of(index, latitudes[pending], longitudes[pending])
+        cells, group = np.unique(np.stack([rows, columns], axis=1), axis=0, return_inverse=True)
+        group = group.reshape(-1)
+        for number, (row, column) in enumerate(cells):
+            found = candidates(index, row - reach, row + reach, column - reach, column + reach)
+            if not len(found):
+                continue
+            points = pending[group == number]
+            distances = haversine_km(latitudes[points, None], longitudes[points, None],
+                                     index['latitude'][found], index['longitude'][found])
+            closest = distances.argmin(axis=1)
+            best[points] = found[closest]
+            distance[points] = distances[np.arange(len(points)), closest]
+
+        if reach >= index['shape'].max():
+            # Points far outside the grid, compared with every building.
+            for points in np.array_split(pending, max(len(pending) // 1000, 1)):
+                distances = haversine_km(latitudes[points, None], longitudes[points, None],
+                                         index['latitude'], index['longitude'])
+                best[points] = distances.argmin(axis=1)
+                distance[points] = distances.min(axis=1)
+            break
+        # A building outside the block is at least reach cells away, cells
+        # being narrower toward the poles.
+        toward_pole = np.radians(np.minimum(np.abs(latitudes[pending]) + reach * lat_step, MAX_LATITUDE))
+        across = 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(
+            np.cos(toward_pole) * np.sin(np.radians(min(reach * lon_step, 180)) / 2), 1))
+        certain = np.minimum(reach * lat_step * KM_PER_DEGREE, across)
+        pending = pending[distance[pending] > certain]
+        reach *= 2
+
+    matched = best >= 0
+    if max_km is not None:
+        matched &= distance <= max_km
+    codes = pd.Series(index['activity_code'][np.maximum(best, 0)], dtype=object).where(matched)
+    return pd.DataFrame({'activity_code': codes, 'distance_km': np.where(matched, distance, np.nan)})
+
+
+def normalize_addresses(addresses):
+    '''
+    Puts street addresses in one spelling: upper case, no punctuation, single
+    spaces and common words abbreviated, e.g. '123 North State Street.' to
+    '123 N STATE ST'.
+    '''
+    addresses = addresses.astype('string').str.upper().str.replace(r'[.,#]', ' ', regex=True)
+    addresses = addresses.str.replace(r'\s+', ' ', regex=True).str.strip()
+    pattern = r'\b({})\b'.format('|'.join(ADDRESS_WORDS))
+    return addresses.str.replace(pattern, lambda match: ADDRESS_WORDS[match.group(1)], regex=True)
+
+
+def match_addresses(addresses, buildings):
+    '''
+    Matches service addresses, such as those of ngas_usage, to the building at
+    the same address. Without a geocoder addresses are matched on their
+    normalized text, see normalize_addresses; match coordinates with match_nearest.
+
+    Parameters
+    ----------
+    addresses: (Series of strings) addresses to match
+    buildings: (DataFrame) activity_code and address of every building
+
+    Returns
+    -------
+    activity_codes: (Series) activity_code of every address, missing where
+                    no building has that address
+    '''
+    known = pd.Series(buildings['activity_code'].to_numpy(),
+                      index=normalize_addresses(buildings['address']).to_numpy())
+    known = known[~known.index.duplicated() & known.index.notna()]
+    return normalize_addresses(addresses).map(known).astype(object)
+
+
+def index_path(engine):
+    '''
+    Location of the index of a database's buildings, in the cache directory.
+    '''
+    digest = hashlib.sha1(repr(engine.url).encode()).hexdigest()[:16]
+    return join(cache.CACHE_DIRECTORY, 'buildings-{}.npz'.format(digest))
+
+
+def save_index(index, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    partial = path + '.partial.npz'
+    np.savez(partial, **index)
+    os.replace(partial, path)
+
+
+def load_index(path):
+    with np.load(path, allow_pickle=False) as arrays:
+        return {name: arrays[name] for name in arrays.files}
+
+
+def building_index(engine, rebuild=False):
+    '''
+    Returns the spatial index of the buildings table, read from disk if it was
+    built before, see save_building_index.
+
+    Parameters
+    ----------
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+    rebuild: (bool) build it again from the buildings table
+
+    Returns
+    -------
+    index: (dict) see build_index
+    '''
+    path = index_path(engine)
+    if not rebuild and exists(path):
+        return load_index(path)
+    buildings = pd.read_sql('SELECT activity_code, latitude, longitude FROM buildings', engine)
+    index = build_index(buildings)
+    save_index(index, path)
+    return index
+
+
+def save_building_index(engine):
+    '''
+    Rebuilds the index saved for a database after its buildings were loaded.
+    Buildings without any coordinates, such as a partial export, leave no index,
+    nor do buildings written to a Parquet sink.
+    '''
+    if is_parquet(engine):
+        return None
+    columns = {column['name'] for column in sqlalchemy.inspect(engine).get_columns('buildings')}
+    try:
+        assert {'activity_code', 'latitude', 'longitude'} <= columns, 'Buildings have no coordinates to index.'
+        index = building_index(engine, rebuild=True)
+    except AssertionError as e:
+        # An index of the buildings loaded before would be out of date.
+        if exists(index_path(engine)):
+            os.remove(index_path(engine))
+        print(e)
+        return None
+    print('Indexed the coordinates of {} buildings in {}.'.format(len(index['cell']), index_path(engine)))
+    return index
@@ -0,0 +1,189 @@
+import sqlalchemy
+from facilities_dataloader.helper import bump_table_versions
+from facilities_dataloader.schema import primary_key, secondary_indexes, create_table_statement
+from facilities_dataloader.table_manager import (PARTITION_COLUMNS, partition_years, partition_clause,
+                                                 partitioned_primary_key)
+from facilities_dataloader.parallel import DATASETS, parallel_load
+from facilities_dataloader.rollups import refresh_rollups
+from facilities_dataloader.spatial import save_building_index
+from facilities_dataloader.accounts import rebuild_account_indexes
+
+SHADOW_SUFFIX = '_shadow'
+OLD_SUFFIX = '_old'
+
+
+def shadow_name(tablename):
+    return tablename + SHADOW_SUFFIX
+
+
+def dialect_of(engine):
+    return 'sqlite' if engine.dialect.name == 'sqlite' else 'mysql'
+
+
+def create_shadow_table(tablename, engine):
+    '''
+    Creates an empty copy of a table, as declared in the ddl files, to load a
+    full reload into. On MySQL the primary key is left out so rows are
+    inserted without maintaining an index and the key is added once the table
+    is loaded, see build_indexes. SQLite cannot add a primary key to an
+    existing table so there the shadow table is created with it.
+
+    Parameters
+    ----------
+    tablename: (string) name of the table as declared in the ddl files
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+
+    Returns
+    -------
+    shadow: (string) name of the shadow table
+    '''
+    shadow = shadow_name(tablename)
+    dialect = dialect_of(engine)
+    statement = create_table_statement(tablename, name=shadow, dialect=dialect,
+                                       with_primary_key=dialect == 'sqlite')
+    with engine.begin() as connection:
+        # A shadow table left behind by a failed reload is started over.
+        connection.execute(sqlalchemy.text('DROP TABLE IF EXISTS {}'.format(shadow)))
+        connection.execute(sqlalchemy.text(statement))
+    return shadow
+
+
+def build_indexes(tablename, engine):
+    '''
+    Adds the primary key and the secondary indexes declared in ddl/indexes.sql
+    to a loaded MySQL shadow table in one ALTER TABLE, and partitions it like
+    the live table if that one is partitioned. Duplicate keys in the loaded
+    rows make this fail, before the shadow table replaces the live one. On
+    SQLite the secondary indexes are created by swap_tables, as index names
+    there belong to the whole database.
+
+    Parameters
+    ----------
+    tablename: (string) name of the table as declared in the ddl files
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+
+    Returns
+    -------
+    None
+    '''
+    if dialect_of(engine) == 'sqlite':
+        return None
+    years = partition_years(engine, tablename)
+    key = partitioned_primary_key(tablename) if years else primary_key(tablename)
+    additions = ['ADD PRIMARY KEY ({})'.format(', '.join(key))]
+    additions += ['ADD INDEX {} ({})'.format(name, ', '.join(columns))
+                  for name, columns in secondary_indexes(tablename).items()]
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text('ALTER TABLE {} {}'.format(shadow_name(tablename), ', '.join(additions))))
+        if years:
+            connection.execute(sqlalchemy.text('ALTER TABLE {} {}'.format(
+                shadow_name(tablename), partition_clause(PARTITION_COLUMNS[tablename], years[0], years[-1]))))
+
+
+def swap_tables(tablenames, engine):
+    '''
+    Replaces live tables with their loaded shadow tables in one step, so
+    readers see either every old table or every new one and never an empty or
+    partly loaded table. MySQL renames all the tables in a single RENAME TABLE
+    statement, SQLite in a single transaction which also indexes the new
+    tables. The old tables are dropped.
+
+    Parameters
+    ----------
+    tablenames: (list of strings) names of the live tables
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+
+    Returns
+    -------
+    None
+    '''
+    existing = set(sqlalchemy.inspect(engine).get_table_names())
+    drop_tables([tablename + OLD_SUFFIX for tablename in tablenames], engine)
+    renames = []
+    for tablename in tablenames:
+        if tablename in existing:
+            renames.append((tablename, tablename + OLD_SUFFIX))
+        renames.append((shadow_name(tablename), tablename))
+    old_tables = [tablename + OLD_SUFFIX for tablename in tablenames if tablename in existing]
+
+    if dialect_of(engine) == 'sqlite':
+        # pysqlite does not open a transaction for DDL on its own.
+        connection = engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute('BEGIN')
+            for current, new in renames:
+                cursor.execute('ALTER TABLE {} RENAME TO {}'.format(current, new))
+            for old in old_tables:
+                cursor.execute('DROP TABLE {}'.format(old))
+            for tablename in tablenames:
+                for name, columns in secondary_indexes(tablename).items():
+                    cursor.execute('CREATE INDEX {} ON {} ({})'.format(name, tablename, ', '.join(columns)))
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+        bump_table_versions(*tablenames)
+        return None
+
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text('RENAME TABLE {}'.format(
+            ', '.join('{} TO {}'.format(current, new) for current, new in renames))))
+        for old in old_tables:
+            connection.execute(sqlalchemy.text('DROP TABLE {}'.format(old)))
+    bump_table_versions(*tablenames)
+
+
+def drop_tables(tablenames, engine):
+    with engine.begin() as connection:
+        for tablename in tablenames:
+            connection.execute(sqlalchemy.text('DROP TABLE IF EXISTS {}'.format(tablename)))
+
+
+def reload_tables(files, engine, workers=1, method='default', chunksize=None):
+    '''
+    Fully reloads tables without readers ever seeing them empty: the files are
+    loaded into shadow tables, indexed and then swapped in for the live tables
+    at once, after which usage is stamped with the buildings of reloaded
+    accounts and every month of the rollups is recomputed. If any file
+    fails, the shadow tables are dropped and the live tables are left as they were.
+
+    Parameters
+    ----------
+    files: (dict) dataset -> list of file paths, every file of each table
+           reloaded, see parallel.discover_files
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+    workers: (int) number of files cleaned and tables loaded at once
+    method: (string) {default, multi, infile} how rows are sent, see data_to_db.
+    chunksize: (int) number of rows per statement.
+
+    Returns
+    -------
+    report: (list of dicts) outcome of every file, see parallel.load_dataset
+    '''
+    assert method != 'upsert', 'Shadow tables start empty, load them with default, multi or infile.'
+    tablenames = [DATASETS[dataset][1] for dataset in DATASETS if files.get(dataset)]
+    for tablename in tablenames:
+        create_shadow_table(tablename, engine)
+
+    report = parallel_load(files, engine, workers, method, chunksize,
+                           tablenames={tablename: shadow_name(tablename) for tablename in tablenames})
+    try:
+        assert all(result['status'] == 'loaded' for result in report), 'Some files failed to load.'
+        for tablename in tablenames:
+            build_indexes(tablename, engine)
+    except Exception as e:
+        drop_tables([shadow_name(tablename) for tablename in tablenames], engine)
+        print('Reload aborted, {} left unchanged: {}'.format(', '.join(tablenames), str(e).split('[SQL')[0]))
+        return report
+
+    swap_tables(tablenames, engine)
+    print('Reloaded {}.'.format(', '.join(tablenames)))
+    # Usage was stamped from the accounts before the reload.
+    rebuild_account_indexes(engine, tablenames)
+    refresh_rollups(engine)
+    if 'buildings' in tablenames:
+        save_building_index(engine)
+    return report
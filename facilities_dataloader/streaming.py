@@ -0,0 +1,218 @@
+import asyncio
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from facilities_dataloader.helper import read_data_chunks, data_to_db, comparable
+from facilities_dataloader.instrument import stage
+from facilities_dataloader.defaults import PIPELINE_DEPTH
+from facilities_dataloader.validation import screen
+from facilities_dataloader.accounts import stamp_buildings
+from facilities_dataloader.rollups import USAGE_TABLES, touched_months, refresh_rollups
+
+
+def clean_chunks(filepath, dataset, clean, rows, sep=','):
+    '''
+    Reads and cleans a .csv file one chunk at a time.
+
+    Parameters
+    ----------
+    filepath: (string) location of the .csv file
+    dataset: (string) dataset type passed to read_data
+    clean: (function) takes a raw chunk and returns it cleaned, e.g. clean_electricity
+    rows: (int) number of rows per chunk
+    sep: (string) field separator
+
+    Returns
+    -------
+    chunks: (generator of DataFrames) cleaned chunks
+    '''
+    for chunk in read_data_chunks(filepath, dataset, rows, sep):
+        yield clean(chunk)
+
+
+def seen_before(seen, hashes):
+    '''
+    Looks hashes up in the sorted runs of seen, see remember_hashes.
+
+    Returns
+    -------
+    found: (ndarray of bool) True for the hashes in seen
+    '''
+    # Looked up in order, the searches walk each run once.
+    order = np.argsort(hashes)
+    ordered = hashes[order]
+    found = np.zeros(len(hashes), dtype=bool)
+    for run in seen:
+        positions = np.minimum(np.searchsorted(run, ordered), len(run) - 1)
+        found[order] |= run[positions] == ordered
+    return found
+
+
+def remember_hashes(seen, hashes):
+    '''
+    Adds hashes to seen as a sorted run, then merges the last run into the one
+    before while that one is no larger. Each run is then more than twice the
+    size of the next, so there are at most log2 of the rows seen of them, and
+    a hash is copied once per merge rather than once per chunk.
+
+    Parameters
+    ----------
+    seen: (list of ndarrays of uint64) sorted runs of hashes, changed in place
+    hashes: (ndarray of uint64) hashes to add, none of them in seen yet
+
+    Returns
+    -------
+    seen: (list of ndarrays of uint64) the runs
+    '''
+    if not len(hashes):
+        return seen
+    seen.append(np.unique(hashes))
+    while len(seen) > 1 and len(seen[-2]) <= len(seen[-1]):
+        last = seen.pop()
+        merged = np.concatenate([seen[-1], last])
+        # Timsort merges the two sorted halves in linear time.
+        merged.sort(kind='stable')
+        seen[-1] = merged
+    return seen
+
+
+def drop_seen_rows(chunk, tablename, seen):
+    '''
+    Drops rows that duplicate a row in the same chunk or in an earlier one.
+    Earlier rows are remembered only by a 64 bit hash, see remember_hashes.
+
+    Parameters
+    ----------
+    chunk: (DataFrame) cleaned chunk
+    tablename: (string) name of the table as declared in the ddl files, used to
+               hash values the same way whatever dtype a chunk was read with
+    seen: (list of ndarrays of uint64) hashes of the rows already kept
+
+    Returns
+    -------
+    chunk: (DataFrame) rows of chunk not seen before
+    seen: (list of ndarrays of uint64) seen with the hashes of the kept rows added
+    '''
+    hashes = pd.util.hash_pandas_object(comparable(chunk, tablename), index=False).to_numpy()
+    first = ~pd.Series(hashes).duplicated().to_numpy() & ~seen_before(seen, hashes)
+    return chunk[first], remember_hashes(seen, hashes[first])
+
+
+async def run_pipeline(items, write, depth=PIPELINE_DEPTH):
+    '''
+    Reads items in one thread while another writes them, so that reading and
+    cleaning the next chunk or file overlaps with writing the previous one.
+    At most depth items wait between the two: reading pauses while the queue
+    is full, which bounds memory use whatever the size of the input.
+
+    Parameters
+    ----------
+    items: (iterable) produces the items, e.g. a generator of cleaned chunks.
+           It is only advanced from the reading thread.
+    write: (function) called with every item, in order, from the writing thread
+    depth: (int) number of items read ahead of the write
+
+    Returns
+    -------
+    results: (list) return values of write, in order
+    '''
+    assert depth >= 1, 'Please read at least one item ahead.'
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=depth)
+    iterator = iter(items)
+    done = object()
+
+    async def read(reader):
+        while True:
+            item = await loop.run_in_executor(reader, next, iterator, done)
+            await queue.put(item)
+            if item is done:
+                return
+
+    async def send(writer):
+        results = []
+        while True:
+            item = await queue.get()
+            if item is done:
+                return results
+            results.append(await loop.run_in_executor(writer, write, item))
+
+    with ThreadPoolExecutor(1) as reader, ThreadPoolExecutor(1) as writer:
+        tasks = [asyncio.ensure_future(read(reader)), asyncio.ensure_future(send(writer))]
+        # A failing side would leave the other waiting on the queue forever.
+        finished, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    for task in finished:
+        if task.exception():
+            raise task.exception()
+    return tasks[1].result()
+
+
+def pipeline(items, write, depth=PIPELINE_DEPTH):
+    '''
+    Runs run_pipeline to completion from synchronous code, see run_pipeline.
+    '''
+    return asyncio.run(run_pipeline(items, write, depth))
+
+
+def stream_data_to_db(filepath, dataset, clean, tablename, engine, rows, method='default', chunksize=None, depth=None):
+    '''
+    Loads a .csv file into a table chunk by chunk: each chunk is read, cleaned,
+    deduplicated against the rows already sent and written, so memory use is
+    bounded by rows (and depth) plus 8 bytes per row kept rather than by the
+    file size. Rows whose key was already in the table are skipped.
+
+    Parameters
+    ----------
+    filepath: (string) location of the .csv file
+    dataset: (string) dataset type passed to read_data
+    clean: (function) takes a raw chunk and returns it cleaned, e.g. clean_electricity
+    tablename: (string) name of the table to load into
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+    rows: (int) number of rows read per chunk
+    method: (string) {default, multi, infile, upsert} how rows are sent, see data_to_db.
+    chunksize: (int) number of rows per statement when method is multi or upsert.
+    depth: (int) read and clean up to this many chunks ahead while the previous
+           one is written, see run_pipeline. Chunks are read and written in
+           turn if None.
+
+    Returns
+    -------
+    totals: (dict) number of rows loaded, dropped as duplicates, quarantined
+            by validation, skipped as already in the table and failed
+    '''
+    totals = {'loaded': 0, 'duplicates': 0, 'quarantined': 0, 'skipped': 0, 'failed': 0}
+    seen = []
+    months = set()
+
+    def write(chunk):
+        with stage('drop_seen_rows', chunk, table=tablename) as record:
+            unique, _ = drop_seen_rows(chunk, tablename, seen)
+            record['rows_out'] = len(unique)
+        totals['duplicates'] += len(chunk) - len(unique)
+        good = screen(unique, tablename, filepath)
+        totals['quarantined'] += len(unique) - len(good)
+        good = stamp_buildings(good, tablename, engine)
+        stats = data_to_db(good, tablename, engine, method=method, chunksize=chunksize, skip_existing=True)
+        if stats is None:
+            totals['failed'] += len(good)
+        else:
+            totals['loaded'] += stats['rows']
+            totals['skipped'] += stats.get('skipped', 0)
+            if stats['rows']:
+                months.update(touched_months(good))
+
+    chunks = clean_chunks(filepath, dataset, clean, rows)
+    if depth:
+        pipeline(chunks, write, depth)
+    else:
+        for chunk in chunks:
+            write(chunk)
+    print('Streamed {} into {}: {loaded} rows loaded, {duplicates} duplicates dropped, '
+          '{quarantined} quarantined, {skipped} already in the table, {failed} failed.'.format(
+        filepath, tablename, **totals))
+    if tablename in USAGE_TABLES:
+        refresh_rollups(engine, sorted(months))
+    return totals
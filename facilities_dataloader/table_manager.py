@@ -1,9 +1,44 @@
-import yaml
-from os import listdir
-from os.path import join
-from facilities_dataloader.helper import create_mysql_engine
+import hashlib
+import datetime
+import sqlalchemy
+from os.path import join, exists
+from contextlib import contextmanager
+from facilities_dataloader.engines import get_engine, load_credentials, bump_table_versions
+from facilities_dataloader.sinks import is_parquet
+from facilities_dataloader.schema import (DDL_DIRECTORY, read_schema, read_indexes, secondary_indexes, primary_key,
+                                          split_statements, parse_create_tables)
 
-CONFIG = yaml.load(open('creds.yml'))
+# .sql files run by create_tables and drop_tables, in this order: tables are
+# created before the tables that refer to them.
+CREATE_FILES = ['create_buildings.sql', 'create_electricity.sql', 'create_natural_gas.sql',
+                'create_manifest.sql', 'create_rollups.sql', 'create_anomalies.sql']
+DROP_FILES = ['drop_tables.sql']
+
+# Records the .sql files applied to a database, see execute_sql_files.
+SCHEMA_VERSION_TABLE = 'schema_version'
+SCHEMA_VERSION_DDL = '''CREATE TABLE IF NOT EXISTS schema_version (
+filename VARCHAR(255) PRIMARY KEY,
+checksum CHAR(64),
+applied_at DATETIME
+)'''
+
+# Column the usage tables are RANGE partitioned on, see partition_tables.
+PARTITION_COLUMNS = {'elec_usage': 'bill_month', 'ngas_usage': 'bill_month'}
+
+def ddl_directory(credentials):
+    '''
+    Looks up the directory holding the .sql files, given by ddl_directory in
+    the credentials file or else the ddl directory of this repository.
+
+    Parameters
+    ----------
+    credentials: (string) Path to YAML file containing database credentials.
+
+    Returns
+    -------
+    directory: (string) directory containing the .sql files
+    '''
+    return load_credentials(credentials).get('ddl_directory', DDL_DIRECTORY)
 
 def process_sql_statements(filepath):
     '''
@@ -15,23 +50,317 @@ def process_sql_statements(filepath):
 
     Returns
     -------
-    statements: (list of strings) list of string SQL statements
+    statements: (list of strings) list of string SQL statements, see schema.split_statements
+    '''
+    return split_statements(open(filepath).read())
+
+def file_checksum(filepath):
+    with open(filepath, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def applied_checksums(engine):
     '''
-    statements = open(filepath).read().replace('\n',' ').split(';')
-    l = len(statements)
-    return statements[:l-1]
+    Reads which .sql files were applied to a database and the checksum of
+    their contents then, creating the schema_version table on first use.
+
+    Parameters
+    ----------
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+
+    Returns
+    -------
+    applied: (dict) file name -> checksum, see file_checksum
+    '''
+    with engine.begin() as connection:
+        connection.exec_driver_sql(SCHEMA_VERSION_DDL)
+        return dict(connection.execute(sqlalchemy.text(
+            'SELECT filename, checksum FROM {}'.format(SCHEMA_VERSION_TABLE))).fetchall())
+
+def missing_columns(connection, filepath):
+    '''
+    Lists the columns declared by the CREATE TABLE statements of a .sql file
+    that the existing tables lack. CREATE TABLE IF NOT EXISTS leaves a table
+    created from an earlier version of the file as it was.
+
+    Parameters
+    ----------
+    connection: (sqlalchemy.engine.base.Connection) Connection to database.
+    filepath: (string) filepath for .sql file
 
-def execute_sql_from_files(credentials, files):
-    engine = create_mysql_engine(credentials)
+    Returns
+    -------
+    missing: (dict) table name -> {column name: declared SQL type}
+    '''
+    inspector = sqlalchemy.inspect(connection)
+    missing = {}
+    for tablename, table in parse_create_tables(filepath).items():
+        if not inspector.has_table(tablename):
+            continue
+        stored = {column['name'].lower() for column in inspector.get_columns(tablename)}
+        columns = {name: sql_type for name, sql_type in table['columns'].items() if name.lower() not in stored}
+        if columns:
+            missing[tablename] = columns
+    return missing
+
+def execute_sql_files(engine, directory, files, versioned=True):
+    '''
+    Runs .sql files in the order given, all statements of a file over one
+    connection in one transaction. MySQL commits DDL statements as it runs
+    them, so there a failing file can be left half applied. Versioned files
+    are recorded in schema_version with the checksum of their contents and
+    skipped while it is unchanged, so running them again is a quick no-op.
+    A file declaring columns that existing tables lack is not recorded, the
+    columns are printed to be added by hand, see missing_columns.
+
+    Parameters
+    ----------
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+    directory: (string) directory containing the .sql files
+    files: (list of strings) file names, in the order to run them
+    versioned: (bool) skip files already applied and record the ones run
+
+    Returns
+    -------
+    ran: (list of strings) names of the files run
+    '''
+    applied = applied_checksums(engine) if versioned else {}
+    ran = []
     for file in files:
-        statements = process_sql_statements(join(CONFIG['ddl_directory'], file))
-        for statement in statements:
-            engine.execute(statement)
+        filepath = join(directory, file)
+        assert exists(filepath), 'Missing {}, expected {} in {}.'.format(file, files, directory)
+        checksum = file_checksum(filepath)
+        if applied.get(file) == checksum:
+            continue
+        with engine.begin() as connection:
+            for statement in process_sql_statements(filepath):
+                connection.exec_driver_sql(statement)
+            missing = missing_columns(connection, filepath) if versioned else {}
+            if missing:
+                print('{} was not applied, existing tables lack columns it declares. Add them with:'.format(file))
+                for tablename, columns in missing.items():
+                    for name, sql_type in columns.items():
+                        print('    ALTER TABLE {} ADD COLUMN {} {};'.format(tablename, name, sql_type))
+                continue
+            if versioned:
+                connection.execute(sqlalchemy.text('DELETE FROM {} WHERE filename = :filename'.format(
+                    SCHEMA_VERSION_TABLE)), {'filename': file})
+                connection.execute(sqlalchemy.text(
+                    'INSERT INTO {} (filename, checksum, applied_at) VALUES (:filename, :checksum, :applied_at)'.format(
+                        SCHEMA_VERSION_TABLE)),
+                    {'filename': file, 'checksum': checksum, 'applied_at': datetime.datetime.now().replace(microsecond=0)})
+        ran.append(file)
+    return ran
+
+def execute_sql_from_files(credentials, files, versioned=True):
+    return execute_sql_files(get_engine(credentials), ddl_directory(credentials), files, versioned)
 
 def create_tables(credentials):
-    create_files = [f for f in listdir(CONFIG['ddl_directory']) if 'create' in f]
-    execute_sql_from_files(credentials, create_files)
+    ran = execute_sql_from_files(credentials, CREATE_FILES)
+    print('Applied {}.'.format(', '.join(ran)) if ran else 'No .sql files applied.')
+    create_indexes(get_engine(credentials))
 
 def drop_tables(credentials):
-    drop_files = [f for f in listdir(CONFIG['ddl_directory']) if 'drop' in f]
-    execute_sql_from_files(credentials, drop_files)
+    # Dropping schema_version too makes create_tables apply every file again.
+    execute_sql_from_files(credentials, DROP_FILES, versioned=False)
+    # Imported here, it needs pandas which creating and dropping tables does not.
+    from facilities_dataloader.accounts import forget_account_indexes
+    forget_account_indexes(get_engine(credentials))
+    bump_table_versions(*read_schema(ddl_directory(credentials)))
+
+def existing_indexes(engine, tablename):
+    return {index['name'] for index in sqlalchemy.inspect(engine).get_indexes(tablename)}
+
+def create_indexes(engine, tablenames=None):
+    '''
+    Creates the secondary indexes declared in ddl/indexes.sql that a table
+    does not have yet. Tables that do not exist are skipped, as are indexes on
+    columns a table created from an earlier version of its file lacks.
+
+    Parameters
+    ----------
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+    tablenames: (list of strings) tables to index, by default every table with
+                declared indexes
+
+    Returns
+    -------
+    created: (list of strings) names of the indexes created
+    '''
+    tables = set(sqlalchemy.inspect(engine).get_table_names())
+    created = []
+    for tablename in tablenames or list(read_indexes()):
+        if tablename not in tables:
+            continue
+        existing = existing_indexes(engine, tablename)
+        stored = {column['name'].lower() for column in sqlalchemy.inspect(engine).get_columns(tablename)}
+        for name, columns in secondary_indexes(tablename).items():
+            if name in existing:
+                continue
+            missing = [column for column in columns if column.lower() not in stored]
+            if missing:
+                print('Skipped index {}, {} has no column {}.'.format(name, tablename, ', '.join(missing)))
+                continue
+            with engine.begin() as connection:
+                connection.execute(sqlalchemy.text('CREATE INDEX {} ON {} ({})'.format(name, tablename, ', '.join(columns))))
+            created.append(name)
+    if created:
+        print('Created indexes {}.'.format(', '.join(created)))
+    return created
+
+def drop_indexes(engine, tablenames=None):
+    '''
+    Drops the secondary indexes declared in ddl/indexes.sql, so a bulk load
+    does not maintain them row by row. The primary keys are kept.
+
+    Parameters
+    ----------
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+    tablenames: (list of strings) tables to drop the indexes of, by default
+                every table with declared indexes
+
+    Returns
+    -------
+    dropped: (list of strings) names of the indexes dropped
+    '''
+    tables = set(sqlalchemy.inspect(engine).get_table_names())
+    dropped = []
+    for tablename in tablenames or list(read_indexes()):
+        if tablename not in tables:
+            continue
+        existing = existing_indexes(engine, tablename)
+        for name in secondary_indexes(tablename):
+            if name not in existing:
+                continue
+            # SQLite index names belong to the database, MySQL's to the table.
+            statement = 'DROP INDEX {}'.format(name) if engine.dialect.name == 'sqlite' else 'DROP INDEX {} ON {}'.format(name, tablename)
+            with engine.begin() as connection:
+                connection.execute(sqlalchemy.text(statement))
+            dropped.append(name)
+    if dropped:
+        print('Dropped indexes {}.'.format(', '.join(dropped)))
+    return dropped
+
+@contextmanager
+def indexes_dropped(engine, tablenames=None):
+    '''
+    Drops the secondary indexes for the duration of a bulk load and creates
+    them again afterwards in one pass over each table, even if the load fails.
+
+        with indexes_dropped(engine, ['elec_usage']):
+            data_to_db(data, 'elec_usage', engine)
+
+    Parameters
+    ----------
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+    tablenames: (list of strings) tables loaded, see drop_indexes
+    '''
+    drop_indexes(engine, tablenames)
+    try:
+        yield
+    finally:
+        create_indexes(engine, tablenames)
+
+def partition_clause(column, first_year, last_year):
+    '''
+    Builds a clause partitioning a table by year of a date column, with a last
+    partition for later dates.
+
+    Parameters
+    ----------
+    column: (string) DATE column to partition on
+    first_year: (int) year of the first partition, earlier dates go into it too
+    last_year: (int) year of the last yearly partition
+
+    Returns
+    -------
+    clause: (string) PARTITION BY RANGE COLUMNS clause for MySQL
+    '''
+    assert first_year <= last_year, 'Please give the first year before the last.'
+    partitions = ["PARTITION p{} VALUES LESS THAN ('{}-01-01')".format(year, year + 1)
+                  for year in range(first_year, last_year + 1)]
+    partitions.append('PARTITION pmax VALUES LESS THAN (MAXVALUE)')
+    return 'PARTITION BY RANGE COLUMNS({}) (\n{}\n)'.format(column, ',\n'.join(partitions))
+
+def partitioned_primary_key(tablename):
+    '''
+    Primary key of a partitioned table, which MySQL requires to contain the
+    partitioning column. An invoice id is then unique within a bill month.
+    '''
+    key = primary_key(tablename)
+    column = PARTITION_COLUMNS[tablename]
+    return key if column in key else key + [column]
+
+def partition_tables(engine, first_year, last_year, tablenames=None):
+    '''
+    RANGE partitions the usage tables by year of bill_month on MySQL, so
+    queries over a date range only read the partitions it covers. The
+    partitioning column is added to the primary key, see partitioned_primary_key,
+    and loads match rows on that key from then on, see stored_primary_key.
+
+    Parameters
+    ----------
+    engine: (sqlalchemy.engine.base.Engine) Connection to a MySQL database.
+    first_year: (int) year of the first partition
+    last_year: (int) year of the last yearly partition
+    tablenames: (list of strings) tables to partition, by default PARTITION_COLUMNS
+
+    Returns
+    -------
+    None
+    '''
+    assert engine.dialect.name == 'mysql', 'Only MySQL tables can be partitioned.'
+    for tablename in tablenames or list(PARTITION_COLUMNS):
+        with engine.begin() as connection:
+            connection.execute(sqlalchemy.text('ALTER TABLE {} DROP PRIMARY KEY, ADD PRIMARY KEY ({})'.format(
+                tablename, ', '.join(partitioned_primary_key(tablename)))))
+            connection.execute(sqlalchemy.text('ALTER TABLE {} {}'.format(
+                tablename, partition_clause(PARTITION_COLUMNS[tablename], first_year, last_year))))
+        print('Partitioned {} by year of {} from {} to {}.'.format(tablename, PARTITION_COLUMNS[tablename],
+                                                                   first_year, last_year))
+
+def partition_years(engine, tablename):
+    '''
+    Lists the years a table is partitioned by, see partition_tables.
+
+    Parameters
+    ----------
+    engine: (sqlalchemy.engine.base.Engine) Connection to database.
+    tablename: (string) name of the table
+
+    Returns
+    -------
+    years: (list of ints) year of every yearly partition, empty if the table
+           is not partitioned
+    '''
+    if engine.dialect.name != 'mysql':
+        return []
+    with engine.connect() as connection:
+        names = connection.execute(sqlalchemy.text(
+            '''SELECT partition_name FROM information_schema.partitions
+               WHERE table_schema = DATABASE() AND table_name = :tablename AND partition_name IS NOT NULL'''),
+            {'tablename': tablename}).scalars().all()
+    return sorted(int(name[1:]) for name in names if name[1:].isdigit())
+
+
+def stored_primary_key(engine, tablename):
+    '''
+    Primary key a table has in the database: the one declared in the ddl
+    files, with the partitioning column added once partition_tables has
+    partitioned the table. Rows are matched on this key when skipping,
+    upserting and tracking loaded rows, so that a row keyed on another
+    bill_month is a new row, as the database sees it.
+
+    Parameters
+    ----------
+    engine: (sqlalchemy.engine.base.Engine or dict) Connection to database or parquet sink.
+    tablename: (string) name of the table as declared in the ddl files
+
+    Returns
+    -------
+    key: (list of strings) primary key columns
+    '''
+    if is_parquet(engine):
+        return primary_key(tablename)
+    if tablename in PARTITION_COLUMNS and partition_years(engine, tablename):
+        return partitioned_primary_key(tablename)
+    return primary_key(tablename)
@@ -0,0 +1,251 @@
+import os
+import datetime
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from os.path import join, exists
+from facilities_dataloader.schema import primary_key, column_types, column_lengths
+from facilities_dataloader.instrument import stage
+
+QUARANTINE_DIRECTORY = os.environ.get('FODB_QUARANTINE_DIR', 'quarantine')
+
+NUMERIC_TYPES = ['FLOAT', 'DOUBLE', 'DECIMAL', 'INT', 'INTEGER', 'SMALLINT', 'BIGINT']
+DATE_TYPES = ['DATE', 'DATETIME', 'TIMESTAMP']
+
+
+# Each rule returns a (reason, mask) pair where mask is True for the rows that
+# break it. Missing values only break not_null, the other rules skip them.
+# Rules list the columns they read in a columns attribute, see requires.
+
+def requires(columns, rule):
+    '''
+    Records the columns a rule reads, so validate can skip the rules about
+    columns a frame does not have.
+    '''
+    rule.columns = list(columns)
+    return rule
+
+
+def not_null(column):
+    return requires([column], lambda data: ('{} is missing'.format(column), data[column].isna().to_numpy()))
+
+
+def _text(values):
+    '''
+    Converts the values present in a column to an Arrow string array so string
+    checks run as Arrow kernels.
+
+    Returns
+    -------
+    present: (ndarray of bool) rows with a value
+    text: (pyarrow.StringArray) the values of those rows as text
+    '''
+    present = values.notna().to_numpy()
+    values = values[present].to_numpy(dtype=object)
+    try:
+        text = pa.array(values, type=pa.string())
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        # Numbers among the values, as ids read from spreadsheets can be.
+        text = pa.array(values.astype(str), type=pa.string())
+    return present, text
+
+
+def fits(column, length):
+    def rule(data):
+        present, text = _text(data[column])
+        too_long = np.zeros(len(data), dtype=bool)
+        too_long[present] = pc.greater(pc.utf8_length(text), length).to_numpy(zero_copy_only=False)
+        return '{} is longer than {} characters'.format(column, length), too_long
+    return requires([column], rule)
+
+
+def matches(column, pattern, description):
+    def rule(data):
+        present, text = _text(data[column])
+        wrong = np.zeros(len(data), dtype=bool)
+        matched = pc.match_substring_regex(text, '^(?:{})$'.format(pattern))
+        wrong[present] = ~matched.to_numpy(zero_copy_only=False)
+        return '{} is not {}'.format(column, description), wrong
+    return requires([column], rule)
+
+
+def is_number(column, minimum=None, maximum=None):
+    def rule(data):
+        values = pd.to_numeric(data[column], errors='coerce')
+        wrong = values.isna() & data[column].notna()
+        if minimum is not None:
+            wrong |= values < minimum
+        if maximum is not None:
+            wrong |= values > maximum
+        if minimum is None and maximum is None:
+            return '{} is not a number'.format(column), wrong.to_numpy()
+        return '{} is not a number between {} and {}'.format(column, minimum, maximum), wrong.to_numpy()
+    return requires([column], rule)
+
+
+def is_date(column):
+    def rule(data):
+        values = pd.to_datetime(data[column], errors='coerce')
+        return '{} is not a date'.format(column), (values.isna() & data[column].notna()).to_numpy()
+    return requires([column], rule)
+
+
+def ordered(start, stop):
+    def rule(data):
+        after = pd.to_datetime(data[start], errors='coerce') > pd.to_datetime(data[stop], errors='coerce')
+        return '{} is after {}'.format(start, stop), after.to_numpy()
+    return requires([start, stop], rule)
+
+
+def unique_key(columns):
+    def rule(data):
+        broken = np.zeros(len(data), dtype=bool)
+        shared = data[columns].duplicated(keep=False).to_numpy()
+        if shared.any():
+            # Exact copies of a row are one row loaded twice, only different
+            # rows sharing a key conflict. Copies share a key, so only those
+            # rows are compared in full.
+            sharing = data[shared]
+            copies = sharing.duplicated().to_numpy()
+            conflicts = np.zeros(len(sharing), dtype=bool)
+            conflicts[~copies] = sharing.loc[~copies, columns].duplicated(keep=False).to_numpy()
+            broken[shared] = copies | conflicts
+        return 'duplicate of another row or of the key {}'.format(', '.join(columns)), broken
+    return requires(columns, rule)
+
+
+INVOICE_ID = r'[^-]{10}-[^-]{4,5}(-.*)?'
+NEW_ACCOUNT_NUMBER = r'[^-]{10}-[^-]{5}(-.*)?'
+
+# Checks beyond what the ddl files declare, see ddl_rules.
+RULES = {'elec_usage': [matches('invoice_id', INVOICE_ID, 'an invoice id like 0123456789-0123'),
+                        matches('account_number', r'\d{10}', 'a 10 digit account number'),
+                        ordered('service_period_start', 'service_period_stop')],
+         'ngas_usage': [matches('account_number', r'\d{13}', 'a 13 digit account number'),
+                        matches('new_account_number', NEW_ACCOUNT_NUMBER, 'an account number like 0123456789-01234'),
+                        ordered('service_period_start', 'service_period_stop')],
+         'elec_accounts': [matches('account_number', r'\d{10}', 'a 10 digit account number')],
+         'ngas_accounts': [matches('account_number', r'\d{13}', 'a 13 digit account number')],
+         'buildings': [is_number('latitude', -90, 90),
+                       is_number('longitude', -180, 180),
+                       is_number('square_footage', 0),
+                       is_number('year_built', 1800, datetime.date.today().year)]}
+
+
+def ddl_rules(tablename):
+    '''
+    Builds the checks implied by a table's declaration in the ddl files: the
+    primary key is present and unique, text fits its column, and numeric and
+    date columns hold numbers and dates.
+
+    Parameters
+    ----------
+    tablename: (string) name of the table as declared in the ddl files
+
+    Returns
+    -------
+    rules: (list of functions) see RULES
+    '''
+    key = primary_key(tablename)
+    rules = [not_null(column) for column in key] + [unique_key(key)]
+    rules += [fits(column, length) for column, length in column_lengths(tablename).items()]
+    for column, sql_type in column_types(tablename).items():
+        if sql_type in NUMERIC_TYPES:
+            rules.append(is_number(column))
+        elif sql_type in DATE_TYPES:
+            rules.append(is_date(column))
+    return rules
+
+
+def validate(data, tablename):
+    '''
+    Checks every row of a cleaned frame against the rules of its table, each
+    rule over whole columns at once.
+
+    Parameters
+    ----------
+    data: (DataFrame) cleaned data destined for tablename
+    tablename: (string) name of the table as declared in the ddl files
+
+    Returns
+    -------
+    good: (DataFrame) rows that pass every rule
+    bad: (DataFrame) rows that break a rule, with a reason column listing
+         every rule each one breaks
+    '''
+    reasons, masks = [], []
+    for rule in ddl_rules(tablename) + RULES.get(tablename, []):
+        if not set(rule.columns).issubset(data.columns):
+            # The rule is about a column this frame does not have.
+            continue
+        reason, mask = rule(data)
+        reasons.append(reason)
+        masks.append(mask)
+    if not masks:
+        return data, data.iloc[:0].assign(reason=pd.Series(dtype=object))
+
+    broken = np.vstack(masks)
+    is_bad = broken.any(axis=0)
+    reasons = np.array(reasons, dtype=object)
+    bad = data[is_bad].copy()
+    bad['reason'] = ['; '.join(reasons[row]) for row in broken[:, is_bad].T]
+    return data[~is_bad], bad
+
+
+def quarantine(bad, tablename, source, directory=None):
+    '''
+    Appends rows that failed validation to a .csv file per table, with where
+    they came from and why they were rejected, so they can be fixed and loaded
+    without parsing and loading the whole file again. A file whose header no
+    longer matches the rows, as when a table's columns change, is first moved
+    aside to <table>-<time it was last written>.csv.
+
+    Parameters
+    ----------
+    bad: (DataFrame) rejected rows with a reason column, see validate
+    tablename: (string) table the rows were destined for
+    source: (string) file the rows were read from
+    directory: (string) quarantine directory, defaults to QUARANTINE_DIRECTORY
+
+    Returns
+    -------
+    filepath: (string) the quarantine file, None if there were no rows
+    '''
+    if bad.empty:
+        return None
+    directory = directory or QUARANTINE_DIRECTORY
+    os.makedirs(directory, exist_ok=True)
+    filepath = join(directory, tablename + '.csv')
+    bad = bad.assign(source=source, quarantined_at=datetime.datetime.now().isoformat(timespec='seconds'))
+    if exists(filepath) and list(pd.read_csv(filepath, nrows=0).columns) != list(bad.columns):
+        written = datetime.datetime.fromtimestamp(os.path.getmtime(filepath)).strftime('%Y%m%dT%H%M%S')
+        os.replace(filepath, join(directory, '{}-{}.csv'.format(tablename, written)))
+    bad.to_csv(filepath, mode='a', header=not exists(filepath), index=False)
+    return filepath
+
+
+def screen(data, tablename, source, directory=None):
+    '''
+    Validates a cleaned frame and quarantines the rows that fail, so the rest
+    can still be loaded.
+
+    Parameters
+    ----------
+    data: (DataFrame) cleaned data destined for tablename
+    tablename: (string) name of the table as declared in the ddl files
+    source: (string) file the rows were read from
+    directory: (string) quarantine directory, defaults to QUARANTINE_DIRECTORY
+
+    Returns
+    -------
+    good: (DataFrame) rows that pass every rule
+    '''
+    with stage('validate', data, table=tablename) as record:
+        good, bad = validate(data, tablename)
+        record['rows_out'] = len(good)
+    filepath = quarantine(bad, tablename, source, directory)
+    if filepath:
+        print('Quarantined {} of {} rows for {} from {} in {}:'.format(len(bad), len(data), tablename, source, filepath))
+        print(bad['reason'].value_counts().to_string())
+    return good
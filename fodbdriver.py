@@ -1,57 +1,315 @@
 '''
+Command line of the facilities database loader.
 
+    python fodbdriver.py create-tables
+    python fodbdriver.py load --elec exports/elec.xlsx --ngas exports/ngas.csv
+    python fodbdriver.py load --dir exports --workers 4 --scan-anomalies
+    python fodbdriver.py indexes create
+    python fodbdriver.py rollups
+
+The options of earlier versions, such as --load_elec FILE, are still
+accepted. Modules are imported by the steps that use them and the
+credentials file is only read once a step needs the database, so --help
+and commands such as create-tables start without importing pandas, see
+benchmarks/bench_startup.py.
 '''
 import sys
-import os
 import argparse
-import sqlalchemy
-from facilities_dataloader.helper import read_data, create_mysql_engine, data_to_db
-from facilities_dataloader.table_manager import create_tables, drop_tables
-from facilities_dataloader.buildings import buildings_data_to_db
-from facilities_dataloader.electricity import preprocess_electricity, electricity_data_to_db, elec_accounts_to_db
-from facilities_dataloader.natural_gas import preprocess_natural_gas, natural_gas_data_to_db, ngas_accounts_to_db
-# from facilities_dataloader.helper import
+from facilities_dataloader.defaults import CREDS, LOAD_METHODS, DEFAULT_CHUNKSIZE, PIPELINE_DEPTH, SINK_TYPES
+
+# Datasets the load options name, in the order they are loaded one by one.
+LOAD_DATASETS = ['buildings', 'elec', 'ngas', 'elec_accounts', 'ngas_accounts']
+# Steps that run against the database or sink rather than the credentials.
+ENGINE_STEPS = ['partition', 'drop_indexes', 'create_indexes', 'rebuild_indexes', 'rebuild_rollups', 'reload',
+                'scan_anomalies', 'load_dir'] + ['load_' + dataset for dataset in LOAD_DATASETS]
 
-CREDS = 'creds.yml'
 
 def driver(args):
+    if args.no_cache:
+        from facilities_dataloader.cache import disable_cache
+        disable_cache()
+    if args.metrics:
+        from facilities_dataloader.instrument import enable_metrics
+        enable_metrics(args.metrics)
+    if args.sink:
+        from facilities_dataloader.sinks import open_sink, is_parquet
+        assert not (args.create_tables or args.drop_tables), \
+            'The tables of a sink are created when it is opened, see sinks.open_sink.'
+        engine = open_sink(args.sink)
+        if is_parquet(engine):
+            assert not (args.partition or args.drop_indexes or args.create_indexes or args.rebuild_indexes
+                        or args.rebuild_rollups or args.reload or args.incremental), \
+                'A Parquet sink can only be loaded, it has no indexes, rollups or manifest.'
+    elif any(getattr(args, step) for step in ENGINE_STEPS):
+        from facilities_dataloader.helper import get_engine
+        # Every step of the run shares this engine and its connection pool.
+        engine = get_engine(args.creds, pool_size=max(args.workers, 5))
+    else:
+        engine = None
+
     if args.create_tables:
-        create_tables(CREDS)
+        from facilities_dataloader.table_manager import create_tables
+        create_tables(args.creds)
 
     if args.drop_tables:
-        response = input('''WARNING: You are about to delete and recreate the buildings, elec_usage, and ngas_usage tables, are you sure you want to continue? [y/n]''')
+        response = 'y' if args.yes else input('''WARNING: You are about to delete and recreate the buildings, elec_usage, and ngas_usage tables, are you sure you want to continue? [y/n]''')
         if response in ['Yes','y','Y']:
-            drop_tables(CREDS)
+            from facilities_dataloader.table_manager import drop_tables
+            drop_tables(args.creds)
         else:
             print('Process killed.')
 
+    if args.partition:
+        from facilities_dataloader.table_manager import partition_tables
+        partition_tables(engine, *args.partition)
+
+    if args.drop_indexes:
+        from facilities_dataloader.table_manager import drop_indexes
+        drop_indexes(engine)
+
+    if args.create_indexes:
+        from facilities_dataloader.table_manager import create_indexes
+        create_indexes(engine)
+
+    if args.rebuild_indexes:
+        from facilities_dataloader.table_manager import indexes_dropped
+        # Secondary indexes are dropped for the loads and built again once
+        # they are done, see table_manager.indexes_dropped.
+        with indexes_dropped(engine):
+            load(args, engine)
+    elif engine is not None:
+        load(args, engine)
+
+    if args.scan_anomalies:
+        from facilities_dataloader.anomalies import refresh_anomalies
+        refresh_anomalies(engine)
+
+
+def load(args, engine):
+    if args.rebuild_rollups:
+        from facilities_dataloader.rollups import rebuild_rollups
+        rebuild_rollups(engine)
+
+    # Without --stream, --pipeline overlaps whole files rather than chunks.
+    if args.load_dir or args.workers > 1 or args.reload or (args.pipeline and not args.stream):
+        assert not (args.incremental or args.stream), \
+            '--incremental and --stream load one file at a time, not with --load_dir, --workers, --pipeline or --reload.'
+        from facilities_dataloader.parallel import expand_paths, discover_files, parallel_load, pipeline_load
+        files = discover_files(args.load_dir) if args.load_dir else {}
+        for dataset in LOAD_DATASETS:
+            pattern = getattr(args, 'load_' + dataset)
+            if pattern:
+                files[dataset] = files.get(dataset, []) + expand_paths(pattern)
+        if args.reload:
+            from facilities_dataloader.staging import reload_tables
+            reload_tables(files, engine, args.workers, args.load_mode, args.chunksize)
+        elif args.pipeline:
+            pipeline_load(files, engine, args.load_mode, args.chunksize, args.pipeline)
+        else:
+            parallel_load(files, engine, args.workers, args.load_mode, args.chunksize)
+        return
+
     if args.load_buildings:
-        buildings_data_to_db(args.load_buildings)
+        from facilities_dataloader.buildings import buildings_data_to_db
+        buildings_data_to_db(args.load_buildings, args.load_mode, args.chunksize, engine=engine)
 
     if args.load_elec:
-        electricity_data_to_db(args.load_elec)
+        from facilities_dataloader.electricity import electricity_data_to_db
+        electricity_data_to_db(args.load_elec, args.load_mode, args.chunksize, args.incremental, args.stream, engine=engine,
+                               pipeline_depth=args.pipeline)
 
     if args.load_ngas:
-        natural_gas_data_to_db(args.load_ngas)
+        from facilities_dataloader.natural_gas import natural_gas_data_to_db
+        natural_gas_data_to_db(args.load_ngas, args.load_mode, args.chunksize, args.incremental, args.stream, engine=engine,
+                               pipeline_depth=args.pipeline)
 
     if args.load_elec_accounts:
-        elec_accounts_to_db(args.load_elec_accounts)
+        from facilities_dataloader.electricity import elec_accounts_to_db
+        elec_accounts_to_db(args.load_elec_accounts, args.load_mode, args.chunksize, engine=engine)
 
     if args.load_ngas_accounts:
-        ngas_accounts_to_db(args.load_ngas_accounts)
+        from facilities_dataloader.natural_gas import ngas_accounts_to_db
+        ngas_accounts_to_db(args.load_ngas_accounts, args.load_mode, args.chunksize, engine=engine)
 
 
-if __name__ == "__main__":
+def add_run_options(parser):
+    '''
+    Options every command accepts.
+    '''
+    parser.add_argument('--creds', default=CREDS, metavar='PATH',
+                        help='Credentials file of the MySQL database (default {}).'.format(CREDS))
+    parser.add_argument('--sink', metavar='TYPE:PATH',
+                        help='''Write the loaded tables to partitioned Parquet
+                        datasets (parquet:DIRECTORY) or to a SQLite file
+                        (sqlite:PATH) instead of the MySQL database of the
+                        credentials file. Sink types: {}.'''.format(', '.join(SINK_TYPES)))
+    parser.add_argument('--metrics', metavar='PATH',
+                        help='''Write the time, rows and peak memory of every
+                        stage of the run to PATH as JSON lines and print a
+                        summary table at the end.''')
+    parser.add_argument('--profile', metavar='PATH',
+                        help='Run under cProfile and dump the stats to PATH, see pstats.')
+
+
+def add_load_options(parser, legacy=False):
+    '''
+    Options of the load command, spelled --load_elec etc. by the legacy options.
+    '''
+    names = {dataset: '--load_' + dataset if legacy else '--' + dataset.replace('_', '-') for dataset in LOAD_DATASETS}
+    for dataset in LOAD_DATASETS:
+        parser.add_argument(names[dataset], dest='load_' + dataset, metavar='PATH',
+                            help='{} export file to load.'.format(dataset))
+    parser.add_argument('--load_dir' if legacy else '--dir', '--load-dir', dest='load_dir', metavar='DIRECTORY',
+                        help='''Load every export file in this directory, which
+                        holds one subdirectory per dataset: buildings, elec,
+                        ngas, elec_accounts and ngas_accounts.''')
+    parser.add_argument('--load_mode', '--load-mode', choices=LOAD_METHODS, default='default',
+                        help='''How rows are sent to the database: one row per
+                        statement (default), multi-row INSERTs (multi), LOAD
+                        DATA LOCAL INFILE (infile) or insert new and update
+                        changed rows by primary key (upsert).''')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE,
+                        help='Number of rows per statement in multi and upsert modes.')
+    parser.add_argument('--incremental', action='store_true',
+                        help='''Skip usage files that were already loaded and only
+                        send new or changed rows.''')
+    parser.add_argument('--stream', type=int, metavar='ROWS',
+                        help='''Read .csv usage files ROWS rows at a time and load
+                        each chunk as it is ready, bounding memory use.''')
+    parser.add_argument('--pipeline', type=int, nargs='?', const=PIPELINE_DEPTH, metavar='DEPTH',
+                        help='''Clean the next file, or with --stream the next
+                        chunk, while the previous one is written, holding at
+                        most DEPTH (default {}) of them in memory. Files are
+                        cleaned and written in one process.'''.format(PIPELINE_DEPTH))
+    parser.add_argument('--workers', type=int, default=1,
+                        help='''Number of files cleaned and tables loaded at once.
+                        With more than one worker, or with a directory, the
+                        file options also accept glob patterns such as
+                        "exports/elec_*.xlsx".''')
+    parser.add_argument('--reload', action='store_true',
+                        help='''Replace the tables of the given files without
+                        dropping them first: the files are loaded into shadow
+                        tables which are swapped in once every file loaded.
+                        Give every file of each reloaded table.''')
+    parser.add_argument('--rebuild_indexes', '--rebuild-indexes', action='store_true',
+                        help='''Drop the secondary indexes before loading and
+                        create them again afterwards, faster for large loads.''')
+    parser.add_argument('--scan_anomalies', '--scan-anomalies', action='store_true',
+                        help='''Once the loads are done, flag usage outliers,
+                        overlapping or missing service periods and rebills
+                        over the whole history into usage_anomalies.''')
+    parser.add_argument('--no_cache', '--no-cache', action='store_true',
+                        help='Parse input files again instead of using the parse cache.')
+
+
+def legacy_parser():
+    '''
+    The options of earlier versions, one flag per step.
+    '''
     parser = argparse.ArgumentParser(description='''Application to upload
                                      facilities operations facility and energy
                                      use data.''')
     parser.add_argument('--create_tables', help='', action='store_true')
     parser.add_argument('--drop_tables', help='', action='store_true')
-    parser.add_argument('--load_buildings', help='') # implemented
-    parser.add_argument('--load_elec', help='')       # implemented
-    parser.add_argument('--load_ngas', help='') # implemented
-    parser.add_argument('--load_elec_accounts', help='')
-    parser.add_argument('--load_ngas_accounts', help='')
-
-    args = parser.parse_args()
-    driver(args)
+    add_load_options(parser, legacy=True)
+    parser.add_argument('--create_indexes', '--create-indexes', action='store_true',
+                        help='Create the secondary indexes declared in ddl/indexes.sql.')
+    parser.add_argument('--drop_indexes', '--drop-indexes', action='store_true',
+                        help='Drop the secondary indexes declared in ddl/indexes.sql.')
+    parser.add_argument('--partition', type=int, nargs=2, metavar=('FIRST_YEAR', 'LAST_YEAR'),
+                        help='''Partition the MySQL usage tables by year of
+                        bill_month, adding bill_month to their primary keys.''')
+    parser.add_argument('--rebuild_rollups', '--rebuild-rollups', action='store_true',
+                        help='''Recompute building_energy_monthly from all usage.
+                        Every load keeps it up to date for the months it touches.''')
+    add_run_options(parser)
+    return parser
+
+
+def command_parser():
+    '''
+    One subcommand per step. Each sets the same attributes as the legacy
+    option of its step, see parse_args.
+    '''
+    parser = argparse.ArgumentParser(description='''Load facilities operations
+                                     buildings and energy use data into a
+                                     database. The options of earlier versions,
+                                     such as --load_elec FILE, are still
+                                     accepted.''')
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND', required=True)
+
+    command = commands.add_parser('create-tables', help='Create the tables declared in ddl/.')
+    command.set_defaults(create_tables=True)
+    add_run_options(command)
+
+    command = commands.add_parser('drop-tables', help='Drop every table, asking first.')
+    command.add_argument('--yes', action='store_true', help='Do not ask for confirmation.')
+    command.set_defaults(drop_tables=True)
+    add_run_options(command)
+
+    command = commands.add_parser('load', help='Load export files.')
+    add_load_options(command)
+    add_run_options(command)
+
+    command = commands.add_parser('indexes', help='Create or drop the secondary indexes of ddl/indexes.sql.')
+    command.add_argument('action', choices=['create', 'drop'])
+    add_run_options(command)
+
+    command = commands.add_parser('partition', help='''Partition the MySQL usage tables by year of bill_month,
+                                                    adding bill_month to their primary keys.''')
+    command.add_argument('partition', type=int, nargs=2, metavar=('FIRST_YEAR', 'LAST_YEAR'))
+    add_run_options(command)
+
+    command = commands.add_parser('rollups', help='Recompute building_energy_monthly from all usage.')
+    command.set_defaults(rebuild_rollups=True)
+    add_run_options(command)
+
+    command = commands.add_parser('anomalies', help='Flag anomalous bills into usage_anomalies.')
+    command.set_defaults(scan_anomalies=True)
+    add_run_options(command)
+    return parser
+
+
+def parse_args(argv):
+    '''
+    Parses a subcommand, or the legacy options when the arguments start with
+    an option other than --help.
+
+    Returns
+    -------
+    args: (Namespace) the attributes of the legacy options, so driver runs
+          either the same way
+    '''
+    defaults = vars(legacy_parser().parse_args([]))
+    defaults.update(command=None, yes=False)
+    if argv and argv[0].startswith('-') and argv[0] not in ['-h', '--help']:
+        args = vars(legacy_parser().parse_args(argv))
+    else:
+        args = vars(command_parser().parse_args(argv))
+        action = args.pop('action', None)
+        if action:
+            args[action + '_indexes'] = True
+    return argparse.Namespace(**dict(defaults, **args))
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        driver(args)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        if args.metrics:
+            from facilities_dataloader.instrument import read_metrics, print_summary
+            # The file also holds the stages run in worker processes.
+            print_summary(read_metrics(args.metrics))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+import pytest
+from facilities_dataloader import cache
+
+@pytest.fixture(autouse=True)
+def cache_directory(tmp_path, monkeypatch):
+    # Parsed files and indexes go to the test's directory, not the home directory,
+    # also for the processes a test starts.
+    directory = str(tmp_path / 'cache')
+    monkeypatch.setattr(cache, 'CACHE_DIRECTORY', directory)
+    monkeypatch.setenv('FODB_CACHE_DIR', directory)
+    return directory
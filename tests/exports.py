@@ -0,0 +1,14 @@
+import numpy as np
+import pandas as pd
+
+def ngas_export(rows):
+    return pd.DataFrame({'ADDRESS': ['{} MAIN ST'.format(i % 7) for i in range(rows)],
+                         'Address 2': np.nan,
+                         'City': 'CHICAGO',
+                         'Account Number': [str(1000 + i % 7) for i in range(rows)],
+                         'New Account Number': ['{}-{}'.format(5000 + i % 7, i % 3) if i % 2 else np.nan for i in range(rows)],
+                         'Start Date': pd.Timestamp('2018-01-03'),
+                         'End Date': pd.Timestamp('2018-02-02'),
+                         'Therms': [float(i % 7) for i in range(rows)],
+                         'Utility Amount': [float(i % 7) + 0.5 for i in range(rows)],
+                         'Supplier Amount': 1.25})
@@ -0,0 +1,80 @@
+import os
+import sqlalchemy
+import pandas as pd
+from facilities_dataloader import cache
+from facilities_dataloader.helper import data_to_db
+from facilities_dataloader.sinks import sqlite_sink
+from facilities_dataloader.accounts import (account_index, update_account_index, stamp_buildings, unmatched_accounts,
+                                            index_path, forget_account_indexes, restamp_usage)
+
+def elec_usage():
+    return pd.DataFrame({'invoice_id': ['1-1', '1-2', '2-1', '3-1'],
+                         'account_number': ['0000000001', '0000000001', '0000000002', '0000000003'],
+                         'bill_month': pd.to_datetime(['2018-01-01', '2018-02-01', '2018-02-01', '2018-02-01']),
+                         'billed_khw': [100.0, 50.0, 10.0, 5.0]})
+
+def test_usage_stamped_from_saved_index_and_restamped_when_accounts_move(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'CACHE_DIRECTORY', str(tmp_path / 'cache'))
+    engine = sqlite_sink(str(tmp_path / 'facilities.db'))
+    accounts = pd.DataFrame({'account_number': ['0000000001', '0000000002'], 'activity_code': ['A001', 'A002']})
+    data_to_db(accounts, 'elec_accounts', engine)
+    update_account_index(engine, 'elec_accounts')
+    assert os.path.exists(index_path(engine, 'elec_accounts'))
+
+    usage = stamp_buildings(elec_usage(), 'elec_usage', engine)
+    assert list(usage['activity_code'].fillna('')) == ['A001', 'A001', 'A002', '']
+    assert unmatched_accounts(usage, 'elec_usage').to_dict('records') == [{'account_number': '0000000003', 'rows': 1}]
+    data_to_db(usage, 'elec_usage', engine)
+
+    moved = pd.DataFrame({'account_number': ['0000000002', '0000000003'], 'activity_code': ['A001', 'A003']})
+    data_to_db(moved, 'elec_accounts', engine, method='upsert')
+    index = update_account_index(engine, 'elec_accounts')
+    assert index.to_dict() == {'0000000001': 'A001', '0000000002': 'A001', '0000000003': 'A003'}
+    stored = pd.read_sql('SELECT invoice_id, activity_code FROM elec_usage ORDER BY invoice_id', engine)
+    assert list(stored['activity_code']) == ['A001', 'A001', 'A001', 'A003']
+    # A new run reads the index back from disk rather than from the table.
+    engine.execute('DELETE FROM elec_accounts')
+    assert len(account_index(engine, 'elec_accounts')) == 3
+    forget_account_indexes(engine)
+    assert len(account_index(engine, 'elec_accounts')) == 0
+
+def test_gas_accounts_found_under_either_number():
+    engine = sqlalchemy.create_engine('sqlite://')
+    pd.DataFrame({'account_number': ['0000000000001', '0000000000001', '0123456789-00001'],
+                  'activity_code': ['B002', 'B001', 'B003']}).to_sql('ngas_accounts', engine, index=False)
+    usage = pd.DataFrame({'account_number': ['0000000000001', '0000000000002', '0000000000003'],
+                          'current_account_number': ['0000000000001', '0123456789-00001', '0000000000003']})
+    stamped = stamp_buildings(usage, 'ngas_usage', engine)
+    # An account listed for two buildings is kept for the first of them.
+    assert list(stamped['activity_code'].fillna('')) == ['B001', 'B003', '']
+
+def test_tables_without_activity_code_are_left_alone():
+    engine = sqlalchemy.create_engine('sqlite://')
+    elec_usage().head(0).to_sql('elec_usage', engine, index=False)
+    assert 'activity_code' not in stamp_buildings(elec_usage(), 'elec_usage', engine).columns
+    assert stamp_buildings(elec_usage(), 'buildings', engine) is not None
+
+def test_gas_usage_restamped_in_one_pass_per_lookup_column():
+    engine = sqlalchemy.create_engine('sqlite://')
+    pd.DataFrame({'account_number': ['0000000000001', '0000000000002', '0000000000003'],
+                  'current_account_number': ['0000000000001', '0123456789-00001', '0000000000003'],
+                  'activity_code': ['B009', 'B009', 'B009']}).to_sql('ngas_usage', engine, index=False)
+    changed = pd.Series({'0000000000001': 'B001', '0123456789-00001': 'B003', '0000000000002': 'B002'})
+    restamp_usage(engine, 'ngas_usage', changed)
+    stored = pd.read_sql('SELECT activity_code FROM ngas_usage ORDER BY account_number', engine)
+    # The account number wins over the current one, as when stamping.
+    assert list(stored['activity_code']) == ['B001', 'B002', 'B009']
+    restamp_usage(engine, 'ngas_usage', changed, clear=True)
+    stored = pd.read_sql('SELECT activity_code FROM ngas_usage ORDER BY account_number', engine)
+    assert list(stored['activity_code'].fillna('')) == ['B001', 'B002', '']
+
+def test_index_keeps_the_building_of_accounts_skipped_by_the_load(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'CACHE_DIRECTORY', str(tmp_path / 'cache'))
+    engine = sqlite_sink(str(tmp_path / 'facilities.db'))
+    data_to_db(pd.DataFrame({'account_number': ['0000000001'], 'activity_code': ['A001']}), 'elec_accounts', engine)
+    update_account_index(engine, 'elec_accounts')
+    # The account is already in the table, so this row is skipped rather than loaded.
+    moved = pd.DataFrame({'account_number': ['0000000001', '0000000002'], 'activity_code': ['B999', 'A002']})
+    data_to_db(moved, 'elec_accounts', engine, skip_existing=True)
+    index = update_account_index(engine, 'elec_accounts')
+    assert index.to_dict() == {'0000000001': 'A001', '0000000002': 'A002'}
@@ -0,0 +1,67 @@
+import datetime
+import numpy as np
+import pandas as pd
+import sqlalchemy
+from facilities_dataloader.anomalies import (rolling_baseline, scan_usage, refresh_anomalies, parse_dates,
+                                             BASELINE_BILLS, MIN_BASELINE_BILLS)
+
+def elec_usage(accounts=3, bills=18, seed=0):
+    rng = np.random.default_rng(seed)
+    start = pd.DatetimeIndex(np.tile(pd.date_range('2017-01-01', periods=bills, freq='MS').to_numpy(), accounts))
+    data = pd.DataFrame({'invoice_id': ['{}-{}'.format(i // bills, i % bills) for i in range(accounts * bills)],
+                         'account_number': np.repeat(['{:010d}'.format(i) for i in range(accounts)], bills),
+                         'bill_month': start,
+                         'service_period_start': start,
+                         'service_period_stop': start + pd.offsets.MonthBegin(1),
+                         'billed_khw': rng.normal(3000.0, 100.0, accounts * bills),
+                         'peak_kw': rng.normal(10.0, 0.5, accounts * bills),
+                         'rebill': 'N'})
+    return data
+
+def test_rolling_baseline_matches_pandas_grouped_windows():
+    rng = np.random.default_rng(0)
+    series = np.repeat(np.arange(40), rng.integers(1, 30, 40))
+    metrics = pd.DataFrame({'kwh': rng.gamma(2.0, 1000.0, len(series))})
+    metrics.loc[rng.random(len(series)) < 0.1, 'kwh'] = np.nan
+    baseline, spread = rolling_baseline(metrics, series)
+    window = metrics.groupby(series).shift().groupby(series).rolling(BASELINE_BILLS, min_periods=MIN_BASELINE_BILLS)
+    assert np.allclose(baseline, window.mean().reset_index(level=0, drop=True).sort_index(), equal_nan=True)
+    assert np.allclose(spread, window.std().reset_index(level=0, drop=True).sort_index(), equal_nan=True)
+
+def test_spikes_periods_and_rebills_flagged():
+    data = elec_usage()
+    data.loc[10, 'billed_khw'] = 30000.0
+    # A bill starting before the previous one ended, and a month missing.
+    data.loc[25, 'service_period_start'] -= pd.Timedelta(days=10)
+    data = data.drop(index=40)
+    data.loc[5, 'rebill'] = 'Y'
+    # A longer last bill, with as much use per day.
+    data.loc[35, 'billed_khw'] *= 45 / 30
+    data.loc[35, 'service_period_stop'] += pd.Timedelta(days=15)
+    anomalies = scan_usage(data.sample(frac=1, random_state=0), 'elec_usage')
+    flags = {(row.flag, row.metric, row.account_number, str(row.bill_month.date())) for row in anomalies.itertuples()}
+    assert ('outlier', 'billed_khw', '0000000000', '2017-11-01') in flags
+    assert ('overlap', 'service_period', '0000000001', '2017-08-01') in flags
+    assert ('gap', 'service_period', '0000000002', '2017-06-01') in flags
+    assert ('rebill', 'rebill', '0000000000', '2017-06-01') in flags
+    assert ('outlier', 'billed_khw', '0000000001', '2018-06-01') not in flags
+
+def test_refresh_replaces_flags_of_scanned_tables(tmp_path):
+    engine = sqlalchemy.create_engine('sqlite:///{}'.format(tmp_path / 'facilities.db'))
+    data = elec_usage()
+    data.loc[10, 'billed_khw'] = 30000.0
+    data.to_sql('elec_usage', engine, index=False)
+    assert len(refresh_anomalies(engine)) == 1
+    engine.execute("UPDATE elec_usage SET billed_khw = 3000 WHERE invoice_id = '0-10'")
+    refresh_anomalies(engine)
+    assert pd.read_sql('SELECT * FROM usage_anomalies', engine).empty
+
+def test_dates_parsed_from_text_and_date_objects():
+    # As returned by SQLite and by mysql-connector.
+    data = pd.DataFrame({'bill_month': ['2018-01-01', '2018-02-01 00:00:00', None],
+                         'service_period_start': [datetime.date(2018, 1, 1), datetime.date(2018, 2, 1), None],
+                         'service_period_stop': pd.to_datetime(['2018-02-01', '2018-03-01', None])})
+    data = parse_dates(data)
+    assert all(data[column].dtype == 'datetime64[ns]' for column in data.columns)
+    assert list(data['bill_month'].dt.month.dropna()) == [1, 2]
+    assert list(data['service_period_start'].dt.month.dropna()) == [1, 2]
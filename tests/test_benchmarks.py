@@ -0,0 +1,61 @@
+import pytest
+import sqlalchemy
+import pandas as pd
+from benchmarks.generators import exports, write_exports
+from benchmarks.bench_pipeline import run, compare
+from benchmarks.bench_overlap import split_exports, time_modes
+from benchmarks.bench_anomalies import main as bench_anomalies
+from benchmarks.bench_startup import main as bench_startup, COMMANDS as STARTUP_COMMANDS
+from facilities_dataloader import validation
+from facilities_dataloader.parallel import DATASETS
+
+def test_generated_exports_pass_preprocessing(tmp_path, monkeypatch):
+    monkeypatch.setattr(validation, 'QUARANTINE_DIRECTORY', str(tmp_path / 'quarantine'))
+    files = write_exports(str(tmp_path / 'exports'), rows=500)
+    for dataset, filepath in files.items():
+        data = DATASETS[dataset][0](filepath)
+        assert len(data) > 0
+    # The dirty values of the exports are all cleaned. Only ERT numbers, padded
+    # wider than ert_number holds, are quarantined.
+    assert sorted(path.name for path in (tmp_path / 'quarantine').iterdir()) == ['ngas_accounts.csv']
+    quarantined = pd.read_csv(tmp_path / 'quarantine' / 'ngas_accounts.csv')
+    assert set(quarantined['reason']) == {'ert_number is longer than 8 characters'}
+    elec = DATASETS['elec'][0](files['elec'])
+    assert elec['invoice_id'].is_unique
+    assert elec['account_number'].str.len().eq(10).all()
+    assert elec['peak_kw'].dtype == 'float32'
+
+def test_generated_exports_are_dirty():
+    data = exports(2000)
+    assert (data['elec']['Peak kW'] == 'Multiple Demands').any()
+    assert (data['elec']['Discard?'] == 'Y').any()
+    assert data['ngas']['Therms'].isin(['-', 'N/A', '#N/A']).any()
+    assert data['ngas'].duplicated().any()
+    assert (data['buildings']['year_built'] == 'NV').any()
+
+def test_pipeline_benchmark_loads_every_dataset(tmp_path, monkeypatch):
+    monkeypatch.setattr(validation, 'QUARANTINE_DIRECTORY', str(tmp_path / 'quarantine'))
+    engine = sqlalchemy.create_engine('sqlite:///{}'.format(tmp_path / 'bench.db'))
+    results = run(500, {'sqlite': engine})
+    loads = [result for result in results if result['stage'] == 'load']
+    assert [result['dataset'] for result in loads] == ['buildings', 'elec_accounts', 'ngas_accounts', 'elec', 'ngas']
+    slower = [dict(result, seconds=result['seconds'] * 2 + 1) for result in results]
+    assert len(compare(slower, results, tolerance=0.2)) == len(results)
+
+def test_overlap_benchmark_modes_load_the_same_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(validation, 'QUARANTINE_DIRECTORY', str(tmp_path / 'quarantine'))
+    files = split_exports(write_exports(str(tmp_path), rows=300), parts=3)
+    assert len(files['elec']) == 3
+    engine = sqlalchemy.create_engine('sqlite:///{}'.format(tmp_path / 'bench.db'))
+    results = {result['mode']: result['rows'] for result in time_modes(files, engine, 'default', 2, 50)}
+    assert results['files sequential'] == results['files pipelined'] > 0
+    assert results['stream sequential'] == results['stream pipelined'] > 0
+
+def test_anomaly_benchmark_flags_the_dirty_bills():
+    results = bench_anomalies([20000])
+    assert 0 < results[0]['flagged'] < 20000
+
+def test_startup_benchmark_times_every_command():
+    results = bench_startup(runs=1)
+    assert [result['command'] for result in results] == list(STARTUP_COMMANDS)
+    assert all(result['seconds'] > 0 for result in results)
@@ -0,0 +1,46 @@
+import math
+import pytest
+import pandas as pd
+from facilities_dataloader import cache
+
+def counting_reader(calls):
+    def reader(filepath, **options):
+        calls.append(filepath)
+        return pd.read_csv(filepath, **options)
+    return reader
+
+def test_second_read_served_from_cache(tmp_path):
+    filepath = str(tmp_path / 'accounts.csv')
+    pd.DataFrame({'account_no': ['0012', None], 'kwh': [1.5, 2.5]}).to_csv(filepath, index=False)
+    calls = []
+    directory = str(tmp_path / 'cache')
+    first = cache.cached_read(filepath, 'other', counting_reader(calls), {'dtype': {'account_no': str}}, directory=directory)
+    second = cache.cached_read(filepath, 'other', counting_reader(calls), {'dtype': {'account_no': str}}, directory=directory)
+    assert len(calls) == 1, "The file was parsed twice."
+    pd.testing.assert_frame_equal(first, second)
+    assert type(second.loc[1, 'account_no']) == float, "Missing strings should come back as NaN."
+
+def test_mixed_columns_round_trip(tmp_path):
+    filepath = str(tmp_path / 'elec.csv')
+    pd.DataFrame({'Peak kW': [1, 'Multiple Demands', math.nan]}).to_csv(filepath, index=False)
+    directory = str(tmp_path / 'cache')
+    reader = lambda f, **options: pd.read_csv(f, **options).astype(object).replace({'1': 1})
+    first = cache.cached_read(filepath, 'elec', reader, {}, directory=directory)
+    second = cache.cached_read(filepath, 'elec', reader, {}, directory=directory)
+    assert list(map(type, second['Peak kW'])) == list(map(type, first['Peak kW']))
+
+def test_cache_invalidated_when_file_changes(tmp_path):
+    filepath = str(tmp_path / 'accounts.csv')
+    directory = str(tmp_path / 'cache')
+    pd.DataFrame({'a': [1]}).to_csv(filepath, index=False)
+    cache.cached_read(filepath, 'other', pd.read_csv, {}, directory=directory)
+    pd.DataFrame({'a': [1, 2]}).to_csv(filepath, index=False)
+    assert len(cache.cached_read(filepath, 'other', pd.read_csv, {}, directory=directory)) == 2
+
+def test_least_recently_used_evicted(tmp_path):
+    directory = str(tmp_path / 'cache')
+    frame = pd.DataFrame({'a': range(1000)})
+    cache.store('old', frame, directory)
+    cache.store('new', frame, directory, max_bytes=1.5 * len(open(directory + '/old.feather', 'rb').read()))
+    assert cache.load('old', directory) is None
+    assert cache.load('new', directory) is not None
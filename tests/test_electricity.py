@@ -13,7 +13,7 @@ def test_elec_column_names_renamed_appropriately():
 
 def test_statement_no_column_formatted_as_str():
     result = preprocess_electricity('/home/vidal/Projects/cityofchicago/2FM/data/energy/energy.xlsx')
-    assert result.statement_number.dtype == object
+    assert result.statement_number.dropna().astype(object).map(type).eq(str).all()
 
 def test_elec_no_of_columns_correct():
     result = preprocess_electricity('/home/vidal/Projects/cityofchicago/2FM/data/energy/energy.xlsx')
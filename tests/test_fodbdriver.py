@@ -0,0 +1,36 @@
+import sys
+import pytest
+import subprocess
+from os.path import dirname, abspath
+from fodbdriver import parse_args, load
+
+ROOT = dirname(dirname(abspath(__file__)))
+HEAVY_MODULES = ['pandas', 'numpy', 'sqlalchemy', 'yaml', 'pyarrow']
+
+def test_parsing_imports_no_heavy_modules():
+    script = ('import sys, fodbdriver\n'
+              'fodbdriver.parse_args(["load", "--elec", "elec.csv", "--sink", "parquet:out"])\n'
+              'fodbdriver.parse_args(["--load_elec", "elec.csv"])\n'
+              'print(" ".join(name for name in {} if name in sys.modules))'.format(HEAVY_MODULES))
+    result = subprocess.run([sys.executable, '-c', script], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ''
+
+def test_subcommands_set_the_legacy_options():
+    pairs = [(['load', '--elec', 'e.csv', '--ngas-accounts', 'a.xlsx', '--load-mode', 'upsert', '--workers', '2'],
+              ['--load_elec', 'e.csv', '--load_ngas_accounts', 'a.xlsx', '--load_mode', 'upsert', '--workers', '2']),
+             (['create-tables', '--creds', 'other.yml'], ['--create_tables', '--creds', 'other.yml']),
+             (['indexes', 'drop'], ['--drop_indexes']),
+             (['partition', '2015', '2020'], ['--partition', '2015', '2020']),
+             (['anomalies', '--sink', 'sqlite:f.db'], ['--scan_anomalies', '--sink', 'sqlite:f.db'])]
+    for command, legacy in pairs:
+        args, expected = vars(parse_args(command)), vars(parse_args(legacy))
+        assert args.pop('command') == command[0]
+        assert expected.pop('command') is None
+        assert args == expected
+    assert parse_args(['drop-tables', '--yes']).yes
+
+def test_batch_loads_reject_per_file_options():
+    for argv in [['load', '--dir', 'exports', '--incremental'], ['load', '--elec', 'e.csv', '--workers', '2', '--stream', '100'],
+                 ['load', '--elec', 'e.csv', '--pipeline', '--incremental'], ['--load_dir', 'exports', '--stream', '100']]:
+        with pytest.raises(AssertionError):
+            load(parse_args(argv), None)
@@ -1,7 +1,15 @@
+import math
 import yaml
+import sqlalchemy
 import pytest
 import pandas as pd
-from facilities_dataloader.helper import read_data, create_mysql_engine, data_to_db
+from facilities_dataloader.helper import (read_data, create_mysql_engine, data_to_db,
+                                          get_engine, dispose_engines, existing_key_hashes,
+                                          restore_leading_zeros, restore_leading_zeros_column,
+                                          fix_invoice_ids, fix_new_account_nmbrs, compact_dtypes)
+from facilities_dataloader import table_manager
+from facilities_dataloader.electricity import fix_invoice_id
+from facilities_dataloader.natural_gas import fix_new_account_nmbr
 
 def test_setup():
     engine = create_mysql_engine('./tests/test_creds.yml')
@@ -37,3 +45,126 @@ def test_data_sends_to_database():
     data_to_db(df, 'sample', engine)
     result = pd.read_sql(sql='SELECT * FROM sample;', con=engine)
     assert list(result.columns) == ['first','second']
+
+def test_restore_leading_zeros_column_matches_row_wise():
+    numbers = pd.Series(['123', 4567, math.nan, '0012345678', '-12', 'abc'])
+    expected = numbers.apply(lambda x: restore_leading_zeros(x, 10))
+    pd.testing.assert_series_equal(restore_leading_zeros_column(numbers, 10), expected)
+
+def test_fix_invoice_ids_matches_row_wise():
+    ids = pd.Series(['12345-12', '12345-12R', '1234567890-1234', '1-2-3', '99-5C', math.nan, '12345-123Z'])
+    fixed, invalid = fix_invoice_ids(ids)
+    pd.testing.assert_series_equal(fixed, ids.apply(fix_invoice_id))
+    assert invalid.empty
+
+def test_fix_invoice_ids_reports_all_invalid_ids():
+    ids = pd.Series(['12345-12', '1234512', '12345678901-1', '12-', '1-123456', 42])
+    fixed, invalid = fix_invoice_ids(ids)
+    assert list(invalid.index) == [1, 2, 3, 4, 5], "Not every invalid invoice id was reported."
+    assert list(fixed[invalid.index]) == list(ids[invalid.index])
+    assert invalid.loc[1, 'reason'] == "missing '-' character"
+
+def test_fix_new_account_nmbrs_matches_row_wise():
+    ids = pd.Series(['522322315-2', '522322315-244', '532322315-24', math.nan, '1-'])
+    fixed, invalid = fix_new_account_nmbrs(ids)
+    pd.testing.assert_series_equal(fixed, ids.apply(fix_new_account_nmbr))
+    assert invalid.empty
+
+def sample_usage():
+    return pd.DataFrame({'invoice_id': ['0000000001-0001', '0000000002-0002', '0000000003-0003'],
+                         'billed_khw': [10.5, math.nan, 30.0],
+                         'rebill': ['N', None, 'Y']})
+
+@pytest.mark.parametrize('method', ['default', 'multi', 'infile'])
+def test_data_to_db_load_methods_sqlite(method):
+    engine = sqlalchemy.create_engine('sqlite://')
+    stats = data_to_db(sample_usage(), 'elec_usage', engine, method=method, chunksize=2)
+    result = pd.read_sql(sql='SELECT * FROM elec_usage;', con=engine)
+    assert stats['rows'] == 3 and stats['rows_per_sec'] > 0
+    pd.testing.assert_frame_equal(result, sample_usage().fillna({'rebill': math.nan}), check_dtype=False)
+
+def test_data_to_db_reports_failed_load():
+    engine = sqlalchemy.create_engine('sqlite://')
+    engine.execute('CREATE TABLE elec_usage (invoice_id VARCHAR(16) PRIMARY KEY, billed_khw FLOAT, rebill VARCHAR(1));')
+    data_to_db(sample_usage(), 'elec_usage', engine)
+    assert data_to_db(sample_usage(), 'elec_usage', engine, method='multi') is None
+
+def test_data_to_db_upsert_counts_inserted_updated_unchanged():
+    engine = sqlalchemy.create_engine('sqlite://')
+    engine.execute('''CREATE TABLE elec_usage (invoice_id VARCHAR(16) PRIMARY KEY, bill_month DATE,
+                      billed_khw FLOAT, rebill VARCHAR(1));''')
+    first = pd.DataFrame({'invoice_id': ['0000000001-0001', '0000000002-0002'],
+                          'bill_month': pd.to_datetime(['2018-01-01', '2018-02-01']),
+                          'billed_khw': [10.1, 20.2],
+                          'rebill': ['N', None]})
+    data_to_db(first, 'elec_usage', engine, method='upsert')
+    second = pd.DataFrame({'invoice_id': ['0000000001-0001', '0000000002-0002', '0000000003-0003'],
+                           'bill_month': pd.to_datetime(['2018-01-01', '2018-02-01', '2018-03-01']),
+                           'billed_khw': [10.1, 25.0, 30.3],
+                           'rebill': ['N', None, 'Y']})
+    stats = data_to_db(second, 'elec_usage', engine, method='upsert')
+    assert (stats['inserted'], stats['updated'], stats['unchanged']) == (1, 1, 1)
+    result = pd.read_sql(sql='SELECT * FROM elec_usage ORDER BY invoice_id;', con=engine)
+    assert list(result['billed_khw']) == [10.1, 25.0, 30.3]
+
+def test_get_engine_shared_per_credentials_file(tmp_path):
+    creds = tmp_path / 'creds.yml'
+    creds.write_text('user: u\npass: p\nhost: localhost\ndatabase: facilities\n')
+    engine = get_engine(str(creds))
+    assert get_engine(str(creds)) is engine
+    assert engine.pool.size() == 5
+    dispose_engines()
+    assert get_engine(str(creds)) is not engine
+    dispose_engines()
+
+def test_data_to_db_skips_keys_already_loaded():
+    engine = sqlalchemy.create_engine('sqlite://')
+    engine.execute('''CREATE TABLE elec_usage (invoice_id VARCHAR(16) PRIMARY KEY, bill_month DATE,
+                      billed_khw FLOAT, rebill VARCHAR(1));''')
+    first = pd.DataFrame({'invoice_id': ['0000000001-0001', '0000000002-0002', '0000000009-0009'],
+                          'bill_month': pd.to_datetime(['2018-01-01', '2018-02-01', '2017-06-01']),
+                          'billed_khw': [10.1, 20.2, 90.9],
+                          'rebill': ['N', None, 'N']})
+    data_to_db(first, 'elec_usage', engine)
+    second = pd.DataFrame({'invoice_id': ['0000000001-0001', '0000000002-0002', '0000000003-0003'],
+                           'bill_month': pd.to_datetime(['2018-01-01', '2018-02-01', '2018-03-01']),
+                           'billed_khw': [10.1, 25.0, 30.3],
+                           'rebill': ['N', None, 'Y']})
+    assert len(existing_key_hashes(second, 'elec_usage', engine, ['invoice_id'])) == 2
+    stats = data_to_db(second, 'elec_usage', engine, skip_existing=True)
+    assert (stats['rows'], stats['skipped']) == (1, 2)
+    result = pd.read_sql(sql='SELECT * FROM elec_usage ORDER BY invoice_id;', con=engine)
+    assert list(result['billed_khw']) == [10.1, 20.2, 30.3, 90.9]
+
+def test_data_to_db_skips_on_the_partitioned_key(monkeypatch):
+    # partition_tables adds bill_month to the key of elec_usage on MySQL.
+    monkeypatch.setattr(table_manager, 'partition_years', lambda engine, tablename: [2018])
+    engine = sqlalchemy.create_engine('sqlite://')
+    engine.execute('''CREATE TABLE elec_usage (invoice_id VARCHAR(16), bill_month DATE, billed_khw FLOAT,
+                      PRIMARY KEY (invoice_id, bill_month));''')
+    first = pd.DataFrame({'invoice_id': ['0000000001-0001'], 'bill_month': pd.to_datetime(['2018-01-01']),
+                          'billed_khw': [10.1]})
+    data_to_db(first, 'elec_usage', engine)
+    second = pd.DataFrame({'invoice_id': ['0000000001-0001', '0000000001-0001'],
+                           'bill_month': pd.to_datetime(['2018-01-01', '2018-02-01']),
+                           'billed_khw': [10.1, 20.2]})
+    stats = data_to_db(second, 'elec_usage', engine, skip_existing=True)
+    assert (stats['rows'], stats['skipped']) == (1, 1)
+    result = pd.read_sql(sql='SELECT * FROM elec_usage ORDER BY bill_month;', con=engine)
+    assert list(result['billed_khw']) == [10.1, 20.2]
+
+def test_compact_dtypes_follow_the_ddl_without_losing_values():
+    data = pd.DataFrame({'account_number': ['0000000123', '0000004567'] * 3,
+                         'activity_code': ['A001', 'A002'] * 3,
+                         'install_date': ['2018-01-02'] * 6,
+                         'ert_meter': ['Y', 'N'] * 3,
+                         'ert_number': ['00000001', '00000002', '00000003', '00000004', '00000005', None]})
+    result = compact_dtypes(data, 'ngas_accounts')
+    assert result['account_number'].dtype == 'category'
+    assert result['activity_code'].dtype == 'category'
+    assert result['install_date'].dtype == 'datetime64[ns]'
+    assert result['ert_number'].dtype == 'string'
+    assert result['ert_number'].isna().sum() == 1
+    # Text in a BOOLEAN column is left for the database to reject.
+    assert list(result['ert_meter']) == ['Y', 'N'] * 3
+    assert result['account_number'].astype(object).equals(data['account_number'])
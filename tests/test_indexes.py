@@ -0,0 +1,27 @@
+import sqlalchemy
+from facilities_dataloader.schema import create_table_statement
+from facilities_dataloader.table_manager import create_indexes, indexes_dropped, partition_clause
+
+def test_indexes_dropped_around_load_and_created_again():
+    engine = sqlalchemy.create_engine('sqlite://')
+    engine.execute(create_table_statement('elec_usage', dialect='sqlite'))
+    assert create_indexes(engine) == ['elec_usage_account_number', 'elec_usage_bill_month', 'elec_usage_activity_code']
+    assert create_indexes(engine) == []
+    with indexes_dropped(engine, ['elec_usage']):
+        assert sqlalchemy.inspect(engine).get_indexes('elec_usage') == []
+    assert len(sqlalchemy.inspect(engine).get_indexes('elec_usage')) == 3
+
+def test_partition_clause_by_year():
+    clause = partition_clause('bill_month', 2012, 2013)
+    assert "PARTITION p2013 VALUES LESS THAN ('2014-01-01')" in clause
+    assert clause.endswith('PARTITION pmax VALUES LESS THAN (MAXVALUE)\n)')
+
+def test_indexes_on_missing_columns_skipped():
+    engine = sqlalchemy.create_engine('sqlite://')
+    # As created before activity_code was declared.
+    engine.execute('CREATE TABLE elec_usage (invoice_id VARCHAR(16) PRIMARY KEY, account_number VARCHAR(10), '
+                   'bill_month DATE)')
+    assert create_indexes(engine) == ['elec_usage_account_number', 'elec_usage_bill_month']
+    with indexes_dropped(engine, ['elec_usage']):
+        pass
+    assert len(sqlalchemy.inspect(engine).get_indexes('elec_usage')) == 2
@@ -0,0 +1,34 @@
+import pytest
+import pandas as pd
+from facilities_dataloader import instrument
+from facilities_dataloader.instrument import stage, enable_metrics, read_metrics, summarize
+from facilities_dataloader.natural_gas import clean_natural_gas
+from tests.exports import ngas_export
+
+def test_stage_records_rows_time_and_errors(tmp_path, monkeypatch):
+    monkeypatch.setattr(instrument, 'RECORDS', [])
+    monkeypatch.setattr(instrument, 'METRICS_PATH', None)
+    enable_metrics(str(tmp_path / 'metrics.jsonl'))
+    data = pd.DataFrame({'a': [1, 1, 2]})
+    with stage('dedupe', data, table='t') as record:
+        record['rows_out'] = len(data.drop_duplicates())
+    with pytest.raises(ValueError):
+        with stage('broken', data):
+            raise ValueError('bad value')
+    records = read_metrics(str(tmp_path / 'metrics.jsonl'))
+    assert [r['stage'] for r in records] == ['dedupe', 'broken']
+    assert (records[0]['rows_in'], records[0]['rows_out'], records[0]['table']) == (3, 2, 't')
+    assert records[0]['seconds'] >= 0 and records[0]['peak_rss_mb'] > 0
+    assert records[1]['error'] == 'ValueError: bad value'
+
+def test_clean_natural_gas_records_each_step(tmp_path, monkeypatch):
+    monkeypatch.setattr(instrument, 'RECORDS', [])
+    monkeypatch.setattr(instrument, 'METRICS_PATH', None)
+    clean_natural_gas(ngas_export(5))
+    # Nothing is kept while metrics are off.
+    assert instrument.RECORDS == []
+    enable_metrics(str(tmp_path / 'metrics.jsonl'))
+    data = clean_natural_gas(ngas_export(20))
+    summary = {total['stage']: total for total in summarize(instrument.RECORDS)}
+    assert summary['clean_natural_gas.select_columns']['rows_in'] == 20
+    assert summary['clean_natural_gas.dedupe']['rows_out'] == len(data)
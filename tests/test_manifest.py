@@ -0,0 +1,46 @@
+import pytest
+import sqlalchemy
+import pandas as pd
+from facilities_dataloader.manifest import incremental_data_to_db, row_hashes, loaded_row_hashes
+
+def usage(billed_khw):
+    return pd.DataFrame({'invoice_id': ['0000000001-0001', '0000000002-0002', '0000000003-0003'][:len(billed_khw)],
+                         'bill_month': pd.to_datetime(['2018-01-01', '2018-02-01', '2018-03-01'][:len(billed_khw)]),
+                         'billed_khw': billed_khw})
+
+def load(tmp_path, engine, name, data):
+    filepath = str(tmp_path / name)
+    data.to_csv(filepath, index=False)
+    return incremental_data_to_db(filepath, 'elec_usage', lambda f: pd.read_csv(f, parse_dates=['bill_month']), engine)
+
+def test_identical_file_is_skipped(tmp_path):
+    engine = sqlalchemy.create_engine('sqlite://')
+    assert load(tmp_path, engine, 'january.csv', usage([1.0, 2.0]))['rows'] == 2
+    assert load(tmp_path, engine, 'january_copy.csv', usage([1.0, 2.0])) is None
+
+def test_only_new_or_changed_rows_sent(tmp_path):
+    engine = sqlalchemy.create_engine('sqlite://')
+    load(tmp_path, engine, 'january.csv', usage([1.0, 2.0]))
+    stats = load(tmp_path, engine, 'february.csv', usage([1.0, 5.0, 3.0]))
+    assert stats['rows'] == 2
+    assert (stats['inserted'], stats['updated']) == (1, 1)
+    result = pd.read_sql('SELECT billed_khw FROM elec_usage ORDER BY invoice_id', engine)
+    assert list(result['billed_khw']) == [1.0, 5.0, 3.0]
+    stats = load(tmp_path, engine, 'march.csv', usage([1.0, 5.0, 4.0]))
+    assert stats['rows'] == 1
+
+def test_only_the_manifest_entries_of_incoming_keys_are_read(tmp_path):
+    engine = sqlalchemy.create_engine('sqlite://')
+    load(tmp_path, engine, 'january.csv', usage([1.0, 2.0, 3.0]))
+    hashes = row_hashes(usage([1.0]), 'elec_usage', ['invoice_id'])
+    loaded = loaded_row_hashes(hashes, 'elec_usage', engine)
+    assert list(loaded['key_hash']) == list(hashes['key_hash'])
+
+def test_file_not_recorded_when_its_row_hashes_are_not(tmp_path):
+    engine = sqlalchemy.create_engine('sqlite://')
+    # A manifest that rejects every row hash.
+    engine.execute('''CREATE TABLE load_rows (key_hash BIGINT, tablename VARCHAR(20), row_hash BIGINT CHECK (row_hash = 0),
+                      PRIMARY KEY (key_hash, tablename));''')
+    assert load(tmp_path, engine, 'january.csv', usage([1.0, 2.0]))['rows'] == 2
+    assert pd.read_sql('SELECT COUNT(*) AS files FROM load_files', engine)['files'][0] == 0
+    assert load(tmp_path, engine, 'january.csv', usage([1.0, 2.0])) is not None
@@ -1,7 +1,11 @@
+import math
 import pytest
+import numpy as np
 import pandas as pd
 from facilities_dataloader.helper import read_data, create_mysql_engine, data_to_db
-from facilities_dataloader.natural_gas import preprocess_natural_gas, natural_gas_data_to_db, fix_new_account_nmbr
+from facilities_dataloader.natural_gas import (preprocess_natural_gas, clean_natural_gas, natural_gas_data_to_db,
+                                               fix_new_account_nmbr, clean_ngas_accounts)
+from facilities_dataloader.validation import screen
 
 def test_account_number_split_by_hyphen():
     result = fix_new_account_nmbr('532322315-24')
@@ -18,3 +22,42 @@ def test_account_number_fixed2():
 def test_account_numberfixed3():
     result = fix_new_account_nmbr(0.0)
     assert str(result) == 'nan'
+
+def test_clean_natural_gas_matches_row_wise_implementation():
+    from benchmarks.generators import natural_gas_export
+    from benchmarks.bench_natural_gas import clean_natural_gas_row_wise
+    data = natural_gas_export(2000)
+    result = clean_natural_gas(data.copy())
+    expected = clean_natural_gas_row_wise(data.copy())
+    assert result['address'].dtype == 'category' and result['city'].dtype == 'category'
+    pd.testing.assert_frame_equal(result.astype({'address': object, 'city': object}), expected)
+
+def test_current_account_number_falls_back_on_any_missing_value():
+    data = pd.DataFrame({'ADDRESS': ['1 MAIN ST', '2 MAIN ST'], 'Address 2': np.nan, 'City': 'CHICAGO',
+                         'Account Number': [123, 456], 'New Account Number': ['9-1', np.nan],
+                         'Start Date': ['2018-01-03', '2018-01-03'], 'End Date': ['2018-02-02 08:30', '2018-02-02 00:00'],
+                         'Therms': ['1.5', '-'], 'Utility Amount': [1.0, 2.0], 'Supplier Amount': [0.5, 0.5]})
+    result = clean_natural_gas(data)
+    assert list(result['current_account_number']) == ['0000000009-00001', '0000000000456']
+    assert list(result['bill_month']) == [pd.Timestamp('2018-02-01 08:30'), pd.Timestamp('2018-02-01')]
+    assert math.isnan(result['therms'].iloc[1])
+
+def test_ert_numbers_wider_than_the_ddl_reported_by_screen(tmp_path):
+    # ERT numbers keep their 9 digit padding, which ert_number VARCHAR(8) cannot hold.
+    from benchmarks.generators import ngas_accounts_export
+    accounts = clean_ngas_accounts(ngas_accounts_export(200, 20))
+    assert accounts['ert_number'].dropna().str.len().eq(9).all()
+    result = screen(accounts, 'ngas_accounts', 'accounts.xlsx', directory=str(tmp_path))
+    assert len(result) == accounts['ert_number'].isna().sum()
+    quarantined = pd.read_csv(tmp_path / 'ngas_accounts.csv')
+    assert set(quarantined['reason']) == {'ert_number is longer than 8 characters'}
+
+def test_unparsable_amounts_quarantined_not_fatal(tmp_path):
+    data = pd.DataFrame({'ADDRESS': ['1 MAIN ST', '2 MAIN ST'], 'Address 2': np.nan, 'City': 'CHICAGO',
+                         'Account Number': [123, 456], 'New Account Number': np.nan,
+                         'Start Date': ['2018-01-03', '2018-01-03'], 'End Date': ['2018-02-02', '2018-02-02'],
+                         'Therms': ['1.5', 'see note'], 'Utility Amount': [1.0, 2.0], 'Supplier Amount': [0.5, 0.5]})
+    result = screen(clean_natural_gas(data), 'ngas_usage', 'ngas.csv', directory=str(tmp_path))
+    assert list(result['current_account_number']) == ['0000000000123']
+    quarantined = pd.read_csv(tmp_path / 'ngas_usage.csv')
+    assert list(quarantined['reason']) == ['therms is not a number']
@@ -0,0 +1,48 @@
+import pytest
+import sqlalchemy
+import pandas as pd
+from facilities_dataloader import cache
+from facilities_dataloader.parallel import discover_files, expand_paths, parallel_load, pipeline_load
+
+def export_directory(tmp_path):
+    (tmp_path / 'buildings').mkdir()
+    (tmp_path / 'elec_accounts').mkdir()
+    pd.DataFrame({'activity_code': ['A001', 'A002'], 'address': ['1 MAIN ST', 'NV'],
+                  'zipcode': ['60601', '60602']}).to_csv(tmp_path / 'buildings' / 'buildings.csv', index=False)
+    pd.DataFrame({'account_number': [123, 4567], 'activity_code': ['A001', 'A002']}).to_csv(
+        tmp_path / 'elec_accounts' / '2018-01.csv', index=False)
+    pd.DataFrame({'activity_code': ['A001']}).to_csv(tmp_path / 'elec_accounts' / '2018-02.csv', index=False)
+    (tmp_path / 'elec_accounts' / 'notes.txt').write_text('not an export')
+    return tmp_path
+
+def test_discover_files_by_dataset_subdirectory(tmp_path):
+    files = discover_files(str(export_directory(tmp_path)))
+    assert sorted(files) == ['buildings', 'elec_accounts']
+    assert [f.rsplit('/', 1)[1] for f in files['elec_accounts']] == ['2018-01.csv', '2018-02.csv']
+
+def test_expand_paths_requires_a_match(tmp_path):
+    with pytest.raises(AssertionError):
+        expand_paths(str(tmp_path / '*.xlsx'))
+
+def test_parallel_load_reports_each_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'CACHE_ENABLED', False)
+    files = discover_files(str(export_directory(tmp_path)))
+    engine = sqlalchemy.create_engine('sqlite:///{}'.format(tmp_path / 'facilities.db'))
+    report = parallel_load(files, engine, workers=2)
+    assert [(r['table'], r['status']) for r in report] == [('buildings', 'loaded'),
+                                                          ('elec_accounts', 'loaded'),
+                                                          ('elec_accounts', 'failed')]
+    assert 'account_number' in report[2]['error']
+    accounts = pd.read_sql('SELECT account_number FROM elec_accounts', engine)
+    assert list(accounts['account_number']) == ['0000000123', '0000004567']
+
+def test_pipeline_load_reports_each_file_in_load_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'CACHE_ENABLED', False)
+    files = discover_files(str(export_directory(tmp_path)))
+    engine = sqlalchemy.create_engine('sqlite:///{}'.format(tmp_path / 'facilities.db'))
+    report = pipeline_load(files, engine, depth=1)
+    assert [(r['table'], r['status']) for r in report] == [('buildings', 'loaded'),
+                                                          ('elec_accounts', 'loaded'),
+                                                          ('elec_accounts', 'failed')]
+    assert 'account_number' in report[2]['error']
+    assert pd.read_sql('SELECT COUNT(*) AS n FROM buildings', engine)['n'][0] == 2
@@ -0,0 +1,54 @@
+import pytest
+import sqlalchemy
+import pandas as pd
+from facilities_dataloader.helper import data_to_db
+from facilities_dataloader.schema import create_table_statement
+from facilities_dataloader.query import building_usage, top_consumers, buildings_eui, clear_query_cache, CACHE_STATS
+
+def facilities(engine):
+    pd.DataFrame({'activity_code': ['A001', 'A002', 'A003'], 'building_name': ['LIBRARY', 'FIRE HOUSE', 'GARAGE'],
+                  'address': ['1 MAIN ST', '2 MAIN ST', '3 MAIN ST'], 'ward': [1, 1, 2],
+                  'engineer_zone': [4, 5, 4], 'square_footage': [1000, 500, 0]}).to_sql('buildings', engine, index=False)
+    engine.execute(create_table_statement('building_energy_monthly', dialect='sqlite'))
+    pd.DataFrame({'activity_code': ['A001', 'A001', 'A002', 'A003'],
+                  'bill_month': ['2018-01-01', '2018-02-01', '2018-01-01', '2018-01-01'],
+                  'kwh': [100.0, 200.0, 50.0, 10.0],
+                  'kbtu': [1000.0, 2000.0, 1500.0, 10.0]}).to_sql('building_energy_monthly', engine, index=False,
+                                                                  if_exists='append')
+
+@pytest.fixture
+def engine():
+    clear_query_cache()
+    engine = sqlalchemy.create_engine('sqlite://')
+    facilities(engine)
+    return engine
+
+def test_building_usage_over_months(engine):
+    usage = building_usage('A001', '2018-01', '2018-02-15', engine=engine)
+    assert list(usage['kwh']) == [100.0, 200.0]
+    assert usage['bill_month'].dtype == 'datetime64[ns]'
+    assert building_usage('A001', '2018-02', '2018-02', engine=engine)['kwh'].tolist() == [200.0]
+
+def test_top_consumers_of_a_month(engine):
+    top = top_consumers('2018-01', n=2, engine=engine)
+    assert list(top['activity_code']) == ['A002', 'A001']
+    assert top['building_name'].iloc[0] == 'FIRE HOUSE'
+    with pytest.raises(AssertionError):
+        top_consumers('2018-01', by='kbtu; DROP TABLE buildings', engine=engine)
+
+def test_buildings_eui_by_ward(engine):
+    eui = buildings_eui('2018-01', '2018-12', ward=1, engine=engine)
+    assert list(eui['activity_code']) == ['A001', 'A002']
+    assert list(eui['eui']) == [3.0, 3.0]
+    assert pd.isna(buildings_eui('2018-01', '2018-12', engineer_zone=4, engine=engine)['eui'].iloc[1])
+
+def test_cached_until_the_table_is_written(engine):
+    building_usage('A001', '2018-01', '2018-03', engine=engine)
+    usage = building_usage('A001', '2018-01', '2018-03', engine=engine)
+    usage.loc[0, 'kwh'] = -1
+    assert CACHE_STATS == {'hits': 1, 'misses': 1}
+    assert building_usage('A001', '2018-01', '2018-03', engine=engine)['kwh'].tolist() == [100.0, 200.0]
+    data_to_db(pd.DataFrame({'activity_code': ['A001'], 'bill_month': ['2018-03-01'], 'kwh': [300.0]}),
+               'building_energy_monthly', engine)
+    assert building_usage('A001', '2018-01', '2018-03', engine=engine)['kwh'].tolist() == [100.0, 200.0, 300.0]
+    assert CACHE_STATS == {'hits': 2, 'misses': 2}
@@ -0,0 +1,66 @@
+import pytest
+import sqlalchemy
+import pandas as pd
+from facilities_dataloader.rollups import touched_months, refresh_rollups, rebuild_rollups, refresh_after_load
+
+def facilities(engine):
+    pd.DataFrame({'activity_code': ['A001', 'A002'], 'square_footage': [1000, 0]}).to_sql('buildings', engine, index=False)
+    pd.DataFrame({'account_number': ['0000000001', '0000000002'],
+                  'activity_code': ['A001', 'A002']}).to_sql('elec_accounts', engine, index=False)
+    # One account with two meters.
+    pd.DataFrame({'account_number': ['0000000000003', '0000000000003'], 'activity_code': ['A001', 'A001'],
+                  'meter_number': ['1', '2']}).to_sql('ngas_accounts', engine, index=False)
+    pd.DataFrame({'invoice_id': ['1-1', '1-2', '2-1', '1-3'],
+                  'account_number': ['0000000001', '0000000001', '0000000002', '0000000001'],
+                  'bill_month': pd.to_datetime(['2018-01-01', '2018-01-01', '2018-01-01', '2018-02-01']),
+                  'billed_khw': [100.0, 50.0, 10.0, 200.0],
+                  'peak_kw': [5.0, 7.0, 1.0, 9.0],
+                  'total_charges': [10.0, 5.0, 1.0, 20.0]}).to_sql('elec_usage', engine, index=False)
+    # The second account is only listed under its new number.
+    pd.DataFrame({'account_number': ['0000000000003', '0000000000004'],
+                  'current_account_number': ['0000000000003', '0000000000003'],
+                  'bill_month': pd.to_datetime(['2018-01-01', '2018-01-01']),
+                  'therms': [2.0, 1.0],
+                  'total_amount': [3.0, 1.0]}).to_sql('ngas_usage', engine, index=False)
+
+def rollup(engine):
+    return pd.read_sql('SELECT * FROM building_energy_monthly ORDER BY activity_code, bill_month', engine)
+
+def test_touched_months_first_day_of_each_month():
+    data = pd.DataFrame({'bill_month': ['2018-02-01', '2018-01-01', '2018-02-01', None]})
+    assert touched_months(data) == [pd.Timestamp('2018-01-01'), pd.Timestamp('2018-02-01')]
+
+def test_rebuild_rollups_per_building_and_month():
+    engine = sqlalchemy.create_engine('sqlite://')
+    facilities(engine)
+    assert rebuild_rollups(engine) == 3
+    result = rollup(engine)
+    assert list(result['bill_month']) == ['2018-01-01', '2018-02-01', '2018-01-01']
+    january = result.iloc[0]
+    assert (january['kwh'], january['peak_kw'], january['elec_charges']) == (150.0, 7.0, 15.0)
+    assert (january['therms'], january['ngas_charges']) == (3.0, 4.0)
+    assert january['kbtu'] == pytest.approx(150 * 3.412 + 300)
+    assert january['eui'] == pytest.approx((150 * 3.412 + 300) / 1000)
+    # No square footage, no intensity.
+    assert pd.isna(result.iloc[2]['eui'])
+
+def test_refresh_only_recomputes_touched_months():
+    engine = sqlalchemy.create_engine('sqlite://')
+    facilities(engine)
+    rebuild_rollups(engine)
+    engine.execute("UPDATE building_energy_monthly SET kwh = -1 WHERE bill_month = '2018-02-01'")
+    march = pd.DataFrame({'invoice_id': ['1-4'], 'account_number': ['0000000001'],
+                          'bill_month': pd.to_datetime(['2018-03-01']), 'billed_khw': [300.0],
+                          'peak_kw': [3.0], 'total_charges': [30.0]})
+    march.to_sql('elec_usage', engine, index=False, if_exists='append')
+    assert refresh_after_load(engine, 'elec_usage', march) == 1
+    result = rollup(engine).set_index(['activity_code', 'bill_month'])
+    assert result.loc[('A001', '2018-03-01'), 'kwh'] == 300.0
+    assert result.loc[('A001', '2018-02-01'), 'kwh'] == -1
+    assert len(result) == 4
+
+def test_refresh_waits_for_usage_and_accounts_tables():
+    engine = sqlalchemy.create_engine('sqlite://')
+    pd.DataFrame({'account_number': ['0000000001'], 'activity_code': ['A001']}).to_sql('elec_accounts', engine, index=False)
+    assert refresh_rollups(engine) is None
+    assert sqlalchemy.inspect(engine).get_table_names() == ['elec_accounts']
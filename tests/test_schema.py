@@ -0,0 +1,43 @@
+import pytest
+from facilities_dataloader.schema import (read_schema, primary_key, column_types, secondary_indexes, split_statements,
+                                          table_dtypes, sqlalchemy_types, read_dtypes, SOURCE_COLUMNS)
+
+def test_inline_primary_key_parsed():
+    assert primary_key('elec_usage') == ['invoice_id']
+
+def test_composite_primary_key_parsed():
+    assert primary_key('ngas_usage') == ['current_account_number', 'service_period_start', 'utility_amount', 'address']
+
+def test_enum_columns_not_split_on_commas():
+    columns = read_schema()['buildings']['columns']
+    assert columns['debris'] == "enum('Yes','No')"
+    assert len(columns) == 60
+
+def test_column_types_strip_lengths():
+    assert column_types('elec_usage')['invoice_id'] == 'VARCHAR'
+
+def test_secondary_indexes_parsed():
+    assert secondary_indexes('elec_usage')['elec_usage_bill_month'] == ['bill_month']
+    assert secondary_indexes('elec_usage')['elec_usage_account_number'] == ['account_number', 'bill_month']
+    assert secondary_indexes('buildings') == {}
+
+def test_split_statements_ignores_quoted_and_commented_semicolons():
+    sql = """-- a comment; with a semicolon
+CREATE TABLE t (note VARCHAR(10) DEFAULT 'a;b', `odd;name` INT); /* c; d */
+INSERT INTO t VALUES ('it''s;', 1);;
+# trailing; comment
+"""
+    statements = split_statements(sql)
+    assert len(statements) == 2
+    assert statements[0].startswith("CREATE TABLE t (note VARCHAR(10) DEFAULT 'a;b', `odd;name` INT)")
+    assert statements[1] == "INSERT INTO t VALUES ('it''s;', 1)"
+
+def test_type_registry_from_ddl():
+    assert table_dtypes('elec_usage')['billed_khw'] == 'float32'
+    assert table_dtypes('buildings')['ward'] == 'Int16'
+    types = sqlalchemy_types('buildings')
+    assert types['address'].length == 70
+    assert types['debris'].enums == ['Yes', 'No']
+    # Ids are read as text so they keep their leading zeros.
+    assert read_dtypes('elec_usage', SOURCE_COLUMNS['elec_usage'])['UDCACCTID'] == str
+    assert 'BILLEDKWH' not in read_dtypes('elec_usage', SOURCE_COLUMNS['elec_usage'])
@@ -0,0 +1,23 @@
+import sqlalchemy
+from facilities_dataloader.table_manager import execute_sql_files
+
+def test_sql_files_applied_once_per_version(tmp_path):
+    engine = sqlalchemy.create_engine('sqlite://')
+    (tmp_path / 'create_a.sql').write_text('CREATE TABLE a (x INT);\nCREATE TABLE b (y INT);\n')
+    (tmp_path / 'create_c.sql').write_text("CREATE TABLE c (z VARCHAR(3) DEFAULT ';');")
+    files = ['create_a.sql', 'create_c.sql']
+    assert execute_sql_files(engine, str(tmp_path), files) == files
+    assert execute_sql_files(engine, str(tmp_path), files) == []
+    (tmp_path / 'create_c.sql').write_text('CREATE TABLE IF NOT EXISTS c (z INT);\nCREATE TABLE d (w INT);')
+    assert execute_sql_files(engine, str(tmp_path), files) == ['create_c.sql']
+    assert set(sqlalchemy.inspect(engine).get_table_names()) == {'a', 'b', 'c', 'd', 'schema_version'}
+
+def test_files_declaring_missing_columns_not_recorded(tmp_path):
+    engine = sqlalchemy.create_engine('sqlite://')
+    (tmp_path / 'create_a.sql').write_text('CREATE TABLE IF NOT EXISTS a (x INT);')
+    assert execute_sql_files(engine, str(tmp_path), ['create_a.sql']) == ['create_a.sql']
+    (tmp_path / 'create_a.sql').write_text('CREATE TABLE IF NOT EXISTS a (x INT, y CHAR(4));')
+    assert execute_sql_files(engine, str(tmp_path), ['create_a.sql']) == []
+    assert execute_sql_files(engine, str(tmp_path), ['create_a.sql']) == []
+    engine.execute('ALTER TABLE a ADD COLUMN y CHAR(4)')
+    assert execute_sql_files(engine, str(tmp_path), ['create_a.sql']) == ['create_a.sql']
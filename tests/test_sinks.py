@@ -0,0 +1,42 @@
+import os
+import pytest
+import sqlalchemy
+import pandas as pd
+from facilities_dataloader.helper import data_to_db
+from facilities_dataloader.sinks import open_sink, parquet_sink, read_parquet, write_parquet
+
+def elec_usage():
+    return pd.DataFrame({'invoice_id': ['1-1', '1-2', '2-1'],
+                         'account_number': ['0000000001', '0000000001', '0000000002'],
+                         'bill_month': pd.to_datetime(['2018-01-01', '2018-02-01', '2018-02-01']),
+                         'billed_khw': [100.0, 50.0, 10.0],
+                         'rebill': ['N', 'N', 'Y']})
+
+def test_parquet_typed_from_ddl_and_partitioned_by_month(tmp_path):
+    sink = parquet_sink(str(tmp_path))
+    write_parquet(elec_usage(), 'elec_usage', sink)
+    assert sorted(os.listdir(tmp_path / 'elec_usage')) == ['bill_month=2018-01-01', 'bill_month=2018-02-01']
+    data = read_parquet(sink, 'elec_usage')
+    assert len(data) == 3
+    assert data['billed_khw'].dtype == 'float32'
+    # Declared columns the rows did not have are written as nulls.
+    assert data['peak_kw'].isna().all()
+    february = read_parquet(sink, 'elec_usage', ['invoice_id'], start='2018-02-01', end='2018-03-01')
+    assert sorted(february['invoice_id']) == ['1-2', '2-1']
+
+def test_data_to_db_appends_only_new_rows_to_parquet(tmp_path):
+    sink = parquet_sink(str(tmp_path))
+    assert data_to_db(elec_usage().head(2), 'elec_usage', sink, skip_existing=True)['rows'] == 2
+    stats = data_to_db(elec_usage(), 'elec_usage', sink, skip_existing=True)
+    assert (stats['rows'], stats['skipped']) == (1, 2)
+    assert sorted(read_parquet(sink, 'elec_usage')['invoice_id']) == ['1-1', '1-2', '2-1']
+    with pytest.raises(AssertionError):
+        data_to_db(elec_usage(), 'elec_usage', sink, method='upsert')
+
+def test_sqlite_sink_creates_declared_tables(tmp_path):
+    engine = open_sink('sqlite:{}'.format(tmp_path / 'facilities.db'))
+    columns = {column['name']: str(column['type']) for column in sqlalchemy.inspect(engine).get_columns('elec_usage')}
+    assert columns['billed_khw'] == 'FLOAT'
+    assert data_to_db(elec_usage(), 'elec_usage', engine)['rows'] == 3
+    with pytest.raises(AssertionError):
+        open_sink('csv:{}'.format(tmp_path))
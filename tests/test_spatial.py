@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import sqlalchemy
+from facilities_dataloader import cache
+from facilities_dataloader.spatial import (build_index, within_radius, nearest, match_nearest, match_addresses,
+                                           haversine_km, building_index, save_building_index, index_path)
+
+def buildings(count=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'activity_code': ['B{:04d}'.format(i) for i in range(count)],
+                         'latitude': rng.uniform(41.65, 42.02, count),
+                         'longitude': rng.uniform(-87.94, -87.52, count)})
+
+def test_radius_and_nearest_match_brute_force():
+    data = buildings()
+    index = build_index(data)
+    distances = haversine_km(41.88, -87.63, data['latitude'].to_numpy(), data['longitude'].to_numpy())
+    found = within_radius(index, 41.88, -87.63, 1.5)
+    assert sorted(found['activity_code']) == sorted(data['activity_code'][distances <= 1.5])
+    assert found['distance_km'].is_monotonic_increasing
+    closest = nearest(index, 41.88, -87.63, k=3)
+    assert list(closest['activity_code']) == list(data['activity_code'].iloc[np.argsort(distances)[:3]])
+
+def test_batch_match_nearest_building():
+    data = buildings()
+    index = build_index(data)
+    rng = np.random.default_rng(1)
+    latitudes = np.append(rng.uniform(41.5, 42.2, 3000), [np.nan, -33.9])
+    longitudes = np.append(rng.uniform(-88.1, -87.4, 3000), [-87.6, 151.2])
+    matches = match_nearest(index, latitudes, longitudes)
+    distances = haversine_km(latitudes[:, None], longitudes[:, None],
+                             data['latitude'].to_numpy(), data['longitude'].to_numpy())
+    expected = data['activity_code'].to_numpy()[np.nanargmin(np.nan_to_num(distances, nan=np.inf), axis=1)]
+    assert (matches['activity_code'][:3000] == expected[:3000]).all()
+    assert matches['activity_code'].iloc[-1] == expected[-1]
+    assert pd.isna(matches['activity_code'].iloc[-2])
+    assert pd.isna(match_nearest(index, latitudes, longitudes, max_km=1)['activity_code'].iloc[-1])
+
+def test_addresses_matched_on_normalized_text():
+    known = pd.DataFrame({'activity_code': ['A001', 'A002'], 'address': ['123 N STATE ST', '9 W MADISON AVE']})
+    addresses = pd.Series(['123 North State Street.', '9  west madison avenue', '1 Elm St', None])
+    assert list(match_addresses(addresses, known)) == ['A001', 'A002', np.nan, np.nan]
+
+def test_index_persisted_per_database(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'CACHE_DIRECTORY', str(tmp_path / 'cache'))
+    engine = sqlalchemy.create_engine('sqlite:///{}'.format(tmp_path / 'facilities.db'))
+    buildings(50).to_sql('buildings', engine, index=False)
+    save_building_index(engine)
+    engine.execute('DELETE FROM buildings')
+    index = building_index(engine)
+    assert len(index['activity_code']) == 50
+    save_building_index(engine)
+    assert not (tmp_path / 'cache' / index_path(engine).rsplit('/', 1)[1]).exists()
@@ -0,0 +1,62 @@
+import pytest
+import sqlalchemy
+import pandas as pd
+from facilities_dataloader import cache
+from facilities_dataloader.staging import create_shadow_table, swap_tables, reload_tables
+from facilities_dataloader.accounts import account_index
+from facilities_dataloader.schema import create_table_statement
+
+def accounts_file(tmp_path, name, numbers):
+    (tmp_path / 'elec_accounts').mkdir(exist_ok=True)
+    filepath = tmp_path / 'elec_accounts' / name
+    pd.DataFrame({'account_number': numbers, 'activity_code': 'A001'}).to_csv(filepath, index=False)
+    return str(filepath)
+
+def accounts(engine):
+    return list(pd.read_sql('SELECT account_number FROM elec_accounts ORDER BY account_number', engine)['account_number'])
+
+def test_swap_replaces_live_table(tmp_path):
+    engine = sqlalchemy.create_engine('sqlite:///{}'.format(tmp_path / 'facilities.db'))
+    pd.DataFrame({'account_number': ['old'], 'activity_code': ['A001']}).to_sql('elec_accounts', engine, index=False)
+    shadow = create_shadow_table('elec_accounts', engine)
+    pd.DataFrame({'account_number': ['new'], 'activity_code': ['A001']}).to_sql(shadow, engine, index=False, if_exists='append')
+    swap_tables(['elec_accounts'], engine)
+    assert accounts(engine) == ['new']
+    assert sorted(sqlalchemy.inspect(engine).get_table_names()) == ['elec_accounts']
+
+def test_reload_keeps_live_table_when_a_file_fails(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'CACHE_ENABLED', False)
+    monkeypatch.setattr(cache, 'CACHE_DIRECTORY', str(tmp_path / 'cache'))
+    engine = sqlalchemy.create_engine('sqlite:///{}'.format(tmp_path / 'facilities.db'))
+    reload_tables({'elec_accounts': [accounts_file(tmp_path, 'a.csv', [1, 2])]}, engine)
+    assert accounts(engine) == ['0000000001', '0000000002']
+    # The second file repeats a primary key, so the reload is abandoned.
+    files = {'elec_accounts': [accounts_file(tmp_path, 'b.csv', [3]), accounts_file(tmp_path, 'c.csv', [3])]}
+    report = reload_tables(files, engine)
+    assert [result['status'] for result in report] == ['loaded', 'failed']
+    assert accounts(engine) == ['0000000001', '0000000002']
+    assert sorted(sqlalchemy.inspect(engine).get_table_names()) == ['elec_accounts']
+
+def test_swap_indexes_new_table(tmp_path):
+    engine = sqlalchemy.create_engine('sqlite:///{}'.format(tmp_path / 'facilities.db'))
+    for _ in range(2):
+        create_shadow_table('elec_accounts', engine)
+        swap_tables(['elec_accounts'], engine)
+    indexes = sqlalchemy.inspect(engine).get_indexes('elec_accounts')
+    assert [index['name'] for index in indexes] == ['elec_accounts_activity_code']
+
+def test_reload_restamps_usage_from_reloaded_accounts(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'CACHE_ENABLED', False)
+    monkeypatch.setattr(cache, 'CACHE_DIRECTORY', str(tmp_path / 'cache'))
+    engine = sqlalchemy.create_engine('sqlite:///{}'.format(tmp_path / 'facilities.db'))
+    reload_tables({'elec_accounts': [accounts_file(tmp_path, 'a.csv', [1, 2])]}, engine)
+    engine.execute(create_table_statement('elec_usage', dialect='sqlite'))
+    pd.DataFrame({'invoice_id': ['1-1', '2-1'], 'account_number': ['0000000001', '0000000002'],
+                  'bill_month': '2018-01-01', 'billed_khw': 1.0, 'activity_code': ['A001', 'A001']}).to_sql(
+        'elec_usage', engine, index=False, if_exists='append')
+    filepath = tmp_path / 'elec_accounts' / 'b.csv'
+    pd.DataFrame({'account_number': [1], 'activity_code': ['A002']}).to_csv(filepath, index=False)
+    reload_tables({'elec_accounts': [str(filepath)]}, engine)
+    assert account_index(engine, 'elec_accounts').to_dict() == {'0000000001': 'A002'}
+    stored = pd.read_sql('SELECT activity_code FROM elec_usage ORDER BY invoice_id', engine)
+    assert list(stored['activity_code'].fillna('')) == ['A002', '']
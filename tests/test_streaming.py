@@ -0,0 +1,80 @@
+import pytest
+import sqlalchemy
+import numpy as np
+import pandas as pd
+from facilities_dataloader.streaming import drop_seen_rows, remember_hashes, seen_before, stream_data_to_db, pipeline
+from facilities_dataloader.natural_gas import clean_natural_gas
+from tests.exports import ngas_export
+
+def test_drop_seen_rows_across_chunks():
+    first = pd.DataFrame({'invoice_id': ['a', 'b', 'a'], 'billed_khw': [1.0, 2.0, 1.0]})
+    second = pd.DataFrame({'invoice_id': ['b', 'c'], 'billed_khw': [2.0, 3.0]})
+    seen = []
+    kept, seen = drop_seen_rows(first, 'elec_usage', seen)
+    assert list(kept['invoice_id']) == ['a', 'b']
+    kept, seen = drop_seen_rows(second, 'elec_usage', seen)
+    assert list(kept['invoice_id']) == ['c']
+    assert sum(len(run) for run in seen) == 3
+
+def test_seen_hashes_kept_in_few_sorted_runs():
+    rng = np.random.default_rng(0)
+    hashes = rng.integers(0, 2**63, 10000, dtype=np.uint64)
+    seen = []
+    for chunk in np.array_split(hashes, 100):
+        remember_hashes(seen, chunk)
+    assert len(seen) <= 14
+    assert all((np.diff(run.astype(np.float64)) >= 0).all() for run in seen)
+    assert seen_before(seen, hashes).all()
+    assert not seen_before(seen, np.setdiff1d(rng.integers(0, 2**63, 100, dtype=np.uint64), hashes)).any()
+
+def test_duplicates_across_chunks_not_counted_as_in_the_table(tmp_path):
+    filepath = str(tmp_path / 'ngas.csv')
+    # The second half of the file repeats the first.
+    pd.concat([ngas_export(30), ngas_export(30)]).to_csv(filepath, index=False)
+    engine = sqlalchemy.create_engine('sqlite://')
+    totals = stream_data_to_db(filepath, 'other', clean_natural_gas, 'ngas_usage', engine, rows=30)
+    assert totals['loaded'] == totals['duplicates'] == len(clean_natural_gas(ngas_export(30)))
+    assert totals['skipped'] == totals['failed'] == 0
+
+def test_streamed_load_matches_batch_preprocessing(tmp_path):
+    filepath = str(tmp_path / 'ngas.csv')
+    ngas_export(100).to_csv(filepath, index=False)
+    engine = sqlalchemy.create_engine('sqlite://')
+    totals = stream_data_to_db(filepath, 'other', clean_natural_gas, 'ngas_usage', engine, rows=15)
+    expected = clean_natural_gas(pd.read_csv(filepath, dtype={'account_no': str}))
+    assert totals['loaded'] == len(expected)
+    assert totals['failed'] == 0
+
+def test_pipeline_reads_ahead_at_most_depth_items():
+    read, written = [], []
+    def items():
+        for i in range(10):
+            read.append(i)
+            yield i
+    def write(item):
+        # Never more than the queue, the item being written and the one read next.
+        assert len(read) - len(written) <= 2 + 2
+        written.append(item)
+        return item * 2
+    assert pipeline(items(), write, depth=2) == [i * 2 for i in range(10)]
+    assert written == list(range(10))
+
+def test_pipeline_raises_errors_of_either_side():
+    def items():
+        yield 1
+        raise ValueError('bad chunk')
+    with pytest.raises(ValueError):
+        pipeline(items(), lambda item: item)
+    with pytest.raises(ZeroDivisionError):
+        pipeline(iter(range(100)), lambda item: 1 / 0)
+
+def test_pipelined_stream_loads_the_same_rows(tmp_path):
+    filepath = str(tmp_path / 'ngas.csv')
+    ngas_export(100).to_csv(filepath, index=False)
+    # Writes happen in another thread, which would get its own in-memory database.
+    sequential = sqlalchemy.create_engine('sqlite:///{}'.format(tmp_path / 'sequential.db'))
+    pipelined = sqlalchemy.create_engine('sqlite:///{}'.format(tmp_path / 'pipelined.db'))
+    expected = stream_data_to_db(filepath, 'other', clean_natural_gas, 'ngas_usage', sequential, rows=15)
+    assert stream_data_to_db(filepath, 'other', clean_natural_gas, 'ngas_usage', pipelined, rows=15, depth=2) == expected
+    query = 'SELECT * FROM ngas_usage ORDER BY current_account_number, service_period_start, utility_amount, address'
+    pd.testing.assert_frame_equal(pd.read_sql(query, pipelined), pd.read_sql(query, sequential))
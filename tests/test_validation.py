@@ -0,0 +1,54 @@
+import pytest
+import numpy as np
+import pandas as pd
+from facilities_dataloader import validation
+from facilities_dataloader.validation import validate, screen, requires
+from facilities_dataloader.electricity import clean_electricity
+from benchmarks.generators import electricity_export
+
+def test_validate_reports_every_broken_rule():
+    data = pd.DataFrame({'invoice_id': ['0123456789-0001', '0123456789-0001', '0123456789-0002', None, '12-3'],
+                         'account_number': ['0123456789', '0123456789', '123', '0123456789', '0123456789'],
+                         'billed_khw': [1.0, 2.0, 'lots', 3.0, 4.0],
+                         'service_period_start': pd.to_datetime(['2018-01-01'] * 4 + ['2018-03-01']),
+                         'service_period_stop': pd.to_datetime(['2018-02-01'] * 5)})
+    good, bad = validate(data, 'elec_usage')
+    assert good.empty
+    assert 'duplicate of another row or of the key invoice_id' in bad.loc[0, 'reason']
+    assert bad.loc[2, 'reason'] == 'billed_khw is not a number; account_number is not a 10 digit account number'
+    assert bad.loc[3, 'reason'] == 'invoice_id is missing'
+    assert 'invoice_id is not an invoice id' in bad.loc[4, 'reason']
+    assert 'service_period_start is after service_period_stop' in bad.loc[4, 'reason']
+
+def test_bad_invoice_is_quarantined_and_the_rest_kept(tmp_path):
+    export = electricity_export(50)
+    export.loc[3, 'INVOICEID'] = '12345678901234-1'
+    export.loc[3, 'Discard?'] = None
+    data = clean_electricity(export)
+    good = screen(data, 'elec_usage', 'elec.csv', directory=str(tmp_path))
+    assert len(good) == len(data) - 1
+    quarantined = pd.read_csv(tmp_path / 'elec_usage.csv')
+    assert list(quarantined['invoice_id']) == ['12345678901234-1']
+    assert quarantined.loc[0, 'source'] == 'elec.csv'
+    assert quarantined.loc[0, 'reason'] == 'invoice_id is not an invoice id like 0123456789-0123'
+
+def test_quarantine_starts_a_new_file_when_the_columns_change(tmp_path):
+    first = pd.DataFrame({'invoice_id': ['12-3'], 'account_number': ['0123456789']})
+    screen(first, 'elec_usage', 'first.csv', directory=str(tmp_path))
+    second = pd.DataFrame({'invoice_id': ['45-6'], 'rebill': ['Y'], 'account_number': ['0123456789']})
+    screen(second, 'elec_usage', 'second.csv', directory=str(tmp_path))
+    files = sorted(path.name for path in tmp_path.iterdir())
+    assert len(files) == 2 and files[0].startswith('elec_usage-') and files[1] == 'elec_usage.csv'
+    assert list(pd.read_csv(tmp_path / files[0])['source']) == ['first.csv']
+    quarantined = pd.read_csv(tmp_path / 'elec_usage.csv')
+    assert list(quarantined['rebill']) == ['Y'] and list(quarantined['source']) == ['second.csv']
+
+def test_rules_skip_missing_columns_but_raise_their_own_errors(monkeypatch):
+    data = pd.DataFrame({'invoice_id': ['0123456789-0001']})
+    good, bad = validate(data, 'elec_usage')
+    assert len(good) == 1 and bad.empty
+    def broken(data):
+        return 'broken', data['no such column']
+    monkeypatch.setitem(validation.RULES, 'elec_usage', [requires(['invoice_id'], broken)])
+    with pytest.raises(KeyError):
+        validate(data, 'elec_usage')